@@ -21,6 +21,7 @@ from snf_django.lib.api import faults, utils, api_method
 from django.core.cache import cache
 
 from astakos.im import settings
+from astakos.im import token_cache
 from astakos.im.models import Service, AstakosUser, ProjectMembership, Project
 from astakos.oa2.backends.base import OA2Error
 from astakos.oa2.backends.djangobackend import DjangoBackend
@@ -60,6 +61,42 @@ def get_endpoints():
     return result
 
 
+def compute_access(token_id):
+    try:
+        user = AstakosUser.objects.get(auth_token=token_id)
+    except AstakosUser.DoesNotExist:
+        raise faults.Unauthorized('Invalid token')
+
+    validate_user(user)
+
+    user_projects = user.project_set.filter(
+        projectmembership__state__in=ProjectMembership.ACTUALLY_ACCEPTED,
+        state=Project.NORMAL).values_list("uuid", flat=True)
+
+    access = {}
+    access["token"] = {
+        "id": user.auth_token,
+        "expires": utils.isoformat(user.auth_token_expires),
+        "tenant": {"id": user.default_project, "name": user.realname}}
+    access["user"] = {
+        "id": user.uuid, 'name': user.realname,
+        "roles": [dict(id=str(g['id']), name=g['name']) for g in
+                  user.groups.values('id', 'name')],
+        "roles_links": [],
+        "projects": list(user_projects),
+        }
+    return access, user.auth_token_expires
+
+
+def get_access(token_id):
+    """Return the token and user part of the response for the token."""
+    access = token_cache.get_access(token_id)
+    if access is None:
+        access, expires = compute_access(token_id)
+        token_cache.set_access(token_id, access, expires)
+    return access
+
+
 @csrf_exempt
 @api_method(http_method="POST", token_required=False, user_required=False,
             logger=logger)
@@ -91,36 +128,18 @@ def authenticate(request):
         if token_id is None:
             raise faults.BadRequest('Malformed request: missing token')
 
-        try:
-            user = AstakosUser.objects.get(auth_token=token_id)
-        except AstakosUser.DoesNotExist:
-            raise faults.Unauthorized('Invalid token')
-
-        validate_user(user)
+        access = get_access(token_id)
+        user_uuid = access["user"]["id"]
 
         if uuid is not None:
-            if user.uuid != uuid:
+            if user_uuid != uuid:
                 raise faults.Unauthorized('Invalid credentials')
 
         if tenant:
-            if user.uuid != tenant:
+            if user_uuid != tenant:
                 raise faults.BadRequest('Not conforming tenantName')
 
-        user_projects = user.project_set.filter(
-            projectmembership__state__in=ProjectMembership.ACTUALLY_ACCEPTED,
-            state=Project.NORMAL).values_list("uuid", flat=True)
-
-        d["access"]["token"] = {
-            "id": user.auth_token,
-            "expires": utils.isoformat(user.auth_token_expires),
-            "tenant": {"id": user.default_project, "name": user.realname}}
-        d["access"]["user"] = {
-            "id": user.uuid, 'name': user.realname,
-            "roles": [dict(id=str(g['id']), name=g['name']) for g in
-                      user.groups.values('id', 'name')],
-            "roles_links": [],
-            "projects": list(user_projects),
-            }
+        d["access"].update(access)
 
     d["access"]["serviceCatalog"] = get_endpoints()
 
@@ -19,6 +19,7 @@ import logging
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import uuid
+from contextlib import contextmanager
 
 from django.utils.translation import ugettext as _
 from django.db.models import Q
@@ -28,7 +29,7 @@ from snf_django.lib.api import faults
 
 import synnefo.util.date as date_util
 from astakos.im.models import AstakosUser, ProjectMembership, \
-    ProjectApplication, Project, new_chain, Resource, ProjectLock, \
+    ProjectApplication, Project, new_chain, Resource, \
     create_project, ProjectResourceQuota, ProjectResourceGrant
 from astakos.im import settings
 from astakos.im import quotas
@@ -116,8 +117,31 @@ def get_project_of_application_for_update(app_id):
     return get_project_for_update(app.chain_id)
 
 
-def get_project_lock():
-    ProjectLock.objects.select_for_update().get(pk=1)
+def get_projects_for_update(projects):
+    """Lock the given projects, always in the same order.
+
+    Operations that modify more than one project lock them through this
+    function, so that they cannot deadlock with each other. The queryset
+    is evaluated here, so that the locks are taken before any update.
+    """
+    projects = projects.select_for_update().order_by("id")
+    list(projects)
+    return projects
+
+
+@contextmanager
+def project_name_conflict(name):
+    """Report a concurrent claim of a project name as a conflict.
+
+    Project names are unique in the database; a project that gets the name
+    of another one being activated at the same time fails on the unique
+    constraint instead of check_conflicting_projects().
+    """
+    try:
+        yield
+    except IntegrityError:
+        m = _("project with name '%s' already exists") % name
+        raise ProjectConflict(m)
 
 
 def get_application(application_id):
@@ -659,7 +683,8 @@ def modify_project(project_id, request):
         check_conflicting_projects(project, new_name)
         project.realname = new_name
         project.name = new_name
-        project.save()
+        with project_name_conflict(new_name):
+            project.save()
 
     _modify_projects(Project.objects.filter(id=project.id), request)
 
@@ -670,7 +695,7 @@ def modify_projects_in_bulk(flt, request):
         raise ProjectBadRequest("Cannot modify field(s) '%s' in bulk" %
                                 ", ".join(map(unicode, main_fields)))
 
-    projects = Project.objects.initialized(flt).select_for_update()
+    projects = get_projects_for_update(Project.objects.initialized(flt))
     _modify_projects(projects, request)
 
 
@@ -1018,7 +1043,6 @@ def check_conflicting_projects(project, new_project_name, silent=False):
 
 def approve_application(application_id, project_id=None, request_user=None,
                         reason=""):
-    get_project_lock()
     project = get_project_of_application_for_update(application_id)
     application = get_application(application_id)
     check_app_relevant(application, project, project_id)
@@ -1040,7 +1064,8 @@ def approve_application(application_id, project_id=None, request_user=None,
         _fill_from_skeleton(project)
     else:
         _apply_modifications(project, application)
-    project.activate(actor=request_user, reason=reason)
+    with project_name_conflict(project.realname):
+        project.activate(actor=request_user, reason=reason)
 
     quotas.qh_sync_project(project)
     if QUOTA_POLICY:
@@ -1231,7 +1256,8 @@ def _perform_action_project(project_id, action, request_user, reason):
     }
 
     validate_project_action(project, action, request_user, silent=False)
-    action_methods[action](actor=request_user, reason=reason)
+    with project_name_conflict(project.realname):
+        action_methods[action](actor=request_user, reason=reason)
     quotas.qh_sync_project(project)
     if QUOTA_POLICY:
         QUOTA_POLICY.check_state_projects([project], action)
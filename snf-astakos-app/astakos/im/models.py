@@ -28,7 +28,8 @@ from django.db import models
 from astakos.im import transaction
 from django.contrib.auth.models import User, UserManager, Group, Permission
 from django.utils.translation import ugettext as _
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import (pre_save, post_save, post_delete,
+                                      m2m_changed)
 from django.contrib.contenttypes.models import ContentType
 
 from django.db.models import Q
@@ -49,6 +50,7 @@ from synnefo.lib.ordereddict import OrderedDict
 
 from synnefo.util import units
 from astakos.im import presentation
+from astakos.im import token_cache
 
 logger = logging.getLogger(__name__)
 
@@ -571,6 +573,9 @@ class AstakosUser(User):
         else:
             raise ValueError('Could not generate a token')
 
+        # The cached responses for the old token are dropped on save
+        self._renewed_tokens = getattr(self, "_renewed_tokens", [])
+        self._renewed_tokens.append(self.auth_token)
         self.auth_token = new_token
         self.auth_token_created = datetime.now()
         self.auth_token_expires = self.auth_token_created + \
@@ -2005,6 +2010,7 @@ class ProjectLog(models.Model):
 
 
 class ProjectLock(models.Model):
+    # No longer used; projects are locked individually.
     pass
 
 
@@ -2251,3 +2257,42 @@ def renew_token(sender, instance, **kwargs):
     if not instance.auth_token:
         instance.renew_token()
 pre_save.connect(renew_token, sender=Component)
+
+
+def user_changed(sender, instance, **kwargs):
+    tokens = [instance.auth_token]
+    tokens.extend(getattr(instance, "_renewed_tokens", []))
+    instance._renewed_tokens = []
+    token_cache.invalidate_tokens(tokens)
+post_save.connect(user_changed, sender=AstakosUser)
+post_delete.connect(user_changed, sender=AstakosUser)
+
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # The members of a group changed
+        if action == "pre_clear":
+            users = AstakosUser.objects.filter(groups=instance)
+        elif action in ("post_add", "post_remove"):
+            users = AstakosUser.objects.filter(pk__in=pk_set)
+        else:
+            return
+    elif action in ("post_add", "post_remove", "post_clear"):
+        users = AstakosUser.objects.filter(pk=instance.pk)
+    else:
+        return
+    token_cache.invalidate_users(users)
+m2m_changed.connect(user_groups_changed, sender=AstakosUser.groups.through)
+
+
+def membership_changed(sender, instance, **kwargs):
+    token_cache.invalidate_users(
+        AstakosUser.objects.filter(pk=instance.person_id))
+post_save.connect(membership_changed, sender=ProjectMembership)
+post_delete.connect(membership_changed, sender=ProjectMembership)
+
+
+def project_post_save(sender, instance, **kwargs):
+    token_cache.invalidate_users(
+        AstakosUser.objects.filter(projectmembership__project=instance))
+post_save.connect(project_post_save, sender=Project)
@@ -188,6 +188,42 @@ def set_quota(quotas, resource=None):
     qh.set_quota(q, resource=resource)
 
 
+# Number of holders whose holdings are compared and written at a time
+SYNC_BATCH_SIZE = 1000
+
+
+def _sync_quota(quotas, resource=None, sources=None):
+    holders = _partition_by(lambda q: q[0][0], quotas)
+    holder_list = sorted(holders.keys())
+    resources = [resource] if resource is not None else None
+    for i in range(0, len(holder_list), SYNC_BATCH_SIZE):
+        batch = holder_list[i:i + SYNC_BATCH_SIZE]
+        current = qh.get_quota(holders=batch, sources=sources,
+                               resources=resources)
+        changed = []
+        for holder in batch:
+            for key, limit in holders[holder]:
+                if resource is not None and key[2] != resource:
+                    continue
+                if key not in current or current[key][0] != limit:
+                    changed.append((key, limit))
+        if changed:
+            qh.set_quota(changed, resource=resource)
+
+
+def sync_quota(quotas, resource=None):
+    """Set the limits of quotas in the quotaholder, like set_quota.
+
+    The limits are compared against the current ones, in batches of
+    SYNC_BATCH_SIZE holders, and only the holdings whose limit differs are
+    written. The limits of the holdings of a project are only written
+    while the project is locked for update, so the comparison itself needs
+    no locks.
+
+    """
+    _sync_quota(_level_quota_dict(quotas), resource=resource)
+
+
 PENDING_APP_RESOURCE = 'astakos.pending_app'
 
 
@@ -285,7 +321,7 @@ def list_user_quotas(users, qhflt=None):
 def qh_sync_projects(projects, resource=None):
     p_quota, u_quota = astakos_project_quotas(projects, resource=resource)
     p_quota.update(u_quota)
-    set_quota(p_quota, resource=resource)
+    sync_quota(p_quota, resource=resource)
 
 
 def qh_sync_project(project):
@@ -308,8 +344,11 @@ def membership_quota(membership):
 
 
 def qh_sync_membership(membership):
+    """Sync the quota of a single membership, comparing only against the
+    holdings of the member in this project."""
     quota = membership_quota(membership)
-    set_quota(quota)
+    pr_ref = get_project_ref(membership.project)
+    _sync_quota(_level_quota_dict(quota), sources=[pr_ref])
 
 
 def pick_limit_scheme(project, resource):
@@ -318,7 +357,7 @@ def pick_limit_scheme(project, resource):
 
 def qh_sync_new_resource(resource):
     projects = Project.objects.filter(state__in=Project.INITIALIZED_STATES).\
-        select_for_update()
+        select_for_update().order_by("id")
 
     entries = []
     for project in projects:
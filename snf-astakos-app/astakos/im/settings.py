@@ -262,6 +262,17 @@ RESOURCE_CACHE_TIMEOUT = getattr(settings,
                                  'ASTAKOS_RESOURCE_CACHE_TIMEOUT',
                                  60)
 
+# Timeout in seconds for caching the response of POST /tokens per token.
+# Zero disables the cache.
+AUTHENTICATE_CACHE_TIMEOUT = getattr(settings,
+                                     'ASTAKOS_AUTHENTICATE_CACHE_TIMEOUT', 0)
+
+# The cache, among the ones defined in CACHES, that holds the responses of
+# POST /tokens.
+AUTHENTICATE_CACHE_BACKEND = getattr(settings,
+                                     'ASTAKOS_AUTHENTICATE_CACHE_BACKEND',
+                                     'default')
+
 ADMIN_API_ENABLED = getattr(settings, 'ASTAKOS_ADMIN_API_ENABLED', False)
 
 _default_project_members_limit_choices = (
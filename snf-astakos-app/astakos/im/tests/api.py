@@ -655,6 +655,46 @@ class TokensApiTest(TestCase):
         r = client.post(url, post_data, content_type='application/json')
         self.assertEqual(r.status_code, 401)
 
+    @im_settings(AUTHENTICATE_CACHE_TIMEOUT=60)
+    def test_authenticate_cache(self):
+        from django.core.cache import cache
+        cache.clear()
+        client = Client()
+        url = reverse('astakos.api.tokens.authenticate')
+
+        def authenticate(token):
+            post_data = json.dumps({"auth": {"token": {"id": token}}})
+            r = client.post(url, post_data, content_type='application/json')
+            if r.status_code != 200:
+                return r.status_code
+            return json.loads(r.content)["access"]["user"]
+
+        user = authenticate(self.user1.auth_token)
+        self.assertEqual(user["id"], self.user1.uuid)
+        self.assertEqual(user["roles"], [])
+        with self.assertNumQueries(0):
+            self.assertEqual(authenticate(self.user1.auth_token), user)
+
+        # Changing the groups of the user drops the cached response
+        self.user1.add_group("group1")
+        user = authenticate(self.user1.auth_token)
+        self.assertEqual([r["name"] for r in user["roles"]], ["group1"])
+
+        # So does a change in a project membership
+        membership = ProjectMembership.objects.get(person=self.user1)
+        self.assertEqual(user["projects"], [membership.project.uuid])
+        membership.state = ProjectMembership.REMOVED
+        membership.save()
+        self.assertEqual(authenticate(self.user1.auth_token)["projects"], [])
+
+        # and renewing the token
+        old_token = self.user1.auth_token
+        self.user1.renew_token()
+        self.user1.save()
+        self.assertEqual(authenticate(old_token), 401)
+        user = authenticate(self.user1.auth_token)
+        self.assertEqual(user["id"], self.user1.uuid)
+
 
 class UserApiTest(TransactionTestCase):
     def setUp(self):
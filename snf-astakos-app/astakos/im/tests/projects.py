@@ -14,6 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import threading
+from mock import patch
+
+from django.db import connection
+from django.test import skipUnlessDBFeature
+
 from astakos.im.tests.common import *
 
 
@@ -1114,3 +1120,175 @@ class TestProjects(TransactionTestCase):
         for mail in get_mailbox('user@synnefo.org'):
             self.assertTrue(settings.CONTACT_EMAIL in
                             mail.message().as_string())
+
+
+class QuotaSyncTest(TestCase):
+    def test_sync_quota(self):
+        project = quotas.project_ref("p1")
+        users = [quotas.user_ref("u%d" % i) for i in range(5)]
+        limits = quotas.QuotaDict()
+        limits[project][None]["r1"] = 10
+        for user in users:
+            limits[user][project]["r1"] = 1
+            limits[user][project]["r2"] = 2
+        quotas.sync_quota(limits)
+        current = quotas.qh.get_quota(holders=users + [project])
+        self.assertEqual(len(current), 11)
+
+        # Only the changed holdings are written, in batches of holders
+        limits[users[0]][project]["r2"] = 3
+        limits[users[4]][project]["r2"] = 3
+        limits[users[4]][project]["r3"] = 3
+        with patch.object(quotas, "SYNC_BATCH_SIZE", 2):
+            with patch.object(quotas.qh, "set_quota",
+                              wraps=quotas.qh.set_quota) as set_quota:
+                quotas.sync_quota(limits)
+        written = [sorted(call[0][0]) for call in set_quota.call_args_list]
+        self.assertEqual(written, [
+            [((users[0], project, "r2"), 3)],
+            [((users[4], project, "r2"), 3), ((users[4], project, "r3"), 3)]])
+        current = quotas.qh.get_quota(holders=users)
+        self.assertEqual(current[(users[4], project, "r3")][0], 3)
+        self.assertEqual(current[(users[1], project, "r2")][0], 2)
+
+        with patch.object(quotas.qh, "set_quota") as set_quota:
+            quotas.sync_quota(limits)
+        self.assertFalse(set_quota.called)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ProjectConcurrencyTest(TransactionTestCase):
+    """Drive project actions from parallel transactions.
+
+    Each call runs in its own thread, hence in its own database connection
+    and transaction, so that the project locks are actually contended.
+    """
+
+    def setUp(self):
+        Resource.objects.create(name="astakos.pending_app",
+                                uplimit=10,
+                                project_default=0,
+                                ui_visible=False,
+                                api_visible=False,
+                                service_type="astakos")
+        with transaction.atomic():
+            self.admin = get_local_user("projects-admin@synnefo.org")
+            self.admin.uuid = "uuid1"
+            self.admin.save()
+            self.users = [get_local_user("user%d@synnefo.org" % i)
+                          for i in range(6)]
+
+    def tearDown(self):
+        ProjectApplication.objects.all().delete()
+        Project.objects.all().delete()
+        AstakosUser.objects.all().delete()
+        Resource.objects.all().delete()
+
+    def run_parallel(self, calls):
+        """Run each call in a transaction of its own, all at the same time.
+
+        Returns the result or the raised exception of each call.
+        """
+        start = threading.Event()
+        results = [None] * len(calls)
+
+        def run(i, call):
+            start.wait()
+            try:
+                with transaction.atomic():
+                    results[i] = call()
+            except Exception as e:
+                results[i] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i, call))
+                   for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def submit(self, name, limit=100):
+        return functions.submit_application(
+            owner=self.admin,
+            name=name,
+            end_date="2114-01-01T0:0Z",
+            member_join_policy=functions.MODERATED_POLICY,
+            member_leave_policy=functions.AUTO_ACCEPT_POLICY,
+            limit_on_members_number=limit,
+            request_user=self.admin)
+
+    def make_project(self, name, limit=100):
+        with transaction.atomic():
+            application = self.submit(name, limit)
+            functions.approve_application(application.id,
+                                          request_user=self.admin)
+        return Project.objects.get(id=application.chain_id)
+
+    def memberships(self, project, state):
+        return ProjectMembership.objects.filter(project=project, state=state)
+
+    @im_settings(PROJECT_ADMINS=["uuid1"])
+    def test_join_and_accept(self):
+        projects = [self.make_project("test%d.synnefo.org" % i)
+                    for i in range(2)]
+        results = self.run_parallel([
+            functools.partial(functions.join_project, project.uuid, user)
+            for project in projects for user in self.users])
+        for result in results:
+            self.assertIsInstance(result, ProjectMembership)
+        for project in projects:
+            self.assertEqual(self.memberships(
+                project, ProjectMembership.REQUESTED).count(), 6)
+
+        results = self.run_parallel([
+            functools.partial(functions.accept_membership, membership.id,
+                              self.admin)
+            for membership in ProjectMembership.objects.filter(
+                project__in=projects)])
+        for result in results:
+            self.assertIsInstance(result, ProjectMembership)
+        for project in projects:
+            self.assertEqual(self.memberships(
+                project, ProjectMembership.ACCEPTED).count(), 6)
+            pr_ref = quotas.project_ref(project.uuid)
+            holdings = quotas.qh.get_quota(sources=[pr_ref])
+            members = set(key[0] for key in holdings if key[0] != pr_ref)
+            self.assertEqual(len(members), 6)
+
+    @im_settings(PROJECT_ADMINS=["uuid1"])
+    def test_accept_members_limit(self):
+        project = self.make_project("test.synnefo.org", limit=4)
+        with transaction.atomic():
+            for user in self.users:
+                functions.join_project(project.uuid, user)
+        results = self.run_parallel([
+            functools.partial(functions.accept_membership, membership.id,
+                              self.admin)
+            for membership in self.memberships(
+                project, ProjectMembership.REQUESTED)])
+        conflicts = [r for r in results
+                     if isinstance(r, functions.ProjectConflict)]
+        self.assertEqual(len(conflicts), 2)
+        self.assertEqual(self.memberships(
+            project, ProjectMembership.ACCEPTED).count(), 4)
+
+    @im_settings(PROJECT_ADMINS=["uuid1"])
+    def test_approve_same_name(self):
+        with transaction.atomic():
+            applications = [self.submit("test.synnefo.org")
+                            for i in range(3)]
+        results = self.run_parallel([
+            functools.partial(functions.approve_application, application.id,
+                              request_user=self.admin)
+            for application in applications])
+        approved = [r for r in results if isinstance(r, Project)]
+        conflicts = [r for r in results
+                     if isinstance(r, functions.ProjectConflict)]
+        self.assertEqual(len(approved), 1)
+        self.assertEqual(len(conflicts), 2)
+        self.assertEqual(
+            Project.objects.filter(name="test.synnefo.org").count(), 1)
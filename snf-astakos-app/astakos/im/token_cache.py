@@ -0,0 +1,69 @@
+# Copyright (C) 2010-2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the token and user part of the POST /tokens responses.
+
+Entries are keyed by token and are dropped when the token is renewed, or
+when the user, their groups, their project memberships or their projects
+change. The signal handlers that drop them are in astakos.im.models.
+"""
+
+from datetime import datetime
+from hashlib import sha256
+
+from astakos.im import settings
+
+KEY_PREFIX = "astakos_access:"
+
+
+def _get_cache():
+    from django.core.cache import caches
+    return caches[settings.AUTHENTICATE_CACHE_BACKEND]
+
+
+def _key(token):
+    return KEY_PREFIX + sha256(unicode(token).encode("utf-8")).hexdigest()
+
+
+def get_access(token):
+    """Return the cached access document of the token, or None."""
+    if not settings.AUTHENTICATE_CACHE_TIMEOUT:
+        return None
+    return _get_cache().get(_key(token))
+
+
+def set_access(token, access, expires=None):
+    """Cache the access document of the token, never past its expiration
+    date."""
+    timeout = settings.AUTHENTICATE_CACHE_TIMEOUT
+    if expires is not None:
+        delta = expires - datetime.now()
+        timeout = min(timeout, int(delta.total_seconds()))
+    if timeout > 0:
+        _get_cache().set(_key(token), access, timeout)
+
+
+def invalidate_tokens(tokens):
+    """Drop the cached access documents of the tokens."""
+    tokens = [token for token in tokens if token]
+    if settings.AUTHENTICATE_CACHE_TIMEOUT and tokens:
+        _get_cache().delete_many(map(_key, tokens))
+
+
+def invalidate_users(users):
+    """Drop the cached access documents of the tokens of the users in the
+    'users' queryset."""
+    if settings.AUTHENTICATE_CACHE_TIMEOUT:
+        invalidate_tokens(users.values_list("auth_token", flat=True))
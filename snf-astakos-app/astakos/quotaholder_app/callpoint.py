@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import operator
 from datetime import datetime
 from django.db.models import Q
 from astakos.quotaholder_app.exception import (
@@ -64,25 +65,33 @@ def delete_quota(keys):
                                resource=resource).delete()
 
 
-def _get_holdings_for_update(holding_keys, resource=None, delete=False):
-    flt = Q(resource=resource) if resource is not None else Q()
-    holders = set(holder for (holder, source, resource) in holding_keys)
-    objs = Holding.objects.filter(flt, holder__in=holders).order_by('pk')
-    hs = objs.select_for_update()
+def _holding_keys_filter(holding_keys):
+    by_holder_source = _partition_by(lambda k: k[:2], holding_keys,
+                                     lambda k: k[2])
+    return reduce(operator.or_,
+                  (Q(holder=holder, source=source, resource__in=resources)
+                   for (holder, source), resources
+                   in sorted(by_holder_source.iteritems())))
 
+
+def _get_holdings_for_update(holding_keys):
+    """Lock the holdings with the given keys, in primary key order.
+
+    Only the requested holdings are locked, so that commissions on other
+    resources or sources of the same holders can proceed. Locking always in
+    the same order keeps concurrent transactions from deadlocking.
+    """
     keys = set(holding_keys)
+    if not keys:
+        return {}
+    objs = Holding.objects.filter(_holding_keys_filter(keys))
+    hs = objs.order_by('pk').select_for_update()
+
     holdings = {}
-    put_back = []
     for h in hs:
         key = h.holder, h.source, h.resource
         if key in keys:
             holdings[key] = h
-        else:
-            put_back.append(h)
-
-    if delete:
-        objs.delete()
-        Holding.objects.bulk_create(put_back)
     return holdings
 
 
@@ -96,29 +105,28 @@ def _mkProvision(key, quantity):
 
 
 def set_quota(quotas, resource=None):
-    holding_keys = [key for (key, limit) in quotas]
-    holdings = _get_holdings_for_update(
-        holding_keys, resource=resource, delete=True)
-
-    new_holdings = {}
+    limits = {}
     for key, limit in quotas:
-        holder, source, res = key
-        if resource is not None and resource != res:
-            continue
-        h = Holding(holder=holder,
-                    source=source,
-                    resource=res,
-                    limit=limit)
-        try:
-            h_old = holdings[key]
-            h.usage_min = h_old.usage_min
-            h.usage_max = h_old.usage_max
-            h.id = h_old.id
-        except KeyError:
-            pass
-        new_holdings[key] = h
-
-    Holding.objects.bulk_create(new_holdings.values())
+        if resource is None or key[2] == resource:
+            limits[key] = limit
+    holdings = _get_holdings_for_update(limits.keys())
+
+    new_holdings = []
+    updates = {}
+    for key, limit in limits.iteritems():
+        h = holdings.get(key)
+        if h is None:
+            holder, source, res = key
+            new_holdings.append(Holding(holder=holder,
+                                        source=source,
+                                        resource=res,
+                                        limit=limit))
+        elif h.limit != limit:
+            updates.setdefault(limit, []).append(h.pk)
+
+    for limit, pks in updates.iteritems():
+        Holding.objects.filter(pk__in=pks).update(limit=limit)
+    Holding.objects.bulk_create(new_holdings)
 
 
 def _merge_same_keys(provisions):
@@ -13,7 +13,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from django.test import TestCase
+import logging
+import random
+import threading
+import time
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 
 from snf_django.utils.testing import assertGreater, assertIn, assertRaises
 from astakos.quotaholder_app import models
@@ -25,6 +31,8 @@ from astakos.quotaholder_app.exception import (
     NoHoldingError,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class QuotaholderTest(TestCase):
 
@@ -260,3 +268,98 @@ class QuotaholderTest(TestCase):
         r = qh.get_quota(holders=[holder])
         self.assertEqual(r, {(holder, source, resource1): (limit2, 1, 1),
                              (holder, source, resource2): (22, 2, 2)})
+
+        # Holdings are updated in place
+        h1 = models.Holding.objects.get(resource=resource1)
+        qh.set_quota([((holder, source, resource1), limit1)])
+        self.assertEqual(models.Holding.objects.get(resource=resource1).pk,
+                         h1.pk)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class QuotaholderContentionTest(TransactionTestCase):
+    """Issue commissions from concurrent transactions.
+
+    test_concurrent_commissions doubles as a contention benchmark; raise
+    THREADS and COMMISSIONS to put more load on the holdings.
+    """
+
+    THREADS = 8
+    COMMISSIONS = 20
+    RESOURCES = ["r%d" % i for i in range(4)]
+    clientkey = "test"
+
+    def setUp(self):
+        qh.set_quota([(("h0", "system", resource), 10 ** 6)
+                      for resource in self.RESOURCES])
+
+    def run_thread(self, target, *args):
+        def run():
+            try:
+                target(*args)
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def commission(self, provisions):
+        with transaction.atomic():
+            serial = qh.issue_commission(clientkey=self.clientkey,
+                                         provisions=provisions)
+        with transaction.atomic():
+            qh.resolve_pending_commission(self.clientkey, serial)
+
+    def test_unrelated_commissions(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_r0():
+            with transaction.atomic():
+                qh.issue_commission(clientkey=self.clientkey,
+                                    provisions=[(("h0", "system", "r0"), 1)])
+                locked.set()
+                release.wait(30)
+
+        holder = self.run_thread(hold_r0)
+        try:
+            self.assertTrue(locked.wait(30))
+            # A commission on another resource of the same holder does not
+            # wait for the one holding r0
+            other = self.run_thread(self.commission,
+                                    [(("h0", "system", "r1"), 1)])
+            other.join(10)
+            self.assertFalse(other.is_alive())
+        finally:
+            release.set()
+            holder.join()
+        r = qh.get_quota(holders=["h0"], resources=["r1"])
+        self.assertEqual(r[("h0", "system", "r1")], (10 ** 6, 1, 1))
+
+    def test_concurrent_commissions(self):
+        errors = []
+
+        def run(seed):
+            rand = random.Random(seed)
+            try:
+                for i in range(self.COMMISSIONS):
+                    resources = rand.sample(self.RESOURCES, 2)
+                    self.commission([(("h0", "system", resource), 1)
+                                     for resource in resources])
+            except Exception as e:
+                errors.append(e)
+
+        start = time.time()
+        threads = [self.run_thread(run, seed)
+                   for seed in range(self.THREADS)]
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        self.assertEqual(errors, [])
+        total = sum(usage_max for (limit, usage_min, usage_max)
+                    in qh.get_quota(holders=["h0"]).values())
+        commissions = self.THREADS * self.COMMISSIONS
+        self.assertEqual(total, 2 * commissions)
+        logger.info("Issued and accepted %d commissions from %d threads "
+                    "in %.2f seconds.", commissions, self.THREADS, elapsed)
@@ -233,6 +233,13 @@ class AMQPPukaClient(object):
                                             arguments=arguments)
         self.client.wait(promise)
 
+    @reconnect_decorator
+    def queue_status(self, queue):
+        """Return the number of messages and consumers of a queue."""
+        promise = self.client.queue_declare(queue=queue, passive=True)
+        result = self.client.wait(promise)
+        return result["message_count"], result["consumer_count"]
+
     def queue_bind(self, queue, exchange, routing_key):
         self.log.debug('Binding queue %s to exchange %s with key %s'
                        % (queue, exchange, routing_key))
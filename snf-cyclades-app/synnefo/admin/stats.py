@@ -15,6 +15,7 @@
 
 
 import datetime
+import json
 
 from collections import defaultdict  # , OrderedDict
 from copy import copy
@@ -26,6 +27,7 @@ from snf_django.lib.astakos import UserCache
 from synnefo.plankton.backend import PlanktonBackend
 from synnefo.api.util import get_cached_public_stats
 from synnefo.db.models import (VirtualMachine, Network, Backend, VolumeType,
+                               IPPoolTable, IPPoolSegmentTable, StatsSnapshot,
                                pooled_rapi_client, Flavor)
 
 
@@ -103,10 +105,19 @@ def _get_total_servers(backend=None):
 
 
 def get_server_stats(backend=None):
-    servers = VirtualMachine.objects.select_related("flavor__volume_type")\
-                                    .filter(deleted=False)
+    """Get statistics about Cyclades servers.
+
+    The servers are counted with a single GROUP BY query over their state
+    and flavor, instead of loading each server.
+
+    """
+    servers = VirtualMachine.objects.filter(deleted=False)
     if backend is not None:
         servers = servers.filter(backend=backend)
+    servers = servers.values("operstate", "flavor__cpu", "flavor__ram",
+                             "flavor__disk",
+                             "flavor__volume_type__disk_template")\
+                     .annotate(count=Count("id")).order_by()
     disk_templates = \
         VolumeType.objects.values_list("disk_template", flat=True).distinct()
 
@@ -120,19 +131,21 @@ def get_server_stats(backend=None):
             dict([(disk_t, defaultdict(int)) for disk_t in disk_templates])
 
     for s in servers:
-        if s.operstate in ["STARTED", "BUILD"]:
+        if s["operstate"] in ["STARTED", "BUILD"]:
             state = "started"
-        elif s.operstate == "ERROR":
+        elif s["operstate"] == "ERROR":
             state = "error"
         else:
             state = "stopped"
 
-        flavor = s.flavor
-        disk_template = flavor.volume_type.disk_template
-        server_stats[state]["count"] += 1
-        server_stats[state]["cpu"][flavor.cpu] += 1
-        server_stats[state]["ram"][flavor.ram << 20] += 1
-        server_stats[state]["disk"][disk_template][flavor.disk << 30] += 1
+        count = s["count"]
+        disk_template = s["flavor__volume_type__disk_template"]
+        disk_stats = server_stats[state]["disk"].setdefault(disk_template,
+                                                            defaultdict(int))
+        server_stats[state]["count"] += count
+        server_stats[state]["cpu"][s["flavor__cpu"]] += count
+        server_stats[state]["ram"][s["flavor__ram"] << 20] += count
+        disk_stats[s["flavor__disk"] << 30] += count
 
     return server_stats
 
@@ -145,16 +158,24 @@ def get_network_stats():
         network_stats[flavor]["active"] = 0
         network_stats[flavor]["error"] = 0
 
-    networks = Network.objects.filter(deleted=False)
+    networks = Network.objects.filter(deleted=False)\
+                              .values("flavor", "state")\
+                              .annotate(count=Count("id")).order_by()
     for net in networks:
-        state = "error" if net.state == "ERROR" else "active"
-        network_stats[net.flavor][state] += 1
+        state = "error" if net["state"] == "ERROR" else "active"
+        network_stats[net["flavor"]][state] += net["count"]
 
     return network_stats
 
 
 def get_ip_pool_stats():
-    """Get statistics about floating IPs."""
+    """Get statistics about floating IPs.
+
+    The sizes of the pools and the free addresses of their segments are
+    summed up in the database. Only pools that have not been split into
+    segments yet are loaded to count their free addresses.
+
+    """
     ip_stats = {}
     for status in ["drained", "active"]:
         ip_stats[status] = {
@@ -162,13 +183,35 @@ def get_ip_pool_stats():
             "total": 0,
             "free": 0,
         }
-    ip_pools = Network.objects.filter(deleted=False, floating_ip_pool=True)
-    for ip_pool in ip_pools:
-        status = "drained" if ip_pool.drained else "active"
-        total, free = ip_pool.ip_count()
-        ip_stats[status]["count"] += 1
-        ip_stats[status]["total"] += total
-        ip_stats[status]["free"] += free
+
+    def _status(drained):
+        return "drained" if drained else "active"
+
+    networks = Network.objects.filter(deleted=False, floating_ip_pool=True)
+    for net in networks.values("drained").annotate(count=Count("id"))\
+                       .order_by():
+        ip_stats[_status(net["drained"])]["count"] += net["count"]
+
+    drained = "subnet__network__drained"
+    ip_pools = IPPoolTable.objects.filter(
+        subnet__deleted=False, subnet__ipversion=4,
+        subnet__network__deleted=False,
+        subnet__network__floating_ip_pool=True)
+    for pool in ip_pools.values(drained).annotate(total=Sum("size"))\
+                        .order_by():
+        ip_stats[_status(pool[drained])]["total"] += pool["total"] or 0
+
+    segments = IPPoolSegmentTable.objects.filter(ip_pool__in=ip_pools)
+    for segment in segments.values("ip_pool__" + drained)\
+                           .annotate(free=Sum("free")).order_by():
+        status = _status(segment["ip_pool__" + drained])
+        ip_stats[status]["free"] += segment["free"] or 0
+
+    for ip_pool in ip_pools.filter(segments__isnull=True)\
+                           .select_related("subnet__network"):
+        status = _status(ip_pool.subnet.network.drained)
+        ip_stats[status]["free"] += ip_pool.pool.count_available()
+
     return ip_stats
 
 
@@ -271,6 +314,40 @@ def get_public_stats_from_cache():
     return get_cached_public_stats()
 
 
+PUBLIC_STATS_SNAPSHOT = "public"
+CYCLADES_STATS_SNAPSHOT = "cyclades"
+
+
+def update_stats_snapshot():
+    """Compute the public and the Cyclades statistics and store them in the
+    stats snapshots. Return the Cyclades statistics."""
+    cyclades_stats = get_cyclades_stats()
+    for name, data in [(PUBLIC_STATS_SNAPSHOT, get_public_stats()),
+                       (CYCLADES_STATS_SNAPSHOT, cyclades_stats)]:
+        StatsSnapshot.objects.update_or_create(
+            name=name, defaults={"data": json.dumps(data)})
+    return cyclades_stats
+
+
+def get_stats_snapshot(name):
+    """Return the statistics of a snapshot.
+
+    Return None if snapshots are disabled, or if the snapshot is older than
+    CYCLADES_STATS_SNAPSHOT_MAX_AGE seconds.
+
+    """
+    max_age = settings.CYCLADES_STATS_SNAPSHOT_MAX_AGE
+    if not max_age:
+        return None
+    try:
+        snapshot = StatsSnapshot.objects.get(name=name)
+    except StatsSnapshot.DoesNotExist:
+        return None
+    age = datetime.datetime.now() - snapshot.updated
+    if age > datetime.timedelta(seconds=max_age):
+        return None
+    return json.loads(snapshot.data)
+
+
 if __name__ == "__main__":
-    import json
     print json.dumps(get_cyclades_stats())
@@ -30,7 +30,9 @@ logger = logging.getLogger(__name__)
                 logger=logger, serializations=['json'])
 @api.allow_jsonp()
 def get_public_stats(request):
-    _stats = stats.get_public_stats()
+    _stats = stats.get_stats_snapshot(stats.PUBLIC_STATS_SNAPSHOT)
+    if _stats is None:
+        _stats = stats.get_public_stats()
     data = json.dumps(_stats)
     return http.HttpResponse(data, status=200, content_type='application/json')
 
@@ -66,8 +68,12 @@ def get_cyclades_stats(request):
         # This stats have no meaning per backend
         networks, ip_pools = False, False
 
-    _stats = stats.get_cyclades_stats(backend=backend, clusters=clusters,
-                                      servers=servers, networks=networks,
-                                      ip_pools=ip_pools, images=images)
+    _stats = None
+    if backend is None:
+        _stats = stats.get_stats_snapshot(stats.CYCLADES_STATS_SNAPSHOT)
+    if _stats is None:
+        _stats = stats.get_cyclades_stats(backend=backend, clusters=clusters,
+                                          servers=servers, networks=networks,
+                                          ip_pools=ip_pools, images=images)
     data = json.dumps(_stats)
     return http.HttpResponse(data, status=200, content_type='application/json')
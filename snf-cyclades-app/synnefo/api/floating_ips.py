@@ -75,14 +75,14 @@ def _floatingip_details_view(floating_ip):
     return json.dumps({'floatingip': ip_to_dict(floating_ip)})
 
 
-def _floatingip_list_view(floating_ips):
-    floating_ips = map(ip_to_dict, floating_ips)
-    return json.dumps({'floatingips': floating_ips})
+def _floatingip_list_view(batches):
+    batches = (map(ip_to_dict, batch) for batch in batches)
+    return utils.json_list_response('floatingips', batches)
 
 
-def _compute_floatingip_list_view(floating_ips):
-    floating_ips = map(compute_ip_to_dict, floating_ips)
-    return json.dumps({'floating_ips': floating_ips})
+def _compute_floatingip_list_view(batches):
+    batches = (map(compute_ip_to_dict, batch) for batch in batches)
+    return utils.json_list_response('floating_ips', batches)
 
 
 def _compute_floatingip_details_view(floating_ip):
@@ -180,7 +180,11 @@ def list_floating_ips(request, view=_floatingip_list_view):
 
     floating_ips = utils.filter_modified_since(request, objects=floating_ips)
 
-    return HttpResponse(view(floating_ips), status=200)
+    marker, limit = utils.get_list_limits(request)
+    batches = utils.iter_batches(
+        floating_ips, marker, limit,
+        batch_size=settings.CYCLADES_API_LIST_BATCH_SIZE)
+    return view(batches)
 
 
 @api.api_method(http_method="GET", user_required=True, logger=log,
@@ -17,6 +17,7 @@ from django.conf import settings
 from django.conf.urls import patterns
 from django.http import HttpResponse
 import json
+from itertools import chain
 from django.db.models import Q
 from django.template.loader import render_to_string
 
@@ -89,16 +90,19 @@ def list_networks(request, detail=True):
     user_networks = api.utils.filter_modified_since(request,
                                                     objects=user_networks)
 
-    network_dicts = [network_to_dict(network, detail)
-                     for network in user_networks]
+    marker, limit = api.utils.get_list_limits(request)
+    batches = api.utils.iter_batches(
+        user_networks, marker, limit,
+        batch_size=settings.CYCLADES_API_LIST_BATCH_SIZE)
+    batches = ([network_to_dict(network, detail) for network in batch]
+               for batch in batches)
 
     if request.serialization == 'xml':
         data = render_to_string('list_networks.xml', {
-            "networks": network_dicts})
-    else:
-        data = json.dumps({'networks': network_dicts})
+            "networks": list(chain.from_iterable(batches))})
+        return HttpResponse(data, status=200)
 
-    return HttpResponse(data, status=200)
+    return api.utils.json_list_response('networks', batches)
 
 
 @api.api_method(http_method='POST', user_required=True, logger=log)
@@ -15,9 +15,11 @@
 
 #from django.conf import settings
 import ipaddr
+from django.conf import settings
 from django.conf.urls import patterns
 from django.http import HttpResponse
 import json
+from itertools import chain
 from django.template.loader import render_to_string
 
 from snf_django.lib import api
@@ -69,16 +71,19 @@ def list_ports(request, detail=True):
     if detail:
         ports = ports.prefetch_related("ips")
 
-    port_dicts = [port_to_dict(port, detail)
-                  for port in ports.order_by('id')]
+    marker, limit = api.utils.get_list_limits(request)
+    batches = api.utils.iter_batches(
+        ports.order_by('id'), marker, limit,
+        batch_size=settings.CYCLADES_API_LIST_BATCH_SIZE)
+    batches = ([port_to_dict(port, detail) for port in batch]
+               for batch in batches)
 
     if request.serialization == 'xml':
         data = render_to_string('list_ports.xml', {
-            "ports": port_dicts})
-    else:
-        data = json.dumps({'ports': port_dicts})
+            "ports": list(chain.from_iterable(batches))})
+        return HttpResponse(data, status=200)
 
-    return HttpResponse(data, status=200)
+    return api.utils.json_list_response('ports', batches)
 
 
 @api.api_method(http_method='POST', user_required=True, logger=log)
@@ -15,11 +15,13 @@
 
 from django.conf import settings
 from django.conf.urls import patterns
+from django.db.models import Max, Prefetch
 
 from synnefo.db import transaction
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 import json
+from itertools import chain
 from django.core.urlresolvers import reverse
 
 from snf_django.lib import api
@@ -31,7 +33,9 @@ from synnefo.lib.services import get_service_path
 from synnefo.api import util
 from synnefo.api.util import (VM_PASSWORD_CACHE, feature_enabled, check_tag,
                               make_tag, COMPUTE_API_TAG_USER_PREFIX)
-from synnefo.db.models import (VirtualMachine, VirtualMachineMetadata)
+from synnefo.db.models import (VirtualMachine, VirtualMachineMetadata,
+                               VirtualMachineTag, VirtualMachineDiagnostic,
+                               Volume)
 from synnefo.logic import servers, utils as logic_utils, server_attachments
 from synnefo.volume.util import get_volume, snapshots_enabled_for_user
 from synnefo import cyclades_settings
@@ -251,8 +255,10 @@ def vm_to_dict(vm, detail=False):
         metadata = dict((m.meta_key, m.meta_value) for m in vm.metadata.all())
         d['metadata'] = metadata
         prefix = COMPUTE_API_TAG_USER_PREFIX
-        d['tags'] = [db_tag.tag.split(prefix, 1)[1] for db_tag in vm.tags.
-                     filter(tag__startswith=prefix, status='ACTIVE')]
+        tags = getattr(vm, "active_tags", None)
+        if tags is None:
+            tags = vm.tags.filter(tag__startswith=prefix, status='ACTIVE')
+        d['tags'] = [db_tag.tag.split(prefix, 1)[1] for db_tag in tags]
 
         nics = vm.nics.all()
         active_nics = filter(lambda nic: nic.state == "ACTIVE", nics)
@@ -261,11 +267,16 @@ def vm_to_dict(vm, detail=False):
         d['attachments'] = attachments
         d['addresses'] = attachments_to_addresses(attachments)
 
-        d['volumes'] = [v.id for v in vm.volumes.filter(deleted=False)
-                                                .order_by('id')]
+        volumes = getattr(vm, "active_volumes", None)
+        if volumes is None:
+            volumes = vm.volumes.filter(deleted=False).order_by('id')
+        d['volumes'] = [v.id for v in volumes]
 
         # include the latest vm diagnostic, if set
-        diagnostic = vm.get_last_diagnostic()
+        if hasattr(vm, "last_diagnostic"):
+            diagnostic = vm.last_diagnostic
+        else:
+            diagnostic = vm.get_last_diagnostic()
         if diagnostic:
             d['diagnostics'] = diagnostics_to_dict([diagnostic])
         else:
@@ -287,6 +298,37 @@ def vm_to_dict(vm, detail=False):
     return d
 
 
+def prefetch_server_details(vms):
+    """Load the details of many servers in a constant number of queries.
+
+    Return the servers of the 'vms' QuerySet as a list, with their NICs,
+    metadata, active tags, volumes and latest diagnostic loaded, so that
+    'vm_to_dict' does not perform any queries for them.
+
+    """
+    tags = VirtualMachineTag.objects.filter(
+        tag__startswith=COMPUTE_API_TAG_USER_PREFIX, status='ACTIVE')
+    volumes = Volume.objects.filter(deleted=False).order_by('id')
+    vms = list(vms.prefetch_related(
+        "nics__ips", "metadata",
+        Prefetch("tags", queryset=tags, to_attr="active_tags"),
+        Prefetch("volumes", queryset=volumes, to_attr="active_volumes")))
+    if not vms:
+        return vms
+
+    # Diagnostics are ordered by creation, so the latest one of each server
+    # is the one with the highest id. Clear the default ordering, which
+    # would otherwise end up in the GROUP BY clause.
+    latest = VirtualMachineDiagnostic.objects\
+        .filter(machine__in=[vm.id for vm in vms])\
+        .order_by().values("machine").annotate(latest=Max("id"))
+    latest = dict((d["machine"], d["latest"]) for d in latest)
+    diagnostics = VirtualMachineDiagnostic.objects.in_bulk(latest.values())
+    for vm in vms:
+        vm.last_diagnostic = diagnostics.get(latest.get(vm.id))
+    return vms
+
+
 def get_server_public_ip(vm_nics, version=4):
     """Get the first public IP address of a server.
 
@@ -408,22 +450,22 @@ def list_servers(request, detail=False):
     #                       overLimit (413)
 
     user_vms = VMPolicy.filter_list(request.credentials)
-    if detail:
-        user_vms = user_vms.prefetch_related("nics__ips", "metadata")
-
     user_vms = utils.filter_modified_since(request, objects=user_vms)
-
-    servers_dict = [vm_to_dict(server, detail)
-                    for server in user_vms.order_by('id')]
+    marker, limit = utils.get_list_limits(request)
+    batches = utils.iter_batches(
+        user_vms.order_by('id'), marker, limit,
+        batch_size=settings.CYCLADES_API_LIST_BATCH_SIZE,
+        load=prefetch_server_details if detail else list)
+    batches = ([vm_to_dict(server, detail) for server in batch]
+               for batch in batches)
 
     if request.serialization == 'xml':
         data = render_to_string('list_servers.xml', {
-            'servers': servers_dict,
+            'servers': list(chain.from_iterable(batches)),
             'detail': detail})
-    else:
-        data = json.dumps({'servers': servers_dict})
+        return HttpResponse(data, status=200)
 
-    return HttpResponse(data, status=200)
+    return utils.json_list_response('servers', batches)
 
 
 @api.api_method(http_method='POST', user_required=True, logger=log)
@@ -14,8 +14,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from synnefo.admin import stats
+from synnefo.db import models_factory as mfactory
 
 from mock import patch
 
@@ -40,3 +42,58 @@ class StatsTest(TestCase):
         self.assertEqual(cached_stats['active_servers'], 1)
         self.assertEqual(cached_stats['spawned_servers'], 2)
         self.assertEqual(cached_stats['spawned_networks'], 3)
+
+    def test_get_server_stats(self):
+        flavor = mfactory.FlavorFactory(cpu=2, ram=1024, disk=10,
+                                        volume_type__disk_template="drbd")
+        mfactory.VirtualMachineFactory.create_batch(2, flavor=flavor,
+                                                    operstate="STARTED")
+        mfactory.VirtualMachineFactory(flavor=flavor, operstate="BUILD")
+        mfactory.VirtualMachineFactory(flavor=flavor, operstate="ERROR")
+        mfactory.VirtualMachineFactory(flavor=flavor, operstate="STOPPED")
+        mfactory.VirtualMachineFactory(flavor=flavor, deleted=True)
+
+        server_stats = self.stats.get_server_stats()
+        started = server_stats["started"]
+        self.assertEqual(started["count"], 3)
+        self.assertEqual(started["cpu"], {2: 3})
+        self.assertEqual(started["ram"], {1024 << 20: 3})
+        self.assertEqual(started["disk"]["drbd"], {10 << 30: 3})
+        self.assertEqual(server_stats["error"]["count"], 1)
+        self.assertEqual(server_stats["stopped"]["count"], 1)
+
+    def test_get_ip_pool_stats(self):
+        net = mfactory.NetworkWithSubnetFactory(floating_ip_pool=True)
+        mfactory.NetworkWithSubnetFactory(floating_ip_pool=True,
+                                          deleted=True)
+        total, free = net.ip_count()
+
+        ip_stats = self.stats.get_ip_pool_stats()
+        self.assertEqual(ip_stats["active"],
+                         {"count": 1, "total": total, "free": free})
+        self.assertEqual(ip_stats["drained"],
+                         {"count": 0, "total": 0, "free": 0})
+
+        # Allocating an address splits the pool into segments
+        segment = net.subnets.get(ipversion=4).ip_pools.get().get_segment()
+        segment.get()
+        segment.save()
+        ip_stats = self.stats.get_ip_pool_stats()
+        self.assertEqual(ip_stats["active"]["free"], free - 1)
+
+    def test_stats_snapshot(self):
+        mfactory.VirtualMachineFactory(operstate="STARTED")
+        with patch("synnefo.admin.stats.get_cluster_stats") as clusters:
+            clusters.return_value = {}
+            cyclades_stats = self.stats.update_stats_snapshot()
+        self.assertEqual(cyclades_stats["servers"]["started"]["count"], 1)
+
+        name = self.stats.CYCLADES_STATS_SNAPSHOT
+        with override_settings(CYCLADES_STATS_SNAPSHOT_MAX_AGE=0):
+            self.assertEqual(self.stats.get_stats_snapshot(name), None)
+        with override_settings(CYCLADES_STATS_SNAPSHOT_MAX_AGE=60):
+            snapshot = self.stats.get_stats_snapshot(name)
+            self.assertEqual(snapshot["servers"]["started"]["count"], 1)
+            public = self.stats.get_stats_snapshot(
+                self.stats.PUBLIC_STATS_SNAPSHOT)
+            self.assertEqual(public["servers"]["ACTIVE"]["count"], 1)
@@ -21,8 +21,11 @@ from copy import deepcopy
 from snf_django.utils.testing import (BaseAPITest, mocked_quotaholder,
                                       override_settings)
 from django.test.utils import override_settings as django_override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from synnefo.db.models import (VirtualMachine, VirtualMachineMetadata,
-                               IPAddress, NetworkInterface, Volume)
+                               VirtualMachineDiagnostic, IPAddress,
+                               NetworkInterface, Volume)
 from synnefo.db import models_factory as mfactory
 from synnefo.userdata import models_factory as keymfactory
 from synnefo.logic.servers import server_created
@@ -113,6 +116,82 @@ class ServerAPITest(ComputeAPITest):
             self.assertEqual(api_vm['status'], get_rsapi_state(db_vm))
             self.assertSuccess(response)
 
+    def test_server_list_detail_queries(self):
+        """Test that the servers list details take a constant number of
+        queries, regardless of the number of servers."""
+        user = 'user3'
+
+        def create_servers(count):
+            for i in range(count):
+                vm = mfactory.VirtualMachineFactory(userid=user)
+                mfactory.IPv4AddressFactory(nic__machine=vm, userid=user)
+                mfactory.VirtualMachineMetadataFactory(vm=vm)
+                mfactory.VirtualMachineTagFactory(vm=vm)
+                mfactory.VirtualMachineTagFactory(vm=vm, status="PENDADD")
+                mfactory.VolumeFactory(machine=vm, userid=user)
+                mfactory.VolumeFactory(machine=vm, userid=user, deleted=True)
+                VirtualMachineDiagnostic.objects.create_for_vm(
+                    vm, "INFO", message="old")
+                VirtualMachineDiagnostic.objects.create_for_vm(
+                    vm, "ERROR", message="new")
+
+        def list_servers():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.myget('servers/detail', user)
+            self.assertSuccess(response)
+            return len(queries), json.loads(response.content)['servers']
+
+        create_servers(2)
+        queries, servers = list_servers()
+        self.assertEqual(len(servers), 2)
+        create_servers(8)
+        self.assertEqual(list_servers()[0], queries)
+
+        # The listing must match the details of each server
+        for api_vm in servers:
+            response = self.myget('servers/%d' % api_vm['id'], user)
+            self.assertEqual(api_vm, json.loads(response.content)['server'])
+            self.assertEqual(len(api_vm['tags']), 1)
+            self.assertEqual(len(api_vm['volumes']), 1)
+            self.assertEqual(api_vm['diagnostics'][0]['message'], "new")
+
+    def test_server_list_pagination(self):
+        """Test the marker and limit parameters of the servers list."""
+        user = 'user3'
+        ids = [mfactory.VirtualMachineFactory(userid=user).id
+               for i in range(5)]
+
+        def list_ids(query):
+            response = self.myget('servers?' + query, user)
+            self.assertSuccess(response)
+            return [s['id'] for s in json.loads(response.content)['servers']]
+
+        self.assertEqual(list_ids('limit=2'), ids[:2])
+        self.assertEqual(list_ids('limit=2&marker=%d' % ids[1]), ids[2:4])
+        self.assertEqual(list_ids('marker=%d' % ids[3]), ids[4:])
+        self.assertEqual(list_ids('limit=0'), [])
+        for query in ['limit=-1', 'limit=foo', 'marker=foo']:
+            response = self.myget('servers?' + query, user)
+            self.assertBadRequest(response)
+
+    @django_override_settings(CYCLADES_API_LIST_BATCH_SIZE=2)
+    def test_server_list_streaming(self):
+        """Test that lists larger than a batch are streamed."""
+        user = 'user3'
+        ids = [mfactory.VirtualMachineFactory(userid=user).id
+               for i in range(5)]
+        response = self.myget('servers/detail', user)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        servers = json.loads("".join(response.streaming_content))['servers']
+        self.assertEqual([s['id'] for s in servers], ids)
+
+        response = self.myget('servers/detail?limit=2&marker=%d' % ids[0],
+                              user)
+        self.assertFalse(response.streaming)
+        servers = json.loads(response.content)['servers']
+        self.assertEqual([s['id'] for s in servers], ids[1:3])
+
     def test_server_detail(self):
         """Test if a server details are returned."""
         db_vm = self.vm2
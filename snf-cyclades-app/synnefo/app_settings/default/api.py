@@ -198,6 +198,11 @@ CYCLADES_VM_MAX_TAGS = 50
 # The maximmum allowed metadata items for a Cyclades Virtual Machine
 CYCLADES_VM_MAX_METADATA = 10
 
+# Number of objects fetched from the DB at a time when listing servers,
+# networks, ports, floating IPs and volumes. Listings with more objects
+# than this are streamed to the client.
+CYCLADES_API_LIST_BATCH_SIZE = 1000
+
 # Define cache for public stats
 PUBLIC_STATS_CACHE = {
     "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
@@ -206,6 +211,13 @@ PUBLIC_STATS_CACHE = {
     "TIMEOUT": 300,
 }
 
+# Serve the '/admin' and public statistics from the snapshot that is
+# stored by 'snf-manage stats-cyclades --update-snapshot', as long as it
+# is at most this many seconds old. Run the command periodically, e.g.
+# from cron, to keep the snapshot fresh. If set to 0, or if there is no
+# fresh snapshot, the statistics are computed on each request.
+CYCLADES_STATS_SNAPSHOT_MAX_AGE = 0
+
 # Permit users of specific groups to override the flavor allow_create policy
 CYCLADES_FLAVOR_OVERRIDE_ALLOW_CREATE = {}
 
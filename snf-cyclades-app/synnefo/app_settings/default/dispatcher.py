@@ -50,3 +50,20 @@ DISPATCHER_LOGGING_SETUP = {
 #    'level': 'INFO',
 #   'propagate': False
 #}
+
+# Maximum number of messages about instances that snf-dispatcher processes
+# as a batch. The messages of a batch are grouped by instance, and the
+# messages of each instance are processed in a single transaction. Superseded
+# progress updates of Ganeti jobs are skipped. Set to 1 to process each
+# message on its own.
+DISPATCHER_BATCH_SIZE = 1
+
+# Number of worker processes of snf-dispatcher. When it is larger than 1, a
+# router process forwards each message to the queue of a shard, chosen by the
+# name of the instance or network that the message refers to, and each worker
+# process handles the messages of one shard. This way, the messages of each
+# instance are processed in order, while the messages of different instances
+# are processed in parallel. 'snf-dispatcher --purge-queues' and
+# '--drain-queue' only know about the queues of the configured shards, so
+# drain the queues of the shards before decreasing this setting.
+DISPATCHER_SHARDS = 1
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from synnefo.db.pools import split_pool_maps, join_pool_maps
+
+
+def split_ip_pools(apps, schema_editor):
+    IPPoolTable = apps.get_model("db", "IPPoolTable")
+    IPPoolSegmentTable = apps.get_model("db", "IPPoolSegmentTable")
+    for ip_pool in IPPoolTable.objects.exclude(available_map=""):
+        segment_maps = split_pool_maps(ip_pool.available_map,
+                                       ip_pool.reserved_map, ip_pool.size)
+        IPPoolSegmentTable.objects.bulk_create([
+            IPPoolSegmentTable(ip_pool=ip_pool, index=index, size=size,
+                               available_map=available_map,
+                               reserved_map=reserved_map, free=free)
+            for index, (size, available_map, reserved_map, free)
+            in enumerate(segment_maps)])
+        ip_pool.available_map = ""
+        ip_pool.reserved_map = ""
+        ip_pool.save()
+
+
+def join_ip_pools(apps, schema_editor):
+    IPPoolTable = apps.get_model("db", "IPPoolTable")
+    for ip_pool in IPPoolTable.objects.filter(segments__isnull=False)\
+                                      .distinct():
+        segments = ip_pool.segments.order_by("index")
+        ip_pool.available_map, ip_pool.reserved_map = join_pool_maps(
+            [(s.available_map, s.reserved_map) for s in segments])
+        ip_pool.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0016_backend_reconciliation_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IPPoolSegmentTable',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('index', models.IntegerField()),
+                ('size', models.IntegerField()),
+                ('available_map', models.TextField(default='')),
+                ('reserved_map', models.TextField(default='')),
+                ('free', models.IntegerField(default=0)),
+                ('ip_pool', models.ForeignKey(related_name='segments',
+                                              to='db.IPPoolTable')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ippoolsegmenttable',
+            unique_together=set([('ip_pool', 'index')]),
+        ),
+        migrations.RunPython(split_ip_pools, join_ip_pools),
+    ]
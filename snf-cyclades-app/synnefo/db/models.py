@@ -17,12 +17,13 @@ import datetime
 
 from copy import deepcopy
 from django.conf import settings
-from django.db import models
+from django.db import models, connections, transaction, DatabaseError
 
 import utils
 from contextlib import contextmanager
 from hashlib import sha1
 from snf_django.lib.api import faults
+from snf_django.utils.db import select_db
 from django.conf import settings as snf_settings
 from aes_encrypt import encrypt_db_charfield, decrypt_db_charfield
 
@@ -156,6 +157,10 @@ class Backend(models.Model):
     ctotal = models.PositiveIntegerField('Total number of logical processors',
                                          default=0, null=False)
     public = models.BooleanField('Public', null=False)
+    # Reconciliation state: the Ganeti jobs up to this ID have been
+    # reconciled, and the last full reconciliation took place at this time
+    reconciled_job_id = models.PositiveIntegerField(null=True)
+    fully_reconciled = models.DateTimeField(null=True)
 
     HYPERVISORS = (
         ("kvm", "Linux KVM hypervisor"),
@@ -821,7 +826,7 @@ class Subnet(models.Model):
         ip_pools = self.ip_pools
         if locked:
             ip_pools = ip_pools.select_for_update()
-        return map(lambda ip_pool: ip_pool.pool, ip_pools.all())
+        return [ip_pool.load_pool(locked=locked) for ip_pool in ip_pools.all()]
 
 
 class BackendNetwork(models.Model):
@@ -947,11 +952,13 @@ class IPAddress(models.Model):
         """Release the IPv4 address."""
         if self.ipversion == 4:
             for pool_row in self.subnet.ip_pools.all():
-                ip_pool = pool_row.pool
-                if ip_pool.contains(self.address):
-                    ip_pool.put(self.address)
-                    ip_pool.save()
-                    return
+                try:
+                    segment = pool_row.get_segment(self.address)
+                except pools.InvalidValue:
+                    continue
+                segment.put(self.address)
+                segment.save()
+                return
             log.error("Cannot release address %s of NIC %s. Address does not"
                       " belong to any of the IP pools of the subnet %s !",
                       self.address, self.nic, self.subnet_id)
@@ -1139,6 +1146,138 @@ class IPPoolTable(PoolTable):
     def __unicode__(self):
         return u"<IPv4AdressPool, Subnet: %s>" % self.subnet_id
 
+    @property
+    def pool(self):
+        return self.load_pool(locked=False)
+
+    def load_pool(self, locked=True):
+        """Return the manager of the whole IP pool.
+
+        The maps of the pool are assembled from the maps of its segments,
+        which are locked if 'locked' is set. Saving the pool only writes the
+        segments that have changed.
+
+        """
+        segments = self.segments.order_by("index")
+        if locked:
+            segments = segments.select_for_update()
+        self._segments = list(segments)
+        if self._segments:
+            self.available_map, self.reserved_map = pools.join_pool_maps(
+                [(s.available_map, s.reserved_map) for s in self._segments])
+        return self.manager(self)
+
+    def get_segment(self, address=None):
+        """Return the manager of a locked segment of the IP pool.
+
+        Return the segment that holds 'address' or, if no address is given,
+        the first segment with free addresses that is not locked by another
+        transaction. This way, concurrent allocations from the same pool
+        only lock and write a single segment each, and do not wait for each
+        other unless the pool is almost full.
+
+        Raises EmptyPool if the pool has no free addresses, and InvalidValue
+        if the address does not belong to the pool.
+
+        """
+        if not self.segments.exists():
+            # Pools that have never been saved have no segments yet
+            IPPoolTable.objects.select_for_update().get(id=self.id)
+            if not self.segments.exists():
+                self.load_pool().save()
+
+        segments = self.segments.select_for_update()
+        if address is not None:
+            index = pools.find_ip_pool_segment(self, address)
+            return segments.get(index=index).get_pool(self)
+
+        candidates = self.segments.filter(free__gt=0).order_by("index")\
+                                  .values_list("id", flat=True)
+        candidates = list(candidates)
+        db = select_db("db")
+        if connections[db].features.has_select_for_update_nowait:
+            for segment_id in candidates:
+                try:
+                    with transaction.atomic(using=db):
+                        segment = segments.select_for_update(nowait=True)\
+                                          .get(id=segment_id)
+                except DatabaseError:
+                    # Locked by a concurrent allocation
+                    continue
+                if segment.free > 0:
+                    return segment.get_pool(self)
+        for segment_id in candidates:
+            segment = segments.get(id=segment_id)
+            if segment.free > 0:
+                return segment.get_pool(self)
+        raise pools.EmptyPool
+
+    def save(self, *args, **kwargs):
+        # The maps of the pool are only stored in its segments
+        available_map, reserved_map = self.available_map, self.reserved_map
+        self.available_map = self.reserved_map = ""
+        try:
+            super(IPPoolTable, self).save(*args, **kwargs)
+        finally:
+            self.available_map = available_map
+            self.reserved_map = reserved_map
+        if available_map:
+            self._save_segments()
+
+    def _save_segments(self):
+        old_segments = getattr(self, "_segments", None)
+        if old_segments is None:
+            old_segments = self.segments.all()
+        old_segments = dict((s.index, s) for s in old_segments)
+        segments = []
+        segment_maps = pools.split_pool_maps(self.available_map,
+                                             self.reserved_map, self.size)
+        for index, (size, available_map, reserved_map, free) in \
+                enumerate(segment_maps):
+            segment = old_segments.pop(index, None)
+            if segment is None:
+                segment = IPPoolSegmentTable(ip_pool=self, index=index)
+            elif (segment.size == size and
+                  segment.available_map == available_map and
+                  segment.reserved_map == reserved_map):
+                segments.append(segment)
+                continue
+            segment.size = size
+            segment.available_map = available_map
+            segment.reserved_map = reserved_map
+            segment.free = free
+            segment.save()
+            segments.append(segment)
+        if old_segments:
+            # The pool has been shrunk
+            self.segments.filter(index__gte=len(segments)).delete()
+        self._segments = segments
+
+
+class IPPoolSegmentTable(models.Model):
+    """A segment of an IP pool, with the maps of SEGMENT_SIZE consecutive
+    addresses of the pool and the number of its free addresses."""
+    ip_pool = models.ForeignKey(IPPoolTable, related_name="segments",
+                                on_delete=models.CASCADE)
+    index = models.IntegerField(null=False)
+    size = models.IntegerField(null=False)
+    available_map = models.TextField(default="", null=False)
+    reserved_map = models.TextField(default="", null=False)
+    free = models.IntegerField(null=False, default=0)
+
+    class Meta:
+        unique_together = (("ip_pool", "index"),)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    def __unicode__(self):
+        return u"<IPPoolSegment %s, IPPool: %s>" % (self.index,
+                                                    self.ip_pool_id)
+
+    def get_pool(self, ip_pool):
+        return pools.IPPoolSegment(self, ip_pool)
+
 
 @contextmanager
 def pooled_rapi_client(obj):
@@ -1393,3 +1532,22 @@ class ProjectBackend(models.Model):
 
     def __unicode__(self):
         return u'<%s: %s>' % (self.project, self.backend_id)
+
+
+class StatsSnapshot(models.Model):
+    """A snapshot of the Cyclades statistics, stored as JSON.
+
+    Snapshots are refreshed with 'snf-manage stats-cyclades
+    --update-snapshot', so that the statistics views can serve them
+    without aggregating the whole database on each request.
+
+    """
+    name = models.CharField(max_length=64, unique=True, null=False)
+    data = models.TextField(null=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    def __unicode__(self):
+        return u'<StatsSnapshot %s: %s>' % (self.name, self.updated)
@@ -20,6 +20,10 @@ import ipaddr
 AVAILABLE = True
 UNAVAILABLE = False
 
+# Number of values in each segment of a segmented pool. It must be a multiple
+# of 8, so that the maps of the segments can be joined bytewise.
+SEGMENT_SIZE = 4096
+
 
 class PoolManager(object):
     """PoolManager for DB PoolTable models.
@@ -238,6 +242,39 @@ def bitarray_to_map(bitarray_):
     return bitarray_to_01(bitarray_).replace("0", "X").replace("1", ".")
 
 
+def split_pool_maps(available_map, reserved_map, pool_size,
+                    segment_size=SEGMENT_SIZE):
+    """Split the maps of a pool into the maps of its segments.
+
+    Return a list with a (size, available_map, reserved_map, free) tuple for
+    each segment, where 'free' is the number of values of the segment that
+    are neither reserved nor externally reserved.
+
+    """
+    available = _bitarray_from_string(available_map)
+    reserved = _bitarray_from_string(reserved_map)
+    free = available & reserved
+    segments = []
+    for start in xrange(0, pool_size, segment_size):
+        end = start + segment_size
+        # The last segment also keeps the padding of the pool
+        if end >= pool_size:
+            end = available.length()
+        segments.append((min(segment_size, pool_size - start),
+                         _bitarray_to_string(available[start:end]),
+                         _bitarray_to_string(reserved[start:end]),
+                         free[start:end].count(AVAILABLE)))
+    return segments
+
+
+def join_pool_maps(segment_maps):
+    """Join the (available_map, reserved_map) pairs of the segments of a
+    pool into the maps of the pool."""
+    available = "".join(b64decode(a) for a, _ in segment_maps)
+    reserved = "".join(b64decode(r) for _, r in segment_maps)
+    return b64encode(available), b64encode(reserved)
+
+
 def _bitarray_from_string(bitarray_):
     ba = bitarray()
     ba.frombytes(b64decode(bitarray_))
@@ -355,3 +392,37 @@ class IPPool(PoolManager):
     def return_end(self):
         return str(ipaddr.IPAddress(ipaddr.IPNetwork(self.base).network) +
                    self.offset + self.pool_size - 1)
+
+
+class IPPoolSegment(IPPool):
+    """Manager for a single segment of an IP pool.
+
+    The segment is a row with the maps of SEGMENT_SIZE consecutive values of
+    the IP pool. Values are indexed relative to the start of the segment, so
+    that allocating or releasing a value only loads and saves the maps of
+    the segment, instead of the maps of the whole pool.
+
+    """
+    def __init__(self, segment_table, pool_table):
+        self.net = ipaddr.IPNetwork(pool_table.subnet.cidr)
+        self.offset = int(pool_table.offset) +\
+            segment_table.index * SEGMENT_SIZE
+        self.base = pool_table.base
+        PoolManager.__init__(self, segment_table)
+
+    def save(self, db=True):
+        self.pool_table.free = self.count_available()
+        super(IPPoolSegment, self).save(db=db)
+
+
+def find_ip_pool_segment(pool_table, address):
+    """Return the index of the segment of an IP pool that holds an address."""
+    net = ipaddr.IPNetwork(pool_table.subnet.cidr)
+    try:
+        addr = ipaddr.IPAddress(address)
+    except ValueError:
+        raise InvalidValue("Invalid IP address")
+    index = int(addr) - int(net.network) - int(pool_table.offset)
+    if addr not in net or not 0 <= index < pool_table.size:
+        raise InvalidValue("%s does not belong to pool." % address)
+    return index // SEGMENT_SIZE
@@ -29,8 +29,10 @@ from synnefo.db import models_factory as mfact
 from synnefo.db.pools import IPPool, EmptyPool
 from synnefo.db import transaction as cyclades_transaction
 
-from django.db import IntegrityError
+from django.db import IntegrityError, DatabaseError, connections
+from django.db.models.query import QuerySet
 from django.core.exceptions import MultipleObjectsReturned
+from snf_django.utils.db import select_db
 from snf_django.utils.testing import override_settings
 from mock import patch
 
@@ -200,6 +202,66 @@ class NetworkTest(TestCase):
         pool = net1.get_ip_pools()[0]
         self.assertTrue(pool.is_available('192.168.2.12'))
 
+    def test_ip_pool_segments(self):
+        from synnefo.logic import ips
+        net = mfact.NetworkWithSubnetFactory(subnet__cidr='10.0.0.0/19',
+                                             subnet__gateway='10.0.0.1',
+                                             subnet__pool__size=8000)
+        pool_row = IPPoolTable.objects.get(subnet__network=net)
+        self.assertFalse(pool_row.segments.exists())
+        ip1 = ips.allocate_ip(net, "user")
+        self.assertEqual(ip1.address, '10.0.0.2')
+        segments = list(pool_row.segments.order_by("index"))
+        self.assertEqual([(s.size, s.free) for s in segments],
+                         [(4096, 4095), (3904, 3904)])
+        ip2 = ips.allocate_ip(net, "user", address='10.0.20.1')
+        self.assertEqual(pool_row.segments.get(index=1).free, 3903)
+        pool = net.get_ip_pools()[0]
+        self.assertFalse(pool.is_available('10.0.0.2'))
+        self.assertFalse(pool.is_available('10.0.20.1'))
+        self.assertEqual(pool.count_available(), 7998)
+
+        # Only the segment of the address is written
+        net.reserve_address('10.0.0.10', external=True)
+        self.assertEqual(pool_row.segments.get(index=0).free, 4094)
+        self.assertEqual(pool_row.segments.get(index=1).free, 3903)
+        ip2.release_address()
+        self.assertEqual(pool_row.segments.get(index=1).free, 3904)
+        self.assertEqual(IPPoolTable.objects.get(id=pool_row.id)
+                         .pool.count_available(), 7998)
+
+    def test_ip_pool_segment_nowait(self):
+        net = mfact.NetworkWithSubnetFactory(subnet__cidr='10.0.0.0/19',
+                                             subnet__gateway='10.0.0.1',
+                                             subnet__pool__size=8000)
+        pool_row = IPPoolTable.objects.get(subnet__network=net)
+        self.assertEqual(pool_row.get_segment().pool_table.index, 0)
+
+        locks = []
+        select_for_update = QuerySet.select_for_update
+
+        def nowait_lock(queryset, nowait=False):
+            if nowait and locks:
+                # Locked by a concurrent allocation
+                locks.pop()
+                raise DatabaseError("could not obtain lock")
+            return select_for_update(queryset, nowait=nowait)
+
+        features = connections[select_db("db")].features
+        with patch.object(features, "has_select_for_update_nowait", True):
+            with patch.object(QuerySet, "select_for_update", nowait_lock):
+                # The first segment is locked, the second one is used
+                locks[:] = [0]
+                segment = pool_row.get_segment()
+                self.assertEqual(locks, [])
+                self.assertEqual(segment.pool_table.index, 1)
+
+                # All segments are locked, wait for the first one
+                locks[:] = [0, 1]
+                segment = pool_row.get_segment()
+                self.assertEqual(locks, [])
+                self.assertEqual(segment.pool_table.index, 0)
+
 
 class BackendNetworkTest(TestCase):
     def test_mac_prefix(self):
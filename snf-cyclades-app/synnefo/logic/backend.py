@@ -1529,6 +1529,19 @@ def get_instances(backend, bulk=True):
         return c.GetInstances(bulk=bulk)
 
 
+def get_instances_by_name(backend, names):
+    """Get the instances with the given names, skipping missing ones."""
+    instances = []
+    with pooled_rapi_client(backend) as c:
+        for name in names:
+            try:
+                instances.append(c.GetInstance(name))
+            except rapi.GanetiApiError as e:
+                if e.code != 404:
+                    raise
+    return instances
+
+
 def get_nodes(backend, bulk=True):
     with pooled_rapi_client(backend) as c:
         return c.GetNodes(bulk=bulk)
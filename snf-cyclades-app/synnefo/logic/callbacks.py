@@ -18,8 +18,12 @@
 
 import logging
 import json
-from functools import wraps
+from collections import OrderedDict
+from functools import wraps, partial
 
+from django.db import transaction as django_transaction
+
+from snf_django.utils.db import select_db
 from synnefo.db import transaction
 from synnefo.db.models import (Backend, VirtualMachine, Network,
                                BackendNetwork, pooled_rapi_client)
@@ -83,9 +87,126 @@ def instance_from_msg(func):
                       msg['instance'], vm_id)
         except (Network.InvalidBackendIdError, Network.DoesNotExist):
             log.error("Invalid message, can not find network. msg: %s", msg)
+    wrapper.batch = partial(process_instance_batch, func, wrapper)
     return wrapper
 
 
+def coalesce_key(msg):
+    """Return the key of a message about an instance for coalescing.
+
+    A message does not have to be processed if a newer message about the same
+    instance has the same key, as the newer message will bring the instance
+    to the same state. Only progress updates of the same Ganeti job and copy
+    progress updates are coalesced. Messages with a None key are always
+    processed.
+
+    """
+    type_ = msg.get("type")
+    if type_ == "ganeti-op-status":
+        return (type_, msg.get("jobId"), msg.get("operation"))
+    elif type_ == "image-copy-progress":
+        return (type_,)
+    return None
+
+
+def process_instance_batch(func, handler, client, messages):
+    """Process a batch of messages about instances.
+
+    The messages are grouped by instance. The messages of each instance are
+    processed in order of their event time, in a single transaction that
+    locks the instance once, and are acknowledged together when the
+    transaction has been committed. Messages that are superseded by a newer
+    message of the batch (see 'coalesce_key') are only acknowledged.
+
+    Each message is processed in its own savepoint, so that a message that
+    fails is rolled back and rejected, as it would be if it was processed
+    alone. Messages that cannot be parsed are passed to 'handler', the
+    handler for single messages.
+
+    """
+    groups = OrderedDict()
+    for message in messages:
+        try:
+            msg = json.loads(message["body"])
+            vm_id = utils.id_from_instance_name(msg["instance"])
+            event_time = merge_time(msg["event_time"])
+        except Exception:
+            handler(client, message)
+            continue
+        groups.setdefault(vm_id, []).append((event_time, message, msg))
+
+    for vm_id, group in groups.items():
+        group.sort(key=lambda entry: entry[0])
+        pending, superseded = [], []
+        keys = set()
+        for event_time, message, msg in reversed(group):
+            key = coalesce_key(msg)
+            if key is not None and key in keys:
+                superseded.append(message)
+            else:
+                pending.append((message, msg))
+            keys.add(key)
+        pending.reverse()
+        if superseded:
+            log.debug("Skipping %d superseded messages for instance %s",
+                      len(superseded), vm_id)
+        _process_instance_group(func, client, vm_id, pending)
+        for message in superseded:
+            client.basic_ack(message)
+
+
+def _process_instance_group(func, client, vm_id, pending):
+    db = select_db("db")
+    processed, failed = [], []
+    try:
+        with transaction.atomic():
+            try:
+                vm = VirtualMachine.objects.select_for_update().get(id=vm_id)
+            except VirtualMachine.DoesNotExist:
+                log.error("VM for instance with id %d not found in DB.", vm_id)
+                vm = None
+            for message, msg in pending:
+                context = transaction.DeferredJobContext()
+                if vm is None or vm.deleted:
+                    processed.append((message, context))
+                    continue
+                try:
+                    with django_transaction.atomic(using=db):
+                        try:
+                            func(vm, msg, atomic_context=context)
+                        except (Network.InvalidBackendIdError,
+                                Network.DoesNotExist):
+                            log.error("Invalid message, can not find"
+                                      " network. msg: %s", msg)
+                except Exception as e:
+                    if isinstance(e, KeyError):
+                        log.error("Malformed incoming JSON, missing"
+                                  " attribute %s: %s", e, message)
+                    else:
+                        log.exception("Unexpected error: %s, msg: %s", e, msg)
+                    failed.append((message, context, e))
+                    # Drop the changes that were rolled back
+                    vm = VirtualMachine.objects.get(id=vm_id)
+                else:
+                    processed.append((message, context))
+    except Exception as e:
+        log.exception("Unexpected error while processing messages for"
+                      " instance %s: %s", vm_id, e)
+        failed = [(message, context, e) for message, context in processed] +\
+            failed
+        processed = []
+
+    for message, context in processed:
+        context.handle(success=True)
+        client.basic_ack(message)
+    for message, context, e in failed:
+        context.handle(success=False)
+        if isinstance(e, KeyError):
+            client.basic_nack(message)
+        else:
+            client.basic_reject(message)
+
+
 def network_from_msg(func):
     """ Decorator for getting the BackendNetwork object of the msg.
 
@@ -38,7 +38,10 @@ from django.db import close_connection
 import time
 
 import json
+import signal
 import socket
+import zlib
+from functools import partial
 import traceback
 import daemon
 import daemon.runner
@@ -87,6 +90,15 @@ CHECK_TOOL_ACK_TIMEOUT = 10
 CHECK_TOOL_REPORT_TIMEOUT = 30
 # Seconds that the request queue will exist while there are no consumers.
 REQUEST_QUEUE_TTL = 600
+# Seconds to wait for more messages to arrive, before processing a batch of
+# messages that is not full.
+BATCH_COLLECT_TIMEOUT = 0.1
+# Seconds between reports of the number of messages waiting in the queues of
+# the shards.
+SHARD_STATUS_INTERVAL = 60
+# Seconds to wait before restarting a process of snf-dispatcher that has
+# exited.
+PROCESS_RESTART_WAIT = 5
 
 
 def get_hostname():
@@ -94,12 +106,35 @@ def get_hostname():
 
 
 class Dispatcher:
+    """Consume and process the messages of the queues.
+
+    With a single shard, the dispatcher processes the messages of the queues
+    itself. Otherwise, the dispatcher of shard None is the router, which
+    forwards the messages to the queues of the shards, and the dispatcher of
+    each shard processes the messages of its queues. 'pid' is the process ID
+    that the queue for status check requests is named after.
+
+    """
     debug = False
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, shard=None, pid=None):
         self.debug = debug
+        self.shard = shard
+        self.shards = settings.DISPATCHER_SHARDS
+        self.pid = pid if pid is not None else os.getpid()
+        self.batch_size = settings.DISPATCHER_BATCH_SIZE
+        # (batch handler, list of buffered messages) for each batched queue
+        self.batches = []
+        # The connection to the AMQP broker that the buffered messages were
+        # received on
+        self.connection = None
+        self.shard_status_time = 0
         self._init()
 
+    @property
+    def is_router(self):
+        return self.shards > 1 and self.shard is None
+
     def wait(self):
         log.info("Waiting for messages..")
         timeout = DISPATCHER_RECONNECT_TIMEOUT
@@ -112,6 +147,11 @@ class Dispatcher:
                 # gracefully.
                 close_connection()
                 msg = self.client.basic_wait(timeout=timeout)
+                # basic_wait reconnects silently on connection errors
+                self.drop_stale_messages()
+                self.process_batches()
+                if self.is_router:
+                    self.report_shard_status()
                 if not msg:
                     log.warning("Idle connection for %d seconds. Will connect"
                                 " to a different host. Verify that"
@@ -119,6 +159,7 @@ class Dispatcher:
                     self.client.reconnect(timeout=1)
             except AMQPConnectionError as e:
                 log.error("AMQP connection failed: %s" % e)
+                self.drop_stale_messages()
                 log.warning("Sleeping for %d seconds before retrying to "
                             "connect to an AMQP broker" %
                             DISPATCHER_FAILED_CONNECTION_WAIT)
@@ -126,6 +167,7 @@ class Dispatcher:
             except select.error as e:
                 if e[0] != errno.EINTR:
                     log.exception("Caught unexpected exception: %s", e)
+                    self.drop_stale_messages()
                     log.warning("Sleeping for %d seconds before retrying to "
                                 "connect to an AMQP broker" %
                                 DISPATCHER_FAILED_CONNECTION_WAIT)
@@ -136,6 +178,7 @@ class Dispatcher:
                 break
             except Exception as e:
                 log.exception("Caught unexpected exception: %s", e)
+                self.drop_stale_messages()
                 log.warning("Sleeping for %d seconds before retrying to "
                             "connect to an AMQP broker" %
                             DISPATCHER_FAILED_CONNECTION_WAIT)
@@ -145,6 +188,88 @@ class Dispatcher:
         self.client.basic_cancel(timeout=1)
         self.client.close(timeout=1)
 
+    def process_batches(self):
+        """Process the buffered messages of the batched queues.
+
+        Wait for the messages that the broker has already sent to arrive,
+        until no message arrives for BATCH_COLLECT_TIMEOUT seconds or a batch
+        is full, and then process the batch of each queue.
+
+        The handlers can only acknowledge the messages on the connection
+        that they were received on. If the client reconnects while a batch
+        is processed, the rest of the buffered messages are dropped, since
+        the broker has already requeued them.
+
+        """
+        def buffered():
+            return [len(messages) for _, messages in self.batches]
+
+        if not any(buffered()):
+            return
+        while max(buffered()) < self.batch_size:
+            count = buffered()
+            self.client.basic_wait(timeout=BATCH_COLLECT_TIMEOUT)
+            if buffered() == count:
+                break
+        if self.drop_stale_messages():
+            return
+
+        client = BatchClient(self.client, self.connection)
+        try:
+            for handler, messages in self.batches:
+                if messages:
+                    batch = messages[:]
+                    del messages[:]
+                    log.debug("Processing batch of %d messages", len(batch))
+                    handler(client, batch)
+        except ConnectionReset:
+            log.warning("Connection to the AMQP broker was reset while"
+                        " processing a batch of messages")
+            self.drop_stale_messages()
+
+    def buffer_message(self, messages, client, msg):
+        """Callback function for queues whose messages are processed in
+        batches."""
+        self.drop_stale_messages()
+        self.connection = client.client
+        messages.append(msg)
+
+    def drop_stale_messages(self):
+        """Drop the buffered messages if the client has reconnected to the
+        AMQP broker since they were received.
+
+        The broker requeues the unacknowledged messages of a closed
+        connection, and their delivery tags are not valid on the new one.
+        Return whether any messages were dropped.
+
+        """
+        if self.client.client is self.connection:
+            return False
+        self.connection = self.client.client
+        dropped = 0
+        for _, messages in self.batches:
+            dropped += len(messages)
+            del messages[:]
+        if dropped:
+            log.warning("Dropped %d messages received before reconnecting"
+                        " to the AMQP broker", dropped)
+        return dropped > 0
+
+    def report_shard_status(self):
+        """Log the number of messages waiting in the queues of each shard,
+        every SHARD_STATUS_INTERVAL seconds."""
+        now = time.time()
+        if now - self.shard_status_time < SHARD_STATUS_INTERVAL:
+            return
+        self.shard_status_time = now
+        status = get_shard_status(self.client, self.shards)
+        for shard, (messages, consumers) in enumerate(status):
+            if consumers:
+                log.info("Shard %d: %d messages waiting", shard, messages)
+            else:
+                log.warning("Shard %d: %d messages waiting, no consumers",
+                            shard, messages)
+
     def _init(self):
         log.info("Initializing")
 
@@ -178,16 +303,51 @@ class Dispatcher:
             queue = binding[0]
             exchange = binding[1]
             routing_key = binding[2]
+            queue_dl = queues.convert_queue_to_dead(queue)
+            exchange_dl = queues.convert_exchange_to_dead(exchange)
+
+            sharded = self.shards > 1 and queue in queues.SHARDED_QUEUES
+            if self.shard is not None:
+                if not sharded:
+                    continue
+                # Consume the queue of this shard instead
+                queue = queues.get_shard_queue(queue, self.shard)
+                routing_key = queues.get_shard_routing_key(routing_key,
+                                                           self.shard)
+                self.client.queue_declare(queue=queue, mirrored=True,
+                                          dead_letter_exchange=exchange_dl)
+            elif sharded:
+                # Declare the queues of all shards, so that messages are
+                # kept until the processes of the shards start
+                for shard in range(self.shards):
+                    self.client.queue_declare(
+                        queue=queues.get_shard_queue(queue, shard),
+                        mirrored=True, dead_letter_exchange=exchange_dl)
+                    self.client.queue_bind(
+                        queue=queues.get_shard_queue(queue, shard),
+                        exchange=exchange,
+                        routing_key=queues.get_shard_routing_key(routing_key,
+                                                                 shard))
+                callback = partial(route_message, routing_key, self.shards)
 
             self.client.queue_bind(queue=queue, exchange=exchange,
                                    routing_key=routing_key)
 
-            self.client.basic_consume(queue=binding[0],
+            prefetch_count = 5
+            batch_handler = getattr(callback, "batch", None)
+            if self.batch_size > 1 and batch_handler is not None:
+                # Buffer the messages of the queue, to process them in
+                # batches. The broker sends at most 'batch_size'
+                # unacknowledged messages.
+                messages = []
+                self.batches.append((batch_handler, messages))
+                callback = partial(self.buffer_message, messages)
+                prefetch_count = self.batch_size
+
+            self.client.basic_consume(queue=queue,
                                       callback=callback,
-                                      prefetch_count=5)
+                                      prefetch_count=prefetch_count)
 
-            queue_dl = queues.convert_queue_to_dead(queue)
-            exchange_dl = queues.convert_exchange_to_dead(exchange)
             # Bind the corresponding dead-letter queue
             self.client.queue_bind(queue=queue_dl,
                                    exchange=exchange_dl,
@@ -196,9 +356,12 @@ class Dispatcher:
             log.debug("Binding %s(%s) to queue %s with handler %s",
                       exchange, routing_key, queue, binding[3])
 
+        if self.shard is not None:
+            return
+
         # Declare the queue that will be used for receiving requests, e.g. a
         # status check request
-        hostname, pid = get_hostname(), os.getpid()
+        hostname, pid = get_hostname(), self.pid
         queue = queues.get_dispatcher_request_queue(hostname, pid)
         self.client.queue_declare(queue=queue, mirrored=True,
                                   ttl=REQUEST_QUEUE_TTL)
@@ -207,6 +370,94 @@ class Dispatcher:
                   exchange, routing_key, queue)
 
 
+def get_message_shard(body, shards):
+    """Return the shard of a message.
+
+    The shard is chosen by hashing the name of the instance, network or
+    cluster that the message refers to, so that all the messages of an
+    instance end up in the same shard.
+
+    """
+    try:
+        msg = json.loads(body)
+        name = (msg.get("instance") or msg.get("network") or
+                msg.get("cluster") or "")
+        name = name.encode("utf-8")
+    except (ValueError, AttributeError):
+        # The message will be rejected by the process of the shard
+        name = ""
+    return zlib.crc32(name) % shards
+
+
+def route_message(routing_key, shards, client, msg):
+    """Callback function that forwards a message to the queues of its shard.
+
+    The message is acknowledged after the broker has confirmed the
+    forwarded message.
+
+    """
+    shard = get_message_shard(msg["body"], shards)
+    client.basic_publish(settings.EXCHANGE_GANETI,
+                         queues.get_shard_routing_key(routing_key, shard),
+                         msg["body"])
+    client.basic_ack(msg)
+
+
+def get_shard_status(client, shards):
+    """Return the number of messages waiting in the queues of each shard and
+    the least number of consumers of these queues."""
+    status = []
+    for shard in range(shards):
+        shard_queues = [queues.get_shard_queue(queue, shard)
+                        for queue in queues.SHARDED_QUEUES]
+        counts = [client.queue_status(queue) for queue in shard_queues]
+        status.append((sum(messages for messages, _ in counts),
+                       min(consumers for _, consumers in counts)))
+    return status
+
+
+class ConnectionReset(Exception):
+    """The client reconnected to the AMQP broker while processing a batch
+    of messages."""
+
+
+class BatchClient(object):
+    """Wrapper of the AMQP client that is passed to the batch handlers.
+
+    Messages are acknowledged or rejected only if the client is still on
+    'connection', the connection that they were received on. Otherwise,
+    ConnectionReset is raised, so that the rest of the batch is not
+    processed.
+
+    """
+    def __init__(self, client, connection):
+        self.client = client
+        self.connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _check_connection(self):
+        if self.client.client is not self.connection:
+            raise ConnectionReset()
+
+    def basic_ack(self, message):
+        self._check_connection()
+        self.client.basic_ack(message)
+        # A failed acknowledgement is lost when the client reconnects
+        self._check_connection()
+
+    def basic_nack(self, message):
+        self._check_connection()
+        self.client.basic_nack(message)
+        self._check_connection()
+
+    def basic_reject(self, message, requeue=False):
+        self._check_connection()
+        self.client.basic_reject(message, requeue=requeue)
+        self._check_connection()
+
+
 def handle_request(client, msg):
     """Callback function for handling requests.
 
@@ -309,6 +560,10 @@ def parse_arguments(args):
                             " first (DANGEROUS!)"))
     parser.add_option("--drain-queue", dest="drain_queue",
                       help="Drain a queue from all outstanding messages")
+    parser.add_option("--shard-status", dest="shard_status",
+                      default=False, action="store_true",
+                      help="Show the number of messages waiting in the"
+                           " queues of each shard of snf-dispatcher")
     parser.add_option("--status-check", dest="status_check",
                       default=False, action="store_true",
                       help="Trigger a status check for a running"
@@ -390,6 +645,29 @@ def check_dispatcher_status(pid_file):
     sys.exit(0)
 
 
+def print_shard_status():
+    """Print the number of messages waiting in the queues of each shard."""
+    shards = settings.DISPATCHER_SHARDS
+    if shards <= 1:
+        sys.stdout.write("snf-dispatcher is not sharded.\n")
+        sys.exit(1)
+
+    log_amqp.setLevel(logging.WARNING)
+    client = AMQPClient(logger=log_amqp)
+    client.connect()
+    try:
+        status = get_shard_status(client, shards)
+    except Exception as e:
+        sys.stdout.write("Cannot get the status of the shards: %s\n" % e)
+        sys.exit(1)
+    for shard, (messages, consumers) in enumerate(status):
+        sys.stdout.write("Shard %d: %d messages waiting, %s\n" %
+                         (shard, messages,
+                          "running" if consumers else "not running"))
+    client.close()
+    sys.exit(0)
+
+
 def purge_queues():
     """
         Delete declared queues from RabbitMQ. Use with care!
@@ -397,12 +675,13 @@ def purge_queues():
     client = AMQPClient(max_retries=120)
     client.connect()
 
-    print "Queues to be deleted: ", queues.QUEUES
+    dispatcher_queues = queues.get_queues(settings.DISPATCHER_SHARDS)
+    print "Queues to be deleted: ", dispatcher_queues
 
     if not get_user_confirmation():
         return
 
-    for queue in queues.QUEUES:
+    for queue in dispatcher_queues:
         result = client.queue_delete(queue=queue)
         print "Deleting queue %s. Result: %s" % (queue, result)
 
@@ -433,7 +712,7 @@ def drain_queue(queue):
     if not queue:
         return
 
-    if queue not in queues.QUEUES:
+    if queue not in queues.get_queues(settings.DISPATCHER_SHARDS):
         print "Queue %s not configured" % queue
         return
 
@@ -472,15 +751,72 @@ def get_user_confirmation():
 
 
 def debug_mode():
+    if settings.DISPATCHER_SHARDS > 1:
+        supervise(debug=True)
+        return
     disp = Dispatcher(debug=True)
     disp.wait()
 
 
 def daemon_mode(opts):
+    if settings.DISPATCHER_SHARDS > 1:
+        supervise(debug=False)
+        return
     disp = Dispatcher(debug=False)
     disp.wait()
 
 
+def supervise(debug):
+    """Run the router and the processes of the shards.
+
+    The router and the process of each shard run as child processes, which
+    are restarted if they exit. The children are terminated when the
+    supervisor receives SIGTERM.
+
+    """
+    pid = os.getpid()
+    children = {}
+
+    def spawn(shard):
+        child = os.fork()
+        if child:
+            children[child] = shard
+            return
+        name = "router" if shard is None else "shard %d" % shard
+        setproctitle.setproctitle("%s (%s)" % (sys.argv[0], name))
+        try:
+            disp = Dispatcher(debug=debug, shard=shard, pid=pid)
+            disp.wait()
+        except Exception:
+            log.exception("Unknown error in %s", name)
+        finally:
+            os._exit(0)
+
+    def terminate(signum, frame):
+        raise SystemExit
+
+    signal.signal(signal.SIGTERM, terminate)
+    shards = settings.DISPATCHER_SHARDS
+    log.info("Starting router and %d shards", shards)
+    try:
+        for shard in [None] + range(shards):
+            spawn(shard)
+        while True:
+            child, status = os.wait()
+            shard = children.pop(child)
+            log.error("Process of %s exited with status %d. Restarting",
+                      "router" if shard is None else "shard %d" % shard,
+                      status)
+            time.sleep(PROCESS_RESTART_WAIT)
+            spawn(shard)
+    except (SystemExit, KeyboardInterrupt):
+        log.info("Terminating router and shards")
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+        for child in children:
+            os.waitpid(child, 0)
+
+
 def setup_logging(opts):
     try:
         from logging.config import dictConfig
@@ -505,6 +841,10 @@ def main():
         check_dispatcher_status(opts.pid_file)
         return
 
+    if opts.shard_status:
+        print_shard_status()
+        return
+
     # Special case for the clean up queues action
     if opts.purge_queues:
         purge_queues()
@@ -79,10 +79,13 @@ def allocate_ip_from_pools(pool_rows, userid, address=None, floating_ip=False):
     If an address is specified and does not belong to any of the pools,
     InvalidValue is raised.
 
+    Only the segment of the pool that the value is allocated from is locked,
+    so the pool rows do not have to be locked by the caller.
+
     """
     for pool_row in pool_rows:
-        pool = pool_row.pool
         try:
+            pool = pool_row.get_segment(address)
             value = pool.get(value=address)
             pool.save()
             subnet = pool_row.subnet
@@ -114,8 +117,8 @@ def allocate_ip(network, userid, address=None, floating_ip=False):
         raise faults.Conflict("Can not allocate IP while network '%s' is in"
                               " 'SNF:DRAINED' status" % network.id)
 
-    ip_pools = IPPoolTable.objects.select_for_update()\
-        .filter(subnet__network=network).order_by('id')
+    ip_pools = IPPoolTable.objects.filter(subnet__network=network)\
+                                  .order_by('id')
     try:
         return allocate_ip_from_pools(ip_pools, userid, address=address,
                                       floating_ip=floating_ip)
@@ -139,7 +142,7 @@ def allocate_public_ip(userid, floating_ip=False, backend=None, networks=None):
     be used.
 
     """
-    ip_pool_rows = IPPoolTable.objects.select_for_update()\
+    ip_pool_rows = IPPoolTable.objects\
         .prefetch_related("subnet__network")\
         .filter(subnet__deleted=False)\
         .filter(subnet__network__deleted=False)\
@@ -153,6 +156,7 @@ def allocate_public_ip(userid, floating_ip=False, backend=None, networks=None):
     if backend is not None:
         ip_pool_rows = ip_pool_rows\
             .filter(subnet__network__backend_networks__backend=backend)
+    ip_pool_rows = ip_pool_rows.order_by("id")
 
     try:
         return allocate_ip_from_pools(ip_pool_rows, userid,
@@ -20,11 +20,11 @@ the state of the Ganeti backend. See docstring on top of
 logic/reconciliation.py for a description of reconciliation rules.
 
 """
-import sys
 import logging
-import subprocess
 from optparse import make_option
 
+from django.core.management.base import CommandError
+
 from snf_django.management.commands import SynnefoCommand
 from synnefo.management.common import get_resource
 from synnefo.logic import reconciliation
@@ -44,8 +44,31 @@ class Command(SynnefoCommand):
                     default="True",
                     choices=["True", "False"],
                     metavar="True|False",
-                    help="Perform server reconciliation for each backend"
-                         " parallel."),
+                    help="Fetch the state of the servers from the"
+                         " backends in parallel."),
+        make_option("--workers", dest="workers", type="int", default=8,
+                    help="Maximum number of backends to fetch the state of"
+                         " in parallel (default: 8)."),
+        make_option("--timeout", dest="timeout", type="int", default=600,
+                    help="Skip backends whose state is not fetched within"
+                         " this many seconds. Use 0 to wait forever"
+                         " (default: 600). In incremental mode, fetching"
+                         " the jobs of the backends is not bounded by this"
+                         " timeout."),
+        make_option("--incremental", action="store_true",
+                    dest="incremental", default=False,
+                    help="Reconcile only the servers targeted by the Ganeti"
+                         " jobs submitted since the previous incremental"
+                         " reconciliation, with a full reconciliation every"
+                         " --full-reconciliation-interval seconds. The"
+                         " reconciliation state is only saved if all"
+                         " inconsistencies are fixed, e.g. with --fix-all."),
+        make_option("--full-reconciliation-interval", type="int",
+                    dest="full_reconciliation_interval",
+                    default=reconciliation.FULL_RECONCILIATION_INTERVAL,
+                    help="Maximum time between full reconciliations in"
+                         " incremental mode (default: %d)." %
+                         reconciliation.FULL_RECONCILIATION_INTERVAL),
         make_option('--fix-stale', action='store_true', dest='fix_stale',
                     default=False, help='Fix (remove) stale DB entries in DB'),
         make_option('--fix-orphans', action='store_true', dest='fix_orphans',
@@ -91,16 +114,12 @@ class Command(SynnefoCommand):
         else:
             backends = reconciliation.get_online_backends()
 
-        parallel = parse_bool(options["parallel"])
-        if parallel and len(backends) > 1:
-            cmd = sys.argv
-            processes = []
-            for backend in backends:
-                p = subprocess.Popen(cmd + ["--backend-id=%s" % backend.id])
-                processes.append(p)
-            for p in processes:
-                p.wait()
-            return
+        workers = options["workers"]
+        if workers <= 0:
+            raise CommandError("The number of workers must be positive")
+        if not parse_bool(options["parallel"]):
+            workers = 1
+        timeout = options["timeout"] or None
 
         verbosity = int(options["verbosity"])
 
@@ -112,7 +131,7 @@ class Command(SynnefoCommand):
         log_handler.setFormatter(formatter)
         if verbosity == 2:
             formatter =\
-                logging.Formatter("%(asctime)s [%(process)d]: %(message)s")
+                logging.Formatter("%(asctime)s [%(threadName)s]: %(message)s")
             log_handler.setFormatter(formatter)
             logger.setLevel(logging.DEBUG)
         elif verbosity == 1:
@@ -124,8 +143,9 @@ class Command(SynnefoCommand):
 
         self._process_args(options)
 
-        for backend in backends:
-            r = reconciliation.BackendReconciler(backend=backend,
-                                                 logger=logger,
-                                                 options=options)
-            r.reconcile()
+        skipped = reconciliation.reconcile_backends(
+            backends, logger=logger, options=options, workers=workers,
+            timeout=timeout)
+        if skipped:
+            raise CommandError("Failed to reconcile backends: %s" %
+                               ", ".join(map(str, skipped)))
@@ -78,6 +78,13 @@ class Command(SynnefoCommand):
         make_option("--json-file",
                     dest="json_file",
                     help="Pretty print statistics from a JSON file."),
+        make_option("--update-snapshot",
+                    dest="update_snapshot",
+                    action="store_true",
+                    default=False,
+                    help="Compute all statistics and store them in the"
+                         " snapshot that is served by the statistics API"
+                         " (see CYCLADES_STATS_SNAPSHOT_MAX_AGE)"),
     )
 
     def handle(self, *args, **options):
@@ -96,7 +103,13 @@ class Command(SynnefoCommand):
             ip_pools = False
             networks = False
 
-        if options["json_file"] is None:
+        if options["update_snapshot"]:
+            if backend is not None or options["json_file"] is not None:
+                raise CommandError("Option '--update-snapshot' cannot be"
+                                   " combined with '--backend' or"
+                                   " '--json-file'.")
+            stats = statistics.update_stats_snapshot()
+        elif options["json_file"] is None:
             stats = statistics.get_cyclades_stats(backend, clusters, servers,
                                                   ip_pools, networks, images)
         else:
@@ -56,6 +56,10 @@ BINDINGS = (
 )
 
 
+# Queues whose messages are split into shards, when snf-dispatcher runs with
+# more than one shard.
+SHARDED_QUEUES = QUEUES
+
 ## Extra for DEBUG:
 if DEBUG is True:
     # Debug queue, retrieves all messages
@@ -74,6 +78,36 @@ def convert_exchange_to_dead(exchange):
     return exchange + "-dl"
 
 
+def get_shard_queue(queue, shard):
+    """Return the name of the queue of a shard of a queue.
+
+    When snf-dispatcher runs with more than one shard, the messages of each
+    queue are forwarded to the queues of its shards.
+
+    """
+    return "%s-shard-%d" % (queue, shard)
+
+
+def get_shard_routing_key(routing_key, shard):
+    """Return the routing key of the messages of a shard of a queue"""
+    return "%s.shard.%d" % (routing_key, shard)
+
+
+def get_queues(shards=1):
+    """Return the queues of snf-dispatcher, including the queues of its
+    shards when it runs with more than one shard.
+
+    The queues of shards that are no longer configured, e.g. after
+    decreasing the number of shards, are not included.
+
+    """
+    if shards <= 1:
+        return QUEUES
+    return QUEUES + tuple(get_shard_queue(queue, shard)
+                          for queue in SHARDED_QUEUES
+                          for shard in range(shards))
+
+
 EVENTD_HEARTBEAT_ROUTING_KEY = "eventd.heartbeat"
 
 
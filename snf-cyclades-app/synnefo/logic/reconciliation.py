@@ -35,6 +35,11 @@ In the code, D, G are Python dicts mapping instance ids to operating state.
 For D, the operating state is chosen from VirtualMachine.OPER_STATES.
 For G, the operating state is True if the machine is up, False otherwise.
 
+In incremental mode, only the servers that are the target of the Ganeti jobs
+submitted since the previous reconciliation of the backend are reconciled. A
+full reconciliation is still performed periodically, to catch changes that
+were not made through Ganeti jobs.
+
 """
 
 
@@ -44,7 +49,10 @@ import logging
 import itertools
 import bitarray
 import json
+import threading
+from collections import deque
 from datetime import datetime, timedelta
+from time import time
 import os
 
 from synnefo.api.util import COMPUTE_API_TAG_PREFIXES
@@ -65,6 +73,14 @@ logging.basicConfig()
 
 BUILDING_NIC_TIMEOUT = timedelta(seconds=120)
 
+# Maximum time between two full reconciliations of a backend, in incremental
+# mode
+FULL_RECONCILIATION_INTERVAL = 3600
+
+# Above this number of servers, instances are fetched from Ganeti in bulk
+# even in incremental mode
+INCREMENTAL_MAX_SERVERS = 100
+
 
 class BackendReconciler(object):
     def __init__(self, backend, logger, options=None):
@@ -80,29 +96,116 @@ class BackendReconciler(object):
         self.backend.put_client(self.client)
 
     def reconcile(self):
-        log = self.log
-        backend = self.backend
-        log.debug("Reconciling backend %s", backend)
+        self.get_database_state()
+        self.get_ganeti_state()
+        self.reconcile_state()
+
+    def get_database_state(self):
+        self.log.debug("Reconciling backend %s", self.backend)
 
         self.event_time = datetime.now()
 
-        self.db_servers = get_database_servers(backend)
+        # In incremental mode, the jobs are fetched before reading the
+        # servers from the DB, to find out which servers to reconcile. The
+        # instances are still fetched after reading the DB, so that Ganeti is
+        # never found to be behind the DB.
+        self.incremental = False
+        self.server_ids = None
+        if self.options.get("incremental"):
+            self.gnt_jobs = get_ganeti_jobs(self.backend)
+            self.incremental = self.can_reconcile_incrementally()
+        if self.incremental:
+            self.server_ids = get_job_servers(self.gnt_jobs,
+                                              self.backend.reconciled_job_id)
+            self.log.debug("Reconciling incrementally %d servers of backend"
+                           " %s", len(self.server_ids), self.backend)
+
+        self.db_servers = get_database_servers(self.backend, self.server_ids)
         self.db_servers_keys = set(self.db_servers.keys())
-        log.debug("Got servers info from database.")
+        self.log.debug("Got servers info from database.")
 
-        self.gnt_servers = get_ganeti_servers(backend)
+    def get_ganeti_state(self):
+        """Fetch the servers and jobs of the backend over RAPI.
+
+        This does not access the DB, so that it can run in a separate thread.
+
+        """
+        self.gnt_servers = get_ganeti_servers(self.backend, self.server_ids)
         self.gnt_servers_keys = set(self.gnt_servers.keys())
-        log.debug("Got servers info from Ganeti backend.")
+        self.log.debug("Got servers info from Ganeti backend %s.",
+                       self.backend)
 
-        self.gnt_jobs = get_ganeti_jobs(backend)
-        log.debug("Got jobs from Ganeti backend")
+        if not self.incremental:
+            self.gnt_jobs = get_ganeti_jobs(self.backend)
+            self.log.debug("Got jobs from Ganeti backend %s.", self.backend)
+
+    def can_reconcile_incrementally(self):
+        backend = self.backend
+        if backend.reconciled_job_id is None or \
+           backend.fully_reconciled is None:
+            return False
+        interval = self.options.get("full_reconciliation_interval",
+                                    FULL_RECONCILIATION_INTERVAL)
+        if self.event_time - backend.fully_reconciled > \
+           timedelta(seconds=interval):
+            return False
+        if self.gnt_jobs and \
+           min(self.gnt_jobs) > backend.reconciled_job_id + 1:
+            self.log.info("Jobs of backend %s have been archived before being"
+                          " reconciled.", backend)
+            return False
+        return True
+
+    def save_reconciliation_state(self):
+        """Record the jobs that have been reconciled.
+
+        Jobs that had not finished before the reconciliation started may not
+        be reflected in the state of the instances, so the next incremental
+        reconciliation will start from the first of them.
 
+        """
+        job_id = self.backend.reconciled_job_id or 0
+        unfinished = [j_id for j_id, job in self.gnt_jobs.items()
+                      if job["status"] not in rapi.JOB_STATUS_FINALIZED or
+                      job["end_ts"] is None or
+                      merge_time(job["end_ts"]) >= self.event_time]
+        if unfinished:
+            job_id = min(unfinished) - 1
+        elif self.gnt_jobs:
+            job_id = max(self.gnt_jobs)
+
+        state = {"reconciled_job_id": job_id}
+        if not self.incremental:
+            state["fully_reconciled"] = self.event_time
+        Backend.objects.filter(id=self.backend.id).update(**state)
+        for field, value in state.items():
+            setattr(self.backend, field, value)
+
+    def reconcile_state(self):
         self.stale_servers = self.reconcile_stale_servers()
         self.orphan_servers = self.reconcile_orphan_servers()
         self.unsynced_servers = self.reconcile_unsynced_servers()
         self.unsynced_snapshots = self.reconcile_unsynced_snapshots()
+        if self.options.get("incremental"):
+            if self.fixes_all():
+                self.save_reconciliation_state()
+            else:
+                self.log.info("Not saving the reconciliation state of backend"
+                              " %s, since not all inconsistencies were"
+                              " fixed.", self.backend)
         self.close()
 
+    def fixes_all(self):
+        """Return whether all kinds of inconsistencies are fixed.
+
+        Otherwise, the servers reconciled by this run may still be out of
+        sync, and must be reconciled again by the next incremental run.
+
+        """
+        fixes = [value for key, value in self.options.items()
+                 if key.startswith("fix_") and key != "fix_all"]
+        return bool(fixes) and all(fixes)
+
     def get_build_status(self, db_server):
         """Return the status of the build job.
 
@@ -614,25 +717,111 @@ def hanging_networks(backend, GNets):
     return hanging
 
 
+class _GanetiStateFetcher(threading.Thread):
+    """Thread fetching the Ganeti state of a backend reconciler."""
+
+    def __init__(self, reconciler):
+        super(_GanetiStateFetcher, self).__init__(
+            name="reconcile-%s" % reconciler.backend.id)
+        self.daemon = True
+        self.reconciler = reconciler
+        self.error = None
+        self.start_time = time()
+        self.end_time = None
+
+    def run(self):
+        try:
+            self.reconciler.get_ganeti_state()
+        except Exception as e:
+            self.error = e
+        self.end_time = time()
+
+
+def reconcile_backends(backends, logger, options=None, workers=1,
+                       timeout=None):
+    """Reconcile the servers of many backends.
+
+    The state of the servers is fetched from the Ganeti backends
+    concurrently, from up to 'workers' backends at a time, while the servers
+    of the backends that have been fetched are reconciled in the calling
+    thread, one backend at a time. The servers of each backend are read from
+    the DB right before fetching them from Ganeti, as in
+    BackendReconciler.reconcile().
+
+    Backends whose state is not fetched within 'timeout' seconds are skipped.
+    Their threads are left behind, as there is no way to interrupt them.
+
+    Return the list of the backends that were skipped.
+
+    """
+    skipped = []
+    fetchers = deque()
+
+    def reconcile_next():
+        fetcher = fetchers.popleft()
+        r = fetcher.reconciler
+        if timeout is None:
+            fetcher.join()
+        else:
+            fetcher.join(max(0, fetcher.start_time + timeout - time()))
+        if fetcher.is_alive():
+            logger.error("Timed out fetching the state of backend %s",
+                         r.backend)
+            skipped.append(r.backend)
+            r.close()
+            return
+        if fetcher.error is not None:
+            logger.error("Failed to fetch the state of backend %s: %s",
+                         r.backend, fetcher.error)
+            skipped.append(r.backend)
+            r.close()
+            return
+        start_time = time()
+        r.reconcile_state()
+        logger.info("Reconciled backend %s: fetched its state from Ganeti in"
+                    " %.2f seconds, reconciled it in %.2f seconds", r.backend,
+                    fetcher.end_time - fetcher.start_time, time() - start_time)
+
+    for backend in backends:
+        while len(fetchers) >= workers:
+            reconcile_next()
+        r = BackendReconciler(backend=backend, logger=logger, options=options)
+        r.get_database_state()
+        fetcher = _GanetiStateFetcher(r)
+        fetcher.start()
+        fetchers.append(fetcher)
+    while fetchers:
+        reconcile_next()
+
+    return skipped
+
+
 def get_online_backends():
     return Backend.objects.filter(offline=False)
 
 
-def get_database_servers(backend):
+def get_database_servers(backend, server_ids=None):
     servers = backend.virtual_machines.select_related("flavor")\
                                       .prefetch_related("nics__ips__subnet")\
                                       .filter(deleted=False)
+    if server_ids is not None:
+        servers = servers.filter(id__in=server_ids)
     return dict([(s.id, s) for s in servers])
 
 
-def get_ganeti_servers(backend):
-    gnt_instances = backend_mod.get_instances(backend)
+def get_ganeti_servers(backend, server_ids=None):
+    if server_ids is None or len(server_ids) > INCREMENTAL_MAX_SERVERS:
+        gnt_instances = backend_mod.get_instances(backend)
+    else:
+        names = map(utils.id_to_instance_name, server_ids)
+        gnt_instances = backend_mod.get_instances_by_name(backend, names)
     # Filter out non-synnefo instances
     snf_backend_prefix = settings.BACKEND_PREFIX_ID
     gnt_instances = filter(lambda i: i["name"].startswith(snf_backend_prefix),
                            gnt_instances)
     gnt_instances = map(parse_gnt_instance, gnt_instances)
-    return dict([(i["id"], i) for i in gnt_instances if i["id"] is not None])
+    return dict([(i["id"], i) for i in gnt_instances if i["id"] is not None
+                 and (server_ids is None or i["id"] in server_ids)])
 
 
 def parse_gnt_instance(instance):
@@ -713,6 +902,24 @@ def get_ganeti_jobs(backend):
     return dict([(int(j["id"]), j) for j in gnt_jobs])
 
 
+def get_job_servers(gnt_jobs, after_job_id):
+    """Return the IDs of the servers targeted by the jobs after a job."""
+    snf_backend_prefix = settings.BACKEND_PREFIX_ID
+    server_ids = set()
+    for job_id, job in gnt_jobs.items():
+        if job_id <= after_job_id:
+            continue
+        for op in job.get("ops") or []:
+            name = op.get("instance_name")
+            if not name or not name.startswith(snf_backend_prefix):
+                continue
+            try:
+                server_ids.add(utils.id_from_instance_name(name))
+            except VirtualMachine.InvalidBackendIdError:
+                logger.error("Ignoring instance with malformed name %s", name)
+    return server_ids
+
+
 class NetworkReconciler(object):
     def __init__(self, logger, fix=False):
         self.log = logger
@@ -8,3 +8,4 @@ from .reconciliation import *
 from .callbacks import *
 from .allocators import *
 from .queues import *
+from .dispatcher import *
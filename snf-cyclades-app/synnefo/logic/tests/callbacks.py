@@ -30,6 +30,7 @@ from mock import patch
 from synnefo.api.util import allocate_resource
 from synnefo.logic.callbacks import (update_db, update_network,
                                      update_build_progress)
+from synnefo.logic.backend import process_op_status
 from snf_django.utils.testing import mocked_quotaholder
 from synnefo.logic.rapi import GanetiApiError
 from synnefo.db import transaction
@@ -530,6 +531,52 @@ class UpdateDBTest(TransactionTestCase):
         self.assertTrue(client.basic_ack.called)
         self.assertEqual(len(db_vm.tags.all()), 3)
 
+    @patch("synnefo.logic.backend.process_op_status",
+           wraps=process_op_status)
+    def test_batch(self, process, client):
+        vm1 = mfactory.VirtualMachineFactory(operstate="STOPPED")
+        vm2 = mfactory.VirtualMachineFactory(operstate="STARTED")
+        t = time()
+        messages = [
+            self.create_msg(operation='OP_INSTANCE_STARTUP', jobId=1,
+                            instance=vm1.backend_vm_id, status="running",
+                            event_time=split_time(t)),
+            self.create_msg(operation='OP_INSTANCE_SHUTDOWN', jobId=2,
+                            instance=vm2.backend_vm_id,
+                            event_time=split_time(t + 1)),
+            {'body': ''},
+            self.create_msg(operation='OP_INSTANCE_STARTUP', jobId=1,
+                            instance=vm1.backend_vm_id,
+                            event_time=split_time(t + 2)),
+        ]
+        with mocked_quotaholder():
+            update_db.batch(client, messages)
+        # The progress update of job 1 is superseded by its final status
+        self.assertEqual(process.call_count, 2)
+        self.assertEqual(client.basic_ack.call_count, 3)
+        self.assertEqual(client.basic_nack.call_count, 1)
+        self.assertEqual(VirtualMachine.objects.get(id=vm1.id).operstate,
+                         "STARTED")
+        self.assertEqual(VirtualMachine.objects.get(id=vm2.id).operstate,
+                         "STOPPED")
+
+        # A failing message is rejected without affecting the others
+        client.reset_mock()
+        process.reset_mock()
+        messages = [
+            self.create_msg(operation='OP_INSTANCE_SHUTDOWN', jobId=3,
+                            instance=vm1.backend_vm_id,
+                            event_time=split_time(t + 3)),
+            self.create_msg(operation='OP_INSTANCE_STARTUP', jobId=4,
+                            instance=vm1.backend_vm_id,
+                            event_time=split_time(t + 4)),
+        ]
+        process.side_effect = [Exception, None]
+        with mocked_quotaholder():
+            update_db.batch(client, messages)
+        self.assertEqual(client.basic_reject.call_count, 1)
+        self.assertEqual(client.basic_ack.call_count, 1)
+
 
 @patch('synnefo.lib.amqp.AMQPClient')
 class UpdateNetTest(TransactionTestCase):
@@ -0,0 +1,229 @@
+# Copyright (C) 2010-2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch, call, MagicMock, Mock
+
+from synnefo.logic import dispatcher, queues
+from synnefo import settings
+
+SHARDS = 4
+
+
+def make_body(**kwargs):
+    return json.dumps(dict({"type": "ganeti-op-status"}, **kwargs))
+
+
+class MessageShardTest(TestCase):
+    def test_stable(self):
+        for key in ("instance", "network", "cluster"):
+            for name in ("snf-1", "snf-2", "snf-net-3", "ganeti1"):
+                shard = dispatcher.get_message_shard(
+                    make_body(**{key: name}), SHARDS)
+                self.assertTrue(0 <= shard < SHARDS)
+                # Other fields of the message do not affect the shard
+                for other in range(5):
+                    self.assertEqual(
+                        dispatcher.get_message_shard(
+                            make_body(jobId=other, **{key: name}), SHARDS),
+                        shard)
+
+    def test_spread(self):
+        shards = set(dispatcher.get_message_shard(
+            make_body(instance="snf-%d" % i), SHARDS) for i in range(100))
+        self.assertEqual(shards, set(range(SHARDS)))
+
+    def test_malformed(self):
+        shard = dispatcher.get_message_shard(make_body(), SHARDS)
+        for body in ("", "not json", "[1, 2]", "null", make_body(job=1),
+                     make_body(instance=None), make_body(instance=5)):
+            self.assertEqual(dispatcher.get_message_shard(body, SHARDS),
+                             shard)
+
+
+class RouteMessageTest(TestCase):
+    def test_route(self):
+        client = MagicMock()
+        body = make_body(instance="snf-1")
+        msg = {"body": body}
+        shard = dispatcher.get_message_shard(body, SHARDS)
+        dispatcher.route_message(queues.KEY_OP, SHARDS, client, msg)
+        # The message is acknowledged after it has been forwarded
+        self.assertEqual(client.mock_calls, [
+            call.basic_publish(settings.EXCHANGE_GANETI,
+                               "%s.shard.%d" % (queues.KEY_OP, shard), body),
+            call.basic_ack(msg)])
+
+    def test_publish_failure(self):
+        client = MagicMock()
+        client.basic_publish.side_effect = Exception("Failed")
+        msg = {"body": make_body(instance="snf-1")}
+        self.assertRaises(Exception, dispatcher.route_message, queues.KEY_OP,
+                          SHARDS, client, msg)
+        self.assertFalse(client.basic_ack.called)
+
+
+@override_settings(DISPATCHER_SHARDS=SHARDS, DISPATCHER_BATCH_SIZE=1)
+@patch("synnefo.logic.dispatcher.AMQPClient")
+class DispatcherInitTest(TestCase):
+    def queues(self, method):
+        """Return the queues that a method of the client was called for."""
+        return [kwargs["queue"] for _, kwargs in method.call_args_list]
+
+    def test_shard(self, client):
+        d = dispatcher.Dispatcher(shard=2, pid=42)
+        self.assertFalse(d.is_router)
+        expected = [queues.get_shard_queue(queue, 2)
+                    for queue, _, _, _ in queues.BINDINGS
+                    if queue in queues.SHARDED_QUEUES]
+        self.assertEqual(self.queues(client().basic_consume), expected)
+        request_queue = queues.get_dispatcher_request_queue(
+            dispatcher.get_hostname(), 42)
+        declared = self.queues(client().queue_declare)
+        self.assertFalse(request_queue in declared)
+
+    def test_router(self, client):
+        d = dispatcher.Dispatcher(pid=42)
+        self.assertTrue(d.is_router)
+        request_queue = queues.get_dispatcher_request_queue(
+            dispatcher.get_hostname(), 42)
+        self.assertEqual(self.queues(client().basic_consume),
+                         [queue for queue, _, _, _ in queues.BINDINGS] +
+                         [request_queue])
+        for _, kwargs in client().basic_consume.call_args_list:
+            if kwargs["queue"] in queues.SHARDED_QUEUES:
+                self.assertEqual(kwargs["callback"].func,
+                                 dispatcher.route_message)
+        # The queues of all shards are declared
+        declared = self.queues(client().queue_declare)
+        for queue in queues.get_queues(SHARDS):
+            self.assertTrue(queue in declared)
+
+    @patch("sys.stdout")
+    @patch("synnefo.logic.dispatcher.get_user_confirmation")
+    def test_purge_queues(self, confirm, stdout, client):
+        confirm.return_value = True
+        dispatcher.purge_queues()
+        self.assertEqual(self.queues(client().queue_delete),
+                         list(queues.get_queues(SHARDS)))
+
+
+@override_settings(DISPATCHER_SHARDS=1, DISPATCHER_BATCH_SIZE=4)
+@patch("synnefo.logic.dispatcher.AMQPClient")
+class DispatcherBatchTest(TestCase):
+    def setUp(self):
+        self.messages = [{"body": make_body(instance="snf-%d" % i)}
+                         for i in range(4)]
+
+    def dispatcher(self):
+        d = dispatcher.Dispatcher(pid=42)
+        d.client.client = "connection-1"
+        d.batches = [(Mock(), []), (Mock(), [])]
+        return d
+
+    def reconnect(self, d):
+        def reconnect(*args, **kwargs):
+            d.client.client = "connection-2"
+        return reconnect
+
+    def wait_effects(self, *effects):
+        effects = list(effects)
+
+        def basic_wait(*args, **kwargs):
+            if not effects:
+                raise KeyboardInterrupt()
+            return effects.pop(0)(*args, **kwargs)
+        return basic_wait
+
+    def test_process(self, client):
+        d = self.dispatcher()
+        (handler1, messages1), (handler2, messages2) = d.batches
+        for msg in self.messages[:3]:
+            d.buffer_message(messages1, d.client, msg)
+        d.buffer_message(messages2, d.client, self.messages[3])
+        d.process_batches()
+        self.assertEqual(handler1.call_args[0][1], self.messages[:3])
+        self.assertEqual(handler2.call_args[0][1], self.messages[3:])
+        self.assertEqual(messages1 + messages2, [])
+        # Messages are acknowledged through the client
+        batch_client = handler1.call_args[0][0]
+        batch_client.basic_ack(self.messages[0])
+        d.client.basic_ack.assert_called_once_with(self.messages[0])
+
+    def test_reconnect_while_collecting(self, client):
+        d = self.dispatcher()
+        (handler1, messages1), (handler2, messages2) = d.batches
+        for msg in self.messages[:2]:
+            d.buffer_message(messages1, d.client, msg)
+        d.client.basic_wait.side_effect = self.reconnect(d)
+        d.process_batches()
+        self.assertFalse(handler1.called)
+        self.assertEqual(messages1, [])
+
+        # Messages from the new connection are processed
+        d.client.basic_wait.side_effect = None
+        d.buffer_message(messages2, d.client, self.messages[2])
+        d.process_batches()
+        self.assertFalse(handler1.called)
+        self.assertEqual(handler2.call_args[0][1], self.messages[2:3])
+
+    def test_reconnect_on_new_message(self, client):
+        d = self.dispatcher()
+        (handler1, messages1), (handler2, messages2) = d.batches
+        d.buffer_message(messages1, d.client, self.messages[0])
+        d.client.client = "connection-2"
+        d.buffer_message(messages2, d.client, self.messages[1])
+        self.assertEqual(messages1, [])
+        self.assertEqual(messages2, self.messages[1:2])
+
+    def test_reconnect_while_processing(self, client):
+        d = self.dispatcher()
+        messages1, messages2 = d.batches[0][1], d.batches[1][1]
+        handler2 = d.batches[1][0]
+
+        def handler1(batch_client, batch):
+            for msg in batch:
+                batch_client.basic_ack(msg)
+        d.batches[0] = (handler1, messages1)
+        for msg in self.messages[:3]:
+            d.buffer_message(messages1, d.client, msg)
+        d.buffer_message(messages2, d.client, self.messages[3])
+
+        # The connection breaks while acknowledging the first message
+        d.client.basic_ack.side_effect = self.reconnect(d)
+        d.process_batches()
+        self.assertEqual(d.client.basic_ack.call_args_list,
+                         [call(self.messages[0])])
+        self.assertFalse(handler2.called)
+        self.assertEqual(messages1 + messages2, [])
+
+    @patch("synnefo.logic.dispatcher.close_connection")
+    @patch("synnefo.logic.dispatcher.time")
+    def test_wait_connection_error(self, time, close_connection, client):
+        d = self.dispatcher()
+        handler1, messages1 = d.batches[0]
+        d.buffer_message(messages1, d.client, self.messages[0])
+
+        def connection_error(*args, **kwargs):
+            d.client.client = None
+            raise dispatcher.AMQPConnectionError("Connection failed")
+        d.client.basic_wait.side_effect = self.wait_effects(connection_error)
+        d.wait()
+        self.assertEqual(messages1, [])
+        self.assertFalse(handler1.called)
+        self.assertTrue(time.sleep.called)
@@ -53,3 +53,19 @@ class QueuesTest(TestCase):
         )
 
         self.assertEqual(expected, converted)
+
+    def test_get_shard_queue(self):
+        self.assertEqual(queues.get_shard_queue(self.queue, 3),
+                         self.queue + "-shard-3")
+        self.assertEqual(queues.get_shard_routing_key("ganeti.event.op", 3),
+                         "ganeti.event.op.shard.3")
+
+    def test_get_queues(self):
+        self.assertEqual(queues.get_queues(), queues.QUEUES)
+        self.assertEqual(queues.get_queues(1), queues.QUEUES)
+        all_queues = queues.get_queues(2)
+        self.assertEqual(all_queues[:len(queues.QUEUES)], queues.QUEUES)
+        self.assertEqual(
+            set(all_queues[len(queues.QUEUES):]),
+            set([queues.get_shard_queue(queue, shard)
+                 for queue in queues.SHARDED_QUEUES for shard in (0, 1)]))
@@ -14,13 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
+import threading
 from django.test import TransactionTestCase
 
-from synnefo.db.models import (VirtualMachine, Network, BackendNetwork,
-                               RescueImage)
+from synnefo.db.models import (Backend, VirtualMachine, Network,
+                               BackendNetwork, RescueImage)
 from synnefo.api.util import COMPUTE_API_TAG_USER_PREFIX
 from synnefo.db import models_factory as mfactory
 from synnefo.logic import reconciliation
+from synnefo.logic.rapi import GanetiApiError
 from mock import patch
 from snf_django.utils.testing import mocked_quotaholder
 from time import time
@@ -107,6 +109,124 @@ class ServerReconciliationTest(TransactionTestCase):
         vm3 = VirtualMachine.objects.get(id=vm3.id)
         self.assertTrue(vm3.deleted)
 
+    def test_incremental_reconciliation(self, mrapi):
+        options = dict(self.reconciler.options, incremental=True)
+        reconciler = reconciliation.BackendReconciler(
+            self.backend, options=options, logger=logging.getLogger())
+        mrapi().GetInstances.return_value = []
+        mrapi().GetInstance.side_effect = GanetiApiError("Not found",
+                                                         code=404)
+
+        def job(job_id, vm=None):
+            ops = []
+            if vm is not None:
+                ops.append({"OP_ID": "OP_INSTANCE_STARTUP",
+                            "instance_name": vm.backend_vm_id})
+            return {"id": str(job_id), "status": "success",
+                    "end_ts": [44123, 1], "ops": ops}
+
+        # The first reconciliation is a full one
+        vm1 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             operstate="STARTED")
+        mrapi().GetJobs.return_value = [job(5)]
+        with mocked_quotaholder():
+            reconciler.reconcile()
+        self.assertTrue(VirtualMachine.objects.get(id=vm1.id).deleted)
+        self.assertEqual(self.backend.reconciled_job_id, 5)
+        self.assertIsNotNone(self.backend.fully_reconciled)
+
+        # Then only the servers targeted by new jobs are reconciled
+        vm2 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             operstate="STARTED")
+        vm3 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             operstate="STARTED")
+        mrapi().GetJobs.return_value = [job(5, vm2), job(6, vm3)]
+        mrapi().GetInstances.reset_mock()
+        with mocked_quotaholder():
+            reconciler.reconcile()
+        self.assertFalse(mrapi().GetInstances.called)
+        mrapi().GetInstance.assert_called_once_with(vm3.backend_vm_id)
+        self.assertFalse(VirtualMachine.objects.get(id=vm2.id).deleted)
+        self.assertTrue(VirtualMachine.objects.get(id=vm3.id).deleted)
+        self.assertEqual(self.backend.reconciled_job_id, 6)
+
+        # Until a full reconciliation is due
+        options["full_reconciliation_interval"] = 0
+        with mocked_quotaholder():
+            reconciler.reconcile()
+        self.assertTrue(mrapi().GetInstances.called)
+        self.assertTrue(VirtualMachine.objects.get(id=vm2.id).deleted)
+
+    def test_incremental_reconciliation_report_only(self, mrapi):
+        options = dict(self.reconciler.options, incremental=True,
+                       fix_stale=False)
+        reconciler = reconciliation.BackendReconciler(
+            self.backend, options=options, logger=logging.getLogger())
+        mrapi().GetInstances.return_value = []
+        mrapi().GetJobs.return_value = [{"id": "5", "status": "success",
+                                         "end_ts": [44123, 1], "ops": []}]
+
+        # The stale server is only reported, so the next run must check it
+        # again
+        vm1 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             operstate="STARTED")
+        with mocked_quotaholder():
+            reconciler.reconcile()
+        self.assertFalse(VirtualMachine.objects.get(id=vm1.id).deleted)
+        backend = Backend.objects.get(id=self.backend.id)
+        self.assertIsNone(backend.reconciled_job_id)
+        self.assertIsNone(backend.fully_reconciled)
+
+        options["fix_stale"] = True
+        with mocked_quotaholder():
+            reconciler.reconcile()
+        self.assertTrue(VirtualMachine.objects.get(id=vm1.id).deleted)
+        backend = Backend.objects.get(id=self.backend.id)
+        self.assertEqual(backend.reconciled_job_id, 5)
+        self.assertIsNotNone(backend.fully_reconciled)
+
+    def test_reconcile_backends(self, mrapi):
+        backends = [self.backend, mfactory.BackendFactory()]
+        options = self.reconciler.options
+        log = logging.getLogger()
+        mrapi().GetInstances.return_value = []
+        mrapi().GetJobs.return_value = []
+
+        def create_servers():
+            return [mfactory.VirtualMachineFactory(backend=backend,
+                                                   deleted=False,
+                                                   operstate="ACTIVE")
+                    for backend in backends]
+
+        # Stale servers of all backends are removed
+        vms = create_servers()
+        with mocked_quotaholder():
+            skipped = reconciliation.reconcile_backends(
+                backends, log, options, workers=2, timeout=10)
+        self.assertEqual(skipped, [])
+        for vm in vms:
+            self.assertTrue(VirtualMachine.objects.get(id=vm.id).deleted)
+
+        # Backends that cannot be fetched are skipped
+        vms = create_servers()
+        mrapi().GetInstances.side_effect = Exception("Failed")
+        skipped = reconciliation.reconcile_backends(backends, log, options)
+        self.assertEqual(skipped, backends)
+        for vm in vms:
+            self.assertFalse(VirtualMachine.objects.get(id=vm.id).deleted)
+
+        # And so are backends that cannot be fetched in time
+        event = threading.Event()
+        mrapi().GetInstances.side_effect = lambda *args, **kwargs: event.wait()
+        try:
+            skipped = reconciliation.reconcile_backends(
+                backends, log, options, workers=2, timeout=0.1)
+        finally:
+            event.set()
+        self.assertEqual(skipped, backends)
+        for vm in vms:
+            self.assertFalse(VirtualMachine.objects.get(id=vm.id).deleted)
+
     def test_orphan_server(self, mrapi):
         cmrapi = self.reconciler.client
         mrapi().GetInstances.return_value =\
@@ -397,35 +397,62 @@ class PlanktonBackend(object):
 
     # List functions
     def _list_images(self, user=None, filters=None, params=None,
-                     check_permissions=True):
+                     check_permissions=True, public=False):
+        """List the images that match the filters.
+
+        The Plankton metadata, size, owner and visibility filters are
+        applied by the Pithos backend, which also loads the permissions of
+        the matching images at once. The rest of the filters, the sorting
+        and the 'marker'/'limit' paging are applied on the matching images.
+
+        """
         filters = filters or {}
+        if params is None:
+            params = {}
+
+        meta = {}
+        for key in ("name", "container_format", "disk_format"):
+            if key in filters:
+                meta[PLANKTON_PREFIX + key] = smart_unicode(filters[key])
+        size_max = filters.get("size_max")
+        if size_max is not None:
+            # Pithos excludes the upper bound of the range
+            size_max += 1
+        size_range = (filters.get("size_min"), size_max)
+        is_public = True if public else filters.get("is_public")
 
-        # TODO: Use filters
-        # # Fix keys
-        # keys = [PLANKTON_PREFIX + 'name']
-        # size_range = (None, None)
-        # for key, val in filters.items():
-        #     if key == 'size_min':
-        #         size_range = (val, size_range[1])
-        #     elif key == 'size_max':
-        #         size_range = (size_range[0], val)
-        #     else:
-        #         keys.append('%s = %s' % (PLANKTON_PREFIX + key, val))
         _images = self.backend.get_domain_objects(
             domain=PLANKTON_DOMAIN, user=user,
-            check_permissions=check_permissions)
+            check_permissions=check_permissions,
+            account=filters.get("owner"), public=is_public is True,
+            meta=meta, size_range=size_range)
 
         images = []
         for (location, metadata, permissions) in _images:
             location = Location(*location.split("/", 2))
             images.append(image_to_dict(location, metadata, permissions))
 
-        if params is None:
-            params = {}
+        # The status of an image may be overridden by its Plankton metadata
+        if "status" in filters:
+            images = [img for img in images
+                      if img["status"] == filters["status"]]
+        if is_public is not None:
+            images = [img for img in images if img["is_public"] == is_public]
 
         key = itemgetter(params.get('sort_key', 'created_at'))
         reverse = params.get('sort_dir', 'desc') == 'desc'
         images.sort(key=key, reverse=reverse)
+
+        marker = params.get("marker")
+        if marker is not None:
+            ids = [img["id"] for img in images]
+            try:
+                images = images[ids.index(marker) + 1:]
+            except ValueError:
+                raise faults.BadRequest("Invalid marker '%s'" % marker)
+        limit = params.get("limit")
+        if limit is not None:
+            images = images[:limit]
         return images
 
     @handle_pithos_backend
@@ -436,15 +463,14 @@ class PlanktonBackend(object):
 
     @handle_pithos_backend
     def list_shared_images(self, member, filters=None, params=None):
-        images = self._list_images(user=self.user, filters=filters,
-                                   params=params)
-        is_shared = lambda img: not img["is_public"] and img["owner"] == member
-        return filter(is_shared, images)
+        filters = dict(filters or {}, owner=member, is_public=False)
+        return self._list_images(user=self.user, filters=filters,
+                                 params=params)
 
     @handle_pithos_backend
     def list_public_images(self, filters=None, params=None):
-        images = self._list_images(user=None, filters=filters, params=params)
-        return filter(lambda img: img["is_public"], images)
+        return self._list_images(user=None, filters=filters, params=params,
+                                 check_permissions=False, public=True)
 
     # Snapshots
     @handle_pithos_backend
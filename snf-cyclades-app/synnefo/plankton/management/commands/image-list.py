@@ -43,10 +43,9 @@ class Command(SynnefoCommand):
         check_perm = user is not None
 
         with PlanktonBackend(user) as backend:
-            images = backend.list_images(user, check_permissions=check_perm)
-            if options["public"]:
-                images = filter(lambda x: x['is_public'], images)
-            images.sort(key=lambda x: x['created_at'], reverse=True)
+            filters = {"is_public": True} if options["public"] else None
+            images = backend.list_images(filters,
+                                         check_permissions=check_perm)
 
         headers = ("id", "name", "user.uuid", "public", "snapshot")
         table = []
@@ -21,6 +21,7 @@ from functools import wraps
 from copy import deepcopy
 from decimal import Decimal
 from snf_django.utils.testing import BaseAPITest
+from synnefo.plankton.backend import PlanktonBackend
 from synnefo.cyclades_settings import cyclades_services
 from synnefo.lib.services import get_service_path
 from synnefo.lib import join_urls
@@ -30,6 +31,23 @@ PLANKTON_URL = get_service_path(cyclades_services, 'image',
 IMAGES_URL = join_urls(PLANKTON_URL, "images/")
 
 
+def pithos_image(uuid, name, timestamp, readers=("*",)):
+    """Return an image as listed by get_domain_objects."""
+    return ("img_owner/images/%s" % name,
+            {"uuid": uuid,
+             "bytes": 42,
+             "is_snapshot": False,
+             "hash": "unique_mapfile",
+             "mapfile": "unique_mapfile",
+             "version": 42,
+             "version_timestamp": Decimal(timestamp),
+             "plankton:name": name,
+             "plankton:container_format": "bare",
+             "plankton:disk_format": "diskdump",
+             "plankton:status": u"AVAILABLE"},
+            {"read": list(readers)})
+
+
 def assert_backend_closed(func):
     @wraps(func)
     def wrapper(self, backend):
@@ -322,3 +340,47 @@ class PlanktonTest(BaseAPITest):
     def test_list_images_filters_error_1(self, backend):
         response = self.get(join_urls(IMAGES_URL, "?size_max="))
         self.assertBadRequest(response)
+
+    def test_list_images(self, backend):
+        backend().get_domain_objects.return_value = [
+            pithos_image("img1", "image1", "1392487851"),
+            pithos_image("img2", "image2", "1392487852"),
+            pithos_image("img3", "image3", "1392487853")]
+
+        response = self.get(join_urls(
+            IMAGES_URL, "detail?name=image&disk_format=diskdump&size_min=10"
+                        "&size_max=100&owner=img_owner&is_public=true"
+                        "&sort_key=name&sort_dir=asc&marker=img1&limit=1"))
+        self.assertSuccess(response)
+        images = json.loads(response.content)["images"]
+        self.assertEqual([img["id"] for img in images], ["img2"])
+        backend().get_domain_objects.assert_called_once_with(
+            domain="plankton", user="user", check_permissions=True,
+            account="img_owner", public=True,
+            meta={"plankton:name": "image",
+                  "plankton:disk_format": "diskdump"},
+            size_range=(10, 101))
+
+        response = self.get(join_urls(IMAGES_URL, "?marker=nonexistent"))
+        self.assertBadRequest(response)
+        response = self.get(join_urls(IMAGES_URL, "?limit=-1"))
+        self.assertBadRequest(response)
+
+    def test_list_shared_images(self, backend):
+        backend().get_domain_objects.return_value = [
+            pithos_image("img1", "image1", "1392487851", ["member"]),
+            pithos_image("img2", "image2", "1392487852"),
+            pithos_image("img3", "image3", "1392487853", ["member"]),
+            pithos_image("img4", "image4", "1392487854", ["member"])]
+        params = {"sort_key": "name", "sort_dir": "asc", "limit": 2}
+        with PlanktonBackend("user") as b:
+            # Public images are filtered out before paging
+            images = b.list_shared_images("member", params=params)
+            self.assertEqual([img["id"] for img in images], ["img1", "img3"])
+            params["marker"] = "img3"
+            images = b.list_shared_images("member", params=params)
+            self.assertEqual([img["id"] for img in images], ["img4"])
+        backend().get_domain_objects.assert_called_with(
+            domain="plankton", user="user", check_permissions=True,
+            account="member", public=False, meta={},
+            size_range=(None, None))
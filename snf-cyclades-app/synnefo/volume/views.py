@@ -176,10 +176,13 @@ def list_volumes(request, detail=False):
 
     volumes = utils.filter_modified_since(request, objects=volumes)
 
-    volumes = [volume_to_dict(v, detail) for v in volumes]
+    marker, limit = utils.get_list_limits(request)
+    batches = utils.iter_batches(
+        volumes, marker, limit,
+        batch_size=settings.CYCLADES_API_LIST_BATCH_SIZE)
+    batches = ([volume_to_dict(v, detail) for v in batch] for batch in batches)
 
-    data = json.dumps({'volumes': volumes})
-    return HttpResponse(data, content_type="application/json", status=200)
+    return utils.json_list_response('volumes', batches)
 
 
 @api.api_method(http_method="DELETE", user_required=True, logger=log)
@@ -15,9 +15,11 @@
 
 import datetime
 from dateutil.parser import parse as date_parse
+from itertools import chain
 import json
 
 from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from snf_django.lib.api import faults
 
 
@@ -115,13 +117,88 @@ def filter_modified_since(request, objects):
     since = isoparse(request.GET.get("changes-since"))
     if since:
         modified_objs = objects.filter(updated__gte=since)
-        if not modified_objs:
+        if not modified_objs.exists():
             raise faults.NotModified()
         return modified_objs
     else:
         return objects.filter(deleted=False)
 
 
+def get_list_limits(request):
+    """Get the 'marker' and 'limit' request parameters of a listing.
+
+    'marker' is the id of the last object of the previous page and 'limit' the
+    maximum number of objects to return. Either may be None.
+
+    """
+    marker = request.GET.get("marker")
+    limit = request.GET.get("limit")
+    try:
+        if marker is not None:
+            marker = int(marker)
+        if limit is not None:
+            limit = int(limit)
+            if limit < 0:
+                raise ValueError
+    except ValueError:
+        raise faults.BadRequest("Invalid marker or limit parameter.")
+    return marker, limit
+
+
+def iter_batches(objects, marker=None, limit=None, batch_size=1000,
+                 load=list):
+    """Iterate over a QuerySet ordered by id, in batches.
+
+    Each batch is fetched with a separate query for the objects after the
+    last id of the previous one, so that at most 'batch_size' objects are
+    in memory at a time. 'load' is called on the sliced QuerySet of each
+    batch and must return a list of its objects, e.g. after prefetching
+    related objects for them.
+
+    """
+    while limit is None or limit > 0:
+        size = batch_size if limit is None else min(batch_size, limit)
+        batch = objects if marker is None else objects.filter(id__gt=marker)
+        batch = load(batch[:size])
+        if batch:
+            yield batch
+        if len(batch) < size:
+            return
+        marker = batch[-1].id
+        if limit is not None:
+            limit -= len(batch)
+
+
+def _stream_json_list(name, batches):
+    yield '{%s: [' % json.dumps(name)
+    separator = ''
+    for batch in batches:
+        if batch:
+            yield separator + ', '.join(json.dumps(d) for d in batch)
+            separator = ', '
+    yield ']}'
+
+
+def json_list_response(name, batches, status=200):
+    """Return a response with a JSON object mapping 'name' to the list of
+    the dictionaries in 'batches'.
+
+    'batches' is an iterable of lists of dictionaries. If there is more than
+    one of them, the response is streamed one batch at a time, so that the
+    whole list is never in memory. Note that errors while streaming can no
+    longer be reported to the client as API faults.
+
+    """
+    batches = iter(batches)
+    first = next(batches, [])
+    second = next(batches, None)
+    if second is None:
+        return HttpResponse(json.dumps({name: first}), status=status)
+    return StreamingHttpResponse(
+        _stream_json_list(name, chain([first, second], batches)),
+        status=status)
+
+
 def get_attribute(request, attribute, attr_type=None, required=True,
                   default=None):
     value = request.get(attribute, None)
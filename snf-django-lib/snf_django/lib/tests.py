@@ -0,0 +1,176 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime, timedelta
+
+from astakosclient.errors import Unauthorized
+from django.conf import settings
+from mock import patch
+
+from snf_django.lib import token_cache
+from snf_django.lib.token_cache import LocalTokenCache, TokenCache
+from snf_django.lib.utils import retrieve_user
+from snf_django.utils.testing import override_settings
+from synnefo.util.date import isoformat
+
+# Use backported unittest functionality if Python < 2.7
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+ASTAKOS_URL = "https://astakos.example.com/identity/v2.0"
+NOW = datetime(2016, 5, 1, 12, 0, 0)
+
+
+def user_info(uuid, expires=None):
+    token = {"id": "token-" + uuid}
+    if expires is not None:
+        token["expires"] = isoformat(expires)
+    return {"access": {"token": token,
+                       "user": {"id": uuid, "roles": [{"name": "default"}]}}}
+
+
+class LocalTokenCacheTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LocalTokenCache(2)
+        cache.set("a", 1, 60)
+        cache.set("b", 2, 60)
+        # 'a' is now the most recently used entry
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3, 60)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache.entries), 2)
+
+    @patch("snf_django.lib.token_cache.time")
+    def test_expiry(self, time):
+        cache = LocalTokenCache(10)
+        time.return_value = 1000
+        cache.set("a", 1, 10)
+        time.return_value = 1009
+        self.assertEqual(cache.get("a"), 1)
+        time.return_value = 1010
+        self.assertEqual(cache.get("a"), None)
+        self.assertFalse(cache.entries)
+
+    def test_get_returns_copy(self):
+        cache = LocalTokenCache(10)
+        cache.set("a", {"roles": ["default"]}, 60)
+        value = cache.get("a")
+        value["roles"].append("admin")
+        self.assertEqual(cache.get("a"), {"roles": ["default"]})
+
+
+@patch("snf_django.lib.token_cache.datetime")
+class TokenCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = LocalTokenCache(10)
+        self.cache = TokenCache(self.backend, 60, negative_timeout=10)
+
+    def key(self, token):
+        return TokenCache._key(ASTAKOS_URL, token)
+
+    def timeout(self, token):
+        expires, _ = self.backend.entries[self.key(token)]
+        return int(round(expires - token_cache.time()))
+
+    def test_hit_returns_copy(self, dt):
+        dt.utcnow.return_value = NOW
+        self.cache.set(ASTAKOS_URL, "token", user_info("user1"))
+        info = self.cache.get(ASTAKOS_URL, "token")
+        self.assertEqual(info, user_info("user1"))
+        info["access"]["user"]["roles"].append({"name": "admin"})
+        self.assertEqual(self.cache.get(ASTAKOS_URL, "token"),
+                         user_info("user1"))
+        self.assertEqual(self.cache.get(ASTAKOS_URL, "other"), None)
+        self.assertEqual(self.cache.get("https://other", "token"), None)
+
+    def test_timeout_clamped_to_expires(self, dt):
+        dt.utcnow.return_value = NOW
+        self.cache.set(ASTAKOS_URL, "token1", user_info("user1"))
+        self.assertEqual(self.timeout("token1"), 60)
+        expires = NOW + timedelta(seconds=300)
+        self.cache.set(ASTAKOS_URL, "token2", user_info("user2", expires))
+        self.assertEqual(self.timeout("token2"), 60)
+        expires = NOW + timedelta(seconds=30)
+        self.cache.set(ASTAKOS_URL, "token3", user_info("user3", expires))
+        self.assertEqual(self.timeout("token3"), 30)
+
+    def test_expired_token_not_cached(self, dt):
+        dt.utcnow.return_value = NOW
+        for seconds in (0, -30):
+            expires = NOW + timedelta(seconds=seconds)
+            self.cache.set(ASTAKOS_URL, "token", user_info("user1", expires))
+            self.assertEqual(self.cache.get(ASTAKOS_URL, "token"), None)
+        self.assertFalse(self.backend.entries)
+
+    def test_invalid_token(self, dt):
+        error = Unauthorized("Invalid token", "Token has expired")
+        self.cache.set_invalid(ASTAKOS_URL, "token", error)
+        self.assertEqual(self.timeout("token"), 10)
+        for _ in range(2):
+            with self.assertRaises(Unauthorized) as cm:
+                self.cache.get(ASTAKOS_URL, "token")
+            self.assertEqual(cm.exception.message, "Invalid token")
+            self.assertEqual(cm.exception.details, "Token has expired")
+            self.assertEqual(cm.exception.status, 401)
+
+        now = token_cache.time()
+        with patch("snf_django.lib.token_cache.time") as time:
+            time.return_value = now + 11
+            self.assertEqual(self.cache.get(ASTAKOS_URL, "token"), None)
+
+        cache = TokenCache(LocalTokenCache(10), 60, negative_timeout=0)
+        cache.set_invalid(ASTAKOS_URL, "token", error)
+        self.assertEqual(cache.get(ASTAKOS_URL, "token"), None)
+
+
+@patch("snf_django.lib.token_cache._token_cache", None)
+@patch("snf_django.lib.utils.AstakosClient")
+class RetrieveUserTest(unittest.TestCase):
+    def retrieve(self, token):
+        return retrieve_user(token, ASTAKOS_URL)
+
+    def test_cache_hit(self, client):
+        client.return_value.authenticate.return_value = user_info("user1")
+        with override_settings(settings, ASTAKOS_TOKEN_CACHE_TIMEOUT=60):
+            self.assertEqual(self.retrieve("token"), user_info("user1"))
+            self.assertEqual(client.call_count, 1)
+            self.assertEqual(self.retrieve("token"), user_info("user1"))
+            self.assertEqual(client.call_count, 1)
+            self.retrieve("other")
+            self.assertEqual(client.call_count, 2)
+
+    def test_cache_rejection(self, client):
+        client.return_value.authenticate.side_effect = \
+            Unauthorized("Invalid token", "details")
+        with override_settings(settings, ASTAKOS_TOKEN_CACHE_TIMEOUT=60):
+            for _ in range(2):
+                with self.assertRaises(Unauthorized) as cm:
+                    self.retrieve("token")
+                self.assertEqual(cm.exception.message, "Invalid token")
+                self.assertEqual(cm.exception.details, "details")
+            self.assertEqual(client.call_count, 1)
+
+    def test_cache_disabled(self, client):
+        client.return_value.authenticate.return_value = user_info("user1")
+        with override_settings(settings, ASTAKOS_TOKEN_CACHE_TIMEOUT=0):
+            self.assertEqual(token_cache.get_token_cache(), None)
+            self.retrieve("token")
+            self.retrieve("token")
+            self.assertEqual(client.call_count, 2)
+            self.assertEqual(token_cache._token_cache, None)
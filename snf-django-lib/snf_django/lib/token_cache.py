@@ -0,0 +1,162 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the Astakos authentication responses, keyed by token.
+
+The cache is disabled unless ASTAKOS_TOKEN_CACHE_TIMEOUT is set. See
+10-snf-webproject-deploy.conf for the available settings.
+"""
+
+import threading
+from copy import deepcopy
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha256
+from time import time
+
+from astakosclient.errors import Unauthorized
+from django.conf import settings
+
+from synnefo.util.date import isoparse
+
+KEY_PREFIX = "astakos_token:"
+
+
+class LocalTokenCache(object):
+    """In-process LRU cache with a timeout per entry."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time():
+                return None
+            # Re-insert to mark the entry as the most recently used
+            self.entries[key] = entry
+        # Callers are free to modify what they get, like with any other
+        # cache backend
+        return deepcopy(value)
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time() + timeout, value)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DjangoTokenCache(object):
+    """Cache backed by one of the caches defined in the CACHES setting."""
+
+    def __init__(self, name):
+        from django.core.cache import caches
+        self.cache = caches[name]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class TokenCache(object):
+    """Cache of Astakos authentication responses.
+
+    The responses for valid tokens are kept for at most 'timeout' seconds
+    and never past the expiration of the token. Tokens that Astakos
+    rejected are kept for 'negative_timeout' seconds, so that repeated
+    requests with an invalid token do not reach Astakos either.
+    Tokens are hashed before being used as keys.
+    """
+
+    def __init__(self, backend, timeout, negative_timeout=0):
+        self.backend = backend
+        self.timeout = timeout
+        self.negative_timeout = negative_timeout
+
+    @staticmethod
+    def _key(astakos_url, token):
+        return KEY_PREFIX + sha256("%s\0%s" % (astakos_url, token)).hexdigest()
+
+    def get(self, astakos_url, token):
+        """Return the cached response for the token, or None.
+
+        Raises Unauthorized if the token is known to be invalid.
+        """
+        value = self.backend.get(self._key(astakos_url, token))
+        if value is None:
+            return None
+        user_info, error = value
+        if error is not None:
+            raise Unauthorized(*error)
+        return user_info
+
+    def set(self, astakos_url, token, user_info):
+        timeout = self.timeout
+        try:
+            expires = isoparse(user_info["access"]["token"]["expires"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        else:
+            delta = expires - datetime.utcnow()
+            timeout = min(timeout, int(delta.total_seconds()))
+        if timeout > 0:
+            self.backend.set(self._key(astakos_url, token),
+                             (user_info, None), timeout)
+
+    def set_invalid(self, astakos_url, token, error):
+        if self.negative_timeout > 0:
+            self.backend.set(self._key(astakos_url, token),
+                             (None, (error.message, error.details)),
+                             self.negative_timeout)
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the token cache configured in the settings, or None if token
+    caching is disabled."""
+    global _token_cache
+    timeout = getattr(settings, "ASTAKOS_TOKEN_CACHE_TIMEOUT", 0)
+    if not timeout:
+        return None
+    with _token_cache_lock:
+        if _token_cache is None:
+            name = getattr(settings, "ASTAKOS_TOKEN_CACHE_BACKEND", None)
+            if name:
+                backend = DjangoTokenCache(name)
+            else:
+                size = getattr(settings, "ASTAKOS_TOKEN_CACHE_SIZE", 10000)
+                backend = LocalTokenCache(size)
+            negative_timeout = getattr(
+                settings, "ASTAKOS_TOKEN_CACHE_NEGATIVE_TIMEOUT", 10)
+            _token_cache = TokenCache(backend, timeout, negative_timeout)
+    return _token_cache
@@ -14,8 +14,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from astakosclient import AstakosClient
+from astakosclient.errors import Unauthorized
 from django.conf import settings
 
+from snf_django.lib.token_cache import get_token_cache
+
 
 def get_token(request):
     """Get the Authentication Token of a request."""
@@ -52,12 +55,25 @@ def retrieve_user(token, astakos_auth_url, logger=None, client_ip=None):
     if not token:
         return None
 
+    token_cache = get_token_cache()
+    if token_cache is not None:
+        user_info = token_cache.get(astakos_url, token)
+        if user_info is not None:
+            return user_info
+
     headers = None
     if client_ip:
         headers = {'X-Client-IP': client_ip}
 
     astakos = AstakosClient(token, astakos_url, use_pool=True, retry=2,
                             logger=logger, headers=headers)
-    user_info = astakos.authenticate()
+    try:
+        user_info = astakos.authenticate()
+    except Unauthorized as err:
+        if token_cache is not None:
+            token_cache.set_invalid(astakos_url, token, err)
+        raise
 
+    if token_cache is not None:
+        token_cache.set(astakos_url, token, user_info)
     return user_info
@@ -0,0 +1,61 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import CommandError
+
+from optparse import make_option
+
+from snf_django.management.commands import SynnefoCommand
+
+from pithos.api.util import get_backend
+
+
+class Command(SynnefoCommand):
+    help = """Fold journaled statistics changes into the statistics.
+
+    When PITHOS_BACKEND_DEFERRED_STATISTICS is enabled, changes to the
+    statistics of containers and accounts are journaled and only summed
+    up on read. This command folds them into the statistics, to keep the
+    journal short. It is meant to run periodically, e.g. from cron.
+
+    """
+    option_list = SynnefoCommand.option_list + (
+        make_option("--batch-size", dest="batch_size", type="int",
+                    default=10000,
+                    help="Number of changes to fold per transaction"),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size <= 0:
+            raise CommandError("The batch size must be positive")
+
+        b = get_backend()
+        total = 0
+        try:
+            while True:
+                success_status = False
+                b.pre_exec()
+                try:
+                    folded = b.node.statistics_compact(batch_size)
+                    success_status = True
+                finally:
+                    b.post_exec(success_status)
+                total += folded
+                if folded < batch_size:
+                    break
+        finally:
+            b.close()
+        self.stdout.write("Folded %d statistics changes.\n" % total)
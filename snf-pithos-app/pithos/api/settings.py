@@ -118,6 +118,7 @@ BACKEND_BLOCK_MODULE = getattr(
 BACKEND_BLOCK_PATH = getattr(
     settings, 'PITHOS_BACKEND_BLOCK_PATH', '/tmp/pithos-data/')
 BACKEND_BLOCK_UMASK = getattr(settings, 'PITHOS_BACKEND_BLOCK_UMASK', 0o022)
+# Set 'path' (and optionally 'umask') to use the filesystem block store.
 BACKEND_BLOCK_KWARGS = getattr(settings, 'PITHOS_BACKEND_BLOCK_KWARGS', {})
 
 
@@ -130,6 +131,17 @@ BACKEND_VERSIONING = getattr(settings, 'PITHOS_BACKEND_VERSIONING', 'auto')
 BACKEND_FREE_VERSIONING = getattr(settings, 'PITHOS_BACKEND_FREE_VERSIONING',
                                   True)
 
+# Journal container and account statistics changes instead of updating them
+# in place, so that concurrent writes to a container do not serialize on its
+# statistics. Journaled changes are folded by the statistics-compact command.
+BACKEND_DEFERRED_STATISTICS = getattr(
+    settings, 'PITHOS_BACKEND_DEFERRED_STATISTICS', False)
+
+# Number of object size changes summed up into a single quota commission.
+# Commissions are also issued at the end of each request.
+BACKEND_COMMISSION_BATCH_SIZE = getattr(
+    settings, 'PITHOS_BACKEND_COMMISSION_BATCH_SIZE', 1000)
+
 # Enable backend pooling
 BACKEND_POOL_ENABLED = getattr(settings, 'PITHOS_BACKEND_POOL_ENABLED', True)
 
@@ -198,3 +210,13 @@ ACC_MAX_GROUPS = getattr(settings, 'PITHOS_ACC_MAX_GROUPS', 32)
 
 # The maximum allowed group members per group.
 ACC_MAX_GROUP_MEMBERS = getattr(settings, 'PITHOS_ACC_MAX_GROUP_MEMBERS', 32)
+
+# The number of object blocks to fetch from the storage ahead of the block
+# being sent to the client when serving object data. Set to 0 to disable
+# read-ahead.
+BLOCK_PREFETCH_DEPTH = getattr(settings, 'PITHOS_BLOCK_PREFETCH_DEPTH', 4)
+
+# The number of worker threads hashing and storing the blocks of an object
+# upload while the next blocks are read from the client. Set to 0 to store
+# each block before reading the next one.
+BLOCK_UPLOAD_WORKERS = getattr(settings, 'PITHOS_BLOCK_UPLOAD_WORKERS', 4)
@@ -0,0 +1,277 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import threading
+import time
+
+from unittest import TestCase
+
+from snf_django.lib.api import faults
+
+from pithos.api.util import (_BlockTask, BlockUploader, BlockPrefetcher,
+                             SaveToBackendHandler, ObjectWrapper)
+from pithos.backends.exceptions import ItemNotExists
+
+
+class BlockError(Exception):
+    pass
+
+
+class FakeBackend(object):
+    """Store blocks in memory, taking a random short time per block."""
+
+    block_size = 4
+
+    def __init__(self, fail=None):
+        self.blocks = {}
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.fetched = []
+
+    def _delay(self):
+        time.sleep(random.random() / 1000)
+
+    def put_block(self, data):
+        self._delay()
+        if data == self.fail:
+            raise BlockError(data)
+        h = "hash:" + data
+        with self.lock:
+            self.blocks[h] = data
+        return h
+
+    def get_block(self, h):
+        self._delay()
+        with self.lock:
+            self.fetched.append(h)
+        if h == self.fail:
+            raise BlockError(h)
+        try:
+            return self.blocks[h]
+        except KeyError:
+            raise ItemNotExists(h)
+
+
+def assertStopped(test, threads):
+    for t in threads:
+        t.join(5)
+        test.assertFalse(t.is_alive())
+
+
+class BlockTaskTest(TestCase):
+    def test_result(self):
+        task = _BlockTask(2)
+        task.run(lambda x: x * 2)
+        self.assertEqual(task.wait(), 4)
+
+    def test_error(self):
+        def fail(x):
+            raise BlockError(x)
+        task = _BlockTask(2)
+        task.run(fail)
+        self.assertRaises(BlockError, task.wait)
+
+    def test_cancel(self):
+        task = _BlockTask(2)
+        task.cancel()
+        self.assertRaises(Exception, task.wait)
+
+
+class BlockUploaderTest(TestCase):
+    def put_blocks(self, uploader, blocks):
+        for block in blocks:
+            uploader.put_block(block)
+
+    def test_hashmap_order(self):
+        blocks = ["%04d" % i for i in range(50)]
+        for workers in (0, 1, 4):
+            backend = FakeBackend()
+            uploader = BlockUploader(backend, workers)
+            threads = list(uploader.pool.threads)
+            self.assertEqual(len(threads), workers)
+            self.put_blocks(uploader, blocks)
+            self.assertEqual(uploader.hashmap(),
+                             ["hash:" + block for block in blocks])
+            self.assertEqual(len(backend.blocks), len(blocks))
+            assertStopped(self, threads)
+
+    def test_worker_error(self):
+        blocks = ["%04d" % i for i in range(20)]
+        backend = FakeBackend(fail="0005")
+        uploader = BlockUploader(backend, 4)
+        threads = uploader.pool.threads
+        try:
+            self.put_blocks(uploader, blocks)
+        except BlockError:
+            # Raised by put_block, once a worker has failed
+            pass
+        self.assertRaises(BlockError, uploader.hashmap)
+        assertStopped(self, threads)
+        self.assertRaises(BlockError, uploader.put_block, "0100")
+
+    def test_close_after_failure(self):
+        backend = FakeBackend(fail="0000")
+        uploader = BlockUploader(backend, 2)
+        threads = uploader.pool.threads
+        uploader.put_block("0000")
+        uploader.close()
+        uploader.close()
+        assertStopped(self, threads)
+        self.assertRaises(Exception, uploader.hashmap)
+
+
+class FakeRequest(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.META = {}
+
+
+class SaveToBackendHandlerTest(TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.handler = SaveToBackendHandler(FakeRequest(self.backend))
+
+    def new_file(self, name):
+        self.handler.new_file("X-Object-Data", name, "text/plain", None)
+        return self.handler.uploader.pool.threads
+
+    def test_files(self):
+        threads = self.new_file("a")
+        for chunk in ("01", "2345", "67", "89"):
+            self.handler.receive_data_chunk(chunk, 0)
+        f = self.handler.file_complete(10)
+        self.assertEqual(f.hashmap, ["hash:0123", "hash:4567", "hash:89"])
+        self.assertEqual(self.handler.uploader, None)
+        assertStopped(self, threads)
+
+        threads = self.new_file("b")
+        self.handler.receive_data_chunk("abc", 0)
+        self.assertEqual(self.handler.file_complete(3).hashmap,
+                         ["hash:abc"])
+        self.handler.upload_complete()
+        assertStopped(self, threads)
+
+    def test_new_file_closes_previous(self):
+        threads = self.new_file("a")
+        self.handler.receive_data_chunk("0123", 0)
+        self.new_file("b")
+        assertStopped(self, threads)
+        self.handler.upload_complete()
+
+    def test_upload_interrupted(self):
+        threads = self.new_file("a")
+        self.handler.receive_data_chunk("0123", 0)
+        self.handler.receive_data_chunk("456", 0)
+        self.handler.upload_interrupted()
+        assertStopped(self, threads)
+        self.handler.upload_interrupted()
+
+
+class ObjectWrapperTest(TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        # Two files, of 23 and 8 bytes
+        self.files = ["".join(chr(ord("a") + i % 26) for i in range(23)),
+                      "0123456789abcdef"[:8]]
+        self.data = "".join(self.files)
+        self.sizes = [len(f) for f in self.files]
+        self.hashmaps = [
+            [self.backend.put_block(f[i:i + 4]) for i in range(0, len(f), 4)]
+            for f in self.files]
+
+    def wrapper(self, ranges, depth, boundary=""):
+        return ObjectWrapper(self.backend, ranges, self.sizes, self.hashmaps,
+                             boundary, {}, prefetch_depth=depth)
+
+    def read(self, ranges, depth, boundary=""):
+        w = self.wrapper(ranges, depth, boundary)
+        try:
+            return "".join(w)
+        finally:
+            w.close()
+
+    def test_ranges(self):
+        ranges = [[(0, 31)], [(5, 12)], [(22, 3)], [(30, 1)]]
+        for depth in (0, 1, 4):
+            for r in ranges:
+                offset, length = r[0]
+                self.backend.fetched = []
+                self.assertEqual(self.read(r, depth),
+                                 self.data[offset:offset + length])
+                # Every block is fetched once
+                self.assertEqual(len(self.backend.fetched),
+                                 len(set(self.backend.fetched)))
+
+    def test_multiple_ranges(self):
+        ranges = [(0, 3), (2, 9), (20, 8), (0, 31)]
+        expected = self.read(ranges, 0, boundary="b")
+        for offset, length in ranges:
+            part = ("Content-Range: bytes %d-%d/31\r\n"
+                    "Content-Transfer-Encoding: binary\r\n\r\n%s" %
+                    (offset, offset + length - 1,
+                     self.data[offset:offset + length]))
+            self.assertTrue(part in expected)
+        for depth in (1, 4):
+            self.assertEqual(self.read(ranges, depth, boundary="b"),
+                             expected)
+
+    def test_no_prefetch(self):
+        w = self.wrapper([(0, 31)], 0)
+        "".join(w)
+        self.assertEqual(w.prefetcher, None)
+
+    def test_backend_error(self):
+        self.backend.fail = self.hashmaps[0][3]
+        for depth in (0, 1, 4):
+            w = self.wrapper([(0, 31)], depth)
+            self.assertRaises(BlockError, "".join, w)
+            w.close()
+
+        self.backend.fail = None
+        del self.backend.blocks[self.hashmaps[1][0]]
+        for depth in (0, 1, 4):
+            w = self.wrapper([(0, 31)], depth)
+            self.assertRaises(faults.ItemNotFound, "".join, w)
+            w.close()
+
+    def test_close_early(self):
+        for depth in (1, 4):
+            w = self.wrapper([(0, 31)], depth)
+            self.assertEqual(w.next(), self.data[:4])
+            threads = w.prefetcher.pool.threads
+            self.assertEqual(len(threads), depth)
+            w.close()
+            assertStopped(self, threads)
+
+
+class BlockPrefetcherTest(TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.hashes = [self.backend.put_block("%04d" % i) for i in range(10)]
+
+    def test_in_order(self):
+        prefetcher = BlockPrefetcher(self.backend, self.hashes, 3)
+        threads = prefetcher.pool.threads
+        for h in self.hashes:
+            self.assertEqual(prefetcher.get_block(h), self.backend.blocks[h])
+        assertStopped(self, threads)
+
+    def test_out_of_order(self):
+        prefetcher = BlockPrefetcher(self.backend, self.hashes, 3)
+        h = self.hashes[5]
+        self.assertEqual(prefetcher.get_block(h), self.backend.blocks[h])
+        prefetcher.close()
+        assertStopped(self, prefetcher.pool.threads)
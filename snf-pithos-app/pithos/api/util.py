@@ -55,7 +55,10 @@ from pithos.api.settings import (BACKEND_DB_MODULE, BACKEND_DB_CONNECTION,
                                  BASE_HOST, UPDATE_MD5, VIEW_PREFIX,
                                  OAUTH2_CLIENT_CREDENTIALS, UNSAFE_DOMAIN,
                                  RESOURCE_MAX_METADATA, ACC_MAX_GROUPS,
-                                 ACC_MAX_GROUP_MEMBERS)
+                                 ACC_MAX_GROUP_MEMBERS, BLOCK_PREFETCH_DEPTH,
+                                 BLOCK_UPLOAD_WORKERS,
+                                 BACKEND_DEFERRED_STATISTICS,
+                                 BACKEND_COMMISSION_BATCH_SIZE)
 
 from pithos.backends import connect_backend
 from pithos.backends.exceptions import (NotAllowedError, QuotaError,
@@ -75,6 +78,10 @@ import re
 import hashlib
 import uuid
 import decimal
+import threading
+import Queue
+
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
@@ -769,6 +776,128 @@ def socket_read_iterator(request, length=0, blocksize=4096):
             yield data
 
 
+class _BlockTask(object):
+    __slots__ = ("arg", "result", "error", "done")
+
+    def __init__(self, arg):
+        self.arg = arg
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self, func):
+        try:
+            self.result = func(self.arg)
+        except Exception as e:
+            self.error = e
+        self.done.set()
+
+    def cancel(self):
+        self.error = faults.InternalServerError("Block operation cancelled")
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _BlockWorkers(object):
+    """Run _BlockTasks with func on a pool of daemon threads.
+
+    At most 'maxsize' tasks wait for a thread, if positive. With no threads,
+    tasks are run synchronously when submitted.
+    """
+
+    def __init__(self, func, count, maxsize=0):
+        self.func = func
+        self.tasks = Queue.Queue(maxsize)
+        self.threads = []
+        for _ in xrange(count):
+            t = threading.Thread(target=self._run)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+        self.running = bool(self.threads)
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            task.run(self.func)
+            task.arg = None  # release the block data
+
+    def submit(self, task):
+        if self.running:
+            self.tasks.put(task)
+        else:
+            task.run(self.func)
+
+    def stop(self, cancel=False):
+        """Let the threads exit once the queued tasks are done.
+
+        If cancel is set, the queued tasks are cancelled instead.
+        """
+        if not self.running:
+            return
+        self.running = False
+        if cancel:
+            while True:
+                try:
+                    self.tasks.get_nowait().cancel()
+                except Queue.Empty:
+                    break
+        for _ in self.threads:
+            self.tasks.put(None)
+
+
+class BlockUploader(object):
+    """Store blocks to the backend in the background.
+
+    Blocks passed to put_block are hashed and stored by a pool of worker
+    threads, so that the caller can go on reading the next block from the
+    client meanwhile. put_block blocks while 'workers' blocks are already
+    waiting to be stored, which bounds the memory used to about twice that
+    many blocks. With no workers, blocks are stored synchronously.
+
+    The workers run until hashmap() or close() is called.
+    """
+
+    def __init__(self, backend, workers):
+        self.backend = backend
+        self.stored = []
+        self.error = None
+        self.pool = _BlockWorkers(self._put_block, workers, maxsize=workers)
+
+    def _put_block(self, data):
+        try:
+            return self.backend.put_block(data)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def put_block(self, data):
+        if self.error is not None:
+            raise self.error
+        task = _BlockTask(data)
+        self.stored.append(task)
+        self.pool.submit(task)
+
+    def hashmap(self):
+        """Wait for all blocks to be stored and return their hashes,
+        in the order the blocks were given."""
+        try:
+            return [task.wait() for task in self.stored]
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the workers. Blocks not yet stored are dropped."""
+        self.pool.stop(cancel=True)
+
+
 class SaveToBackendHandler(FileUploadHandler):
     """Handle a file from an HTML form the django way."""
 
@@ -779,12 +908,19 @@ class SaveToBackendHandler(FileUploadHandler):
     def put_data(self, length):
         if len(self.data) >= length:
             block = self.data[:length]
-            self.file.hashmap.append(self.backend.put_block(block))
+            self.uploader.put_block(block)
             self.checksum_compute.update(block)
             self.data = self.data[length:]
 
+    def close_uploader(self):
+        uploader = getattr(self, 'uploader', None)
+        if uploader is not None:
+            uploader.close()
+            self.uploader = None
+
     def new_file(self, field_name, file_name, content_type,
                  content_length, charset=None, content_type_extra=None):
+        self.close_uploader()
         self.checksum_compute = NoChecksum() if not UPDATE_MD5 else Checksum()
         self.data = ''
         self.file = UploadedFile(
@@ -792,6 +928,7 @@ class SaveToBackendHandler(FileUploadHandler):
             content_type_extra=content_type_extra)
         self.file.size = 0
         self.file.hashmap = []
+        self.uploader = BlockUploader(self.backend, BLOCK_UPLOAD_WORKERS)
 
     def receive_data_chunk(self, raw_data, start):
         self.data += raw_data
@@ -803,18 +940,76 @@ class SaveToBackendHandler(FileUploadHandler):
         l = len(self.data)
         if l > 0:
             self.put_data(l)
+        try:
+            self.file.hashmap = self.uploader.hashmap()
+        finally:
+            self.close_uploader()
         self.file.etag = self.checksum_compute.hexdigest()
         return self.file
 
+    def upload_complete(self):
+        self.close_uploader()
+
+    def upload_interrupted(self):
+        self.close_uploader()
+
+
+class BlockPrefetcher(object):
+    """Fetch blocks from the backend ahead of their use.
+
+    Given the hashes of the blocks that will be requested, in order, keep
+    up to 'depth' of them being fetched (or already fetched) by a pool of
+    worker threads, so that storage latency overlaps with sending the
+    previous blocks to the client. At most 'depth' blocks are buffered.
+    """
+
+    def __init__(self, backend, hashes, depth):
+        self.backend = backend
+        self.hashes = iter(hashes)
+        self.pending = deque()
+        self.pool = _BlockWorkers(backend.get_block, depth)
+        for _ in xrange(depth):
+            self._schedule()
+
+    def _schedule(self):
+        for h in self.hashes:
+            fetch = _BlockTask(h)
+            self.pending.append((h, fetch))
+            self.pool.submit(fetch)
+            return
+
+    def get_block(self, hash):
+        """Return the block with the given hash.
+
+        Fall back to a synchronous fetch if the block is not the next
+        one expected.
+        """
+        if not self.pending or self.pending[0][0] != hash:
+            return self.backend.get_block(hash)
+        _, fetch = self.pending.popleft()
+        self._schedule()
+        if not self.pending:
+            # All blocks have been scheduled, let the workers go.
+            self.pool.stop()
+        return fetch.wait()
+
+    def close(self):
+        """Cancel any blocks not yet fetched and stop the workers."""
+        self.pending.clear()
+        self.pool.stop(cancel=True)
+
 
 class ObjectWrapper(object):
     """Return the object's data block-per-block in each iteration.
 
     Read from the object using the offset and length provided
     in each entry of the range list.
+    If prefetch_depth is positive, the blocks that follow the one being
+    read are fetched in the background.
     """
 
-    def __init__(self, backend, ranges, sizes, hashmaps, boundary, meta):
+    def __init__(self, backend, ranges, sizes, hashmaps, boundary, meta,
+                 prefetch_depth=0):
         self.backend = backend
         self.ranges = ranges
         self.sizes = sizes
@@ -831,9 +1026,60 @@ class ObjectWrapper(object):
         self.range_index = -1
         self.offset, self.length = self.ranges[0]
 
+        self.prefetch_depth = prefetch_depth
+        self.prefetcher = None
+
     def __iter__(self):
         return self
 
+    def _block_hashes(self):
+        """Return the hashes of the blocks to be read, in order.
+
+        Follow the same walk over the ranges as part_iterator, skipping
+        consecutive reads of the same block.
+        """
+        block_size = self.backend.block_size
+        hashes = []
+        last_hash = -1
+        for offset, length in self.ranges:
+            file_index = 0
+            while length > 0:
+                file_size = self.sizes[file_index]
+                while offset >= file_size:
+                    offset -= file_size
+                    file_index += 1
+                    file_size = self.sizes[file_index]
+                block_index = int(offset / block_size)
+                h = self.hashmaps[file_index][block_index]
+                if h != last_hash:
+                    hashes.append(h)
+                    last_hash = h
+                bs = block_size
+                if (block_index == len(self.hashmaps[file_index]) - 1 and
+                        file_size % block_size):
+                    bs = file_size % block_size
+                bl = min(length, bs - offset % block_size)
+                offset += bl
+                length -= bl
+        return hashes
+
+    def _get_block(self, hash):
+        if self.prefetcher is None and self.prefetch_depth > 0:
+            hashes = self._block_hashes()
+            if len(hashes) > 1:
+                depth = min(self.prefetch_depth, len(hashes))
+                self.prefetcher = BlockPrefetcher(self.backend, hashes,
+                                                  depth)
+            else:
+                self.prefetch_depth = 0
+        if self.prefetcher is not None:
+            return self.prefetcher.get_block(hash)
+        return self.backend.get_block(hash)
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+
     def part_iterator(self):
         if self.length > 0:
             # Get the file for the current offset.
@@ -850,7 +1096,7 @@ class ObjectWrapper(object):
                 self.block_hash = self.hashmaps[
                     self.file_index][self.block_index]
                 try:
-                    self.block = self.backend.get_block(self.block_hash)
+                    self.block = self._get_block(self.block_hash)
                 except ItemNotExists:
                     raise faults.ItemNotFound('Block does not exist')
 
@@ -938,7 +1184,8 @@ def object_data_response(request, sizes, hashmaps, meta, public=False):
     else:
         boundary = ''
     wrapper = ObjectWrapper(request.backend, ranges, sizes, hashmaps,
-                            boundary, meta)
+                            boundary, meta,
+                            prefetch_depth=BLOCK_PREFETCH_DEPTH)
     response = StreamingHttpResponse(wrapper, status=ret)
     put_object_headers(
         response, meta, restricted=public,
@@ -1023,7 +1270,9 @@ BACKEND_KWARGS = dict(
     mapfile_prefix=BACKEND_MAPFILE_PREFIX,
     resource_max_metadata=RESOURCE_MAX_METADATA,
     acc_max_groups=ACC_MAX_GROUPS,
-    acc_max_group_members=ACC_MAX_GROUP_MEMBERS)
+    acc_max_group_members=ACC_MAX_GROUP_MEMBERS,
+    deferred_statistics=BACKEND_DEFERRED_STATISTICS,
+    commission_batch_size=BACKEND_COMMISSION_BATCH_SIZE)
 
 _pithos_backend_pool = PithosBackendPool(size=BACKEND_POOL_SIZE,
                                          **BACKEND_KWARGS)
@@ -1121,8 +1370,10 @@ def api_method(http_method=None, token_required=True, user_required=True,
             finally:
                 # Always close PithosBackend connection
                 if getattr(request, "backend", None) is not None:
-                    request.backend.post_exec(success_status)
-                    request.backend.close()
+                    try:
+                        request.backend.post_exec(success_status)
+                    finally:
+                        request.backend.close()
         return wrapper
     return decorator
 
@@ -15,6 +15,7 @@
 
 from hashlib import new as newhasher
 from binascii import hexlify
+from collections import OrderedDict
 import ConfigParser
 
 from context_archipelago import ArchipelagoObject, file_sync_read_chunks
@@ -31,14 +32,19 @@ from pithos.workers import (
 
 monkey.patch_Request()
 
+# Maximum number of requests in flight when checking or storing many blocks.
+DEFAULT_BATCH_SIZE = 32
+
 
 class ArchipelagoBlocker(object):
     """Blocker.
        Required constructor parameters: blocksize, hashtype.
+       Optional constructor parameters: batch_size.
     """
 
     blocksize = None
     hashtype = None
+    batch_size = DEFAULT_BATCH_SIZE
 
     def __init__(self, **params):
         cfg = ConfigParser.ConfigParser()
@@ -60,6 +66,7 @@ class ArchipelagoBlocker(object):
         self.hashtype = hashtype
         self.hashlen = len(emptyhash)
         self.emptyhash = emptyhash
+        self.batch_size = params.get('batch_size') or DEFAULT_BATCH_SIZE
 
     def _pad(self, block):
         return block + ('\x00' * (self.blocksize - len(block)))
@@ -68,19 +75,68 @@ class ArchipelagoBlocker(object):
         name = hexlify(blkhash)
         return ArchipelagoObject(name, self.ioctx_pool, self.dst_port, create)
 
-    def _check_rear_block(self, blkhash):
-        filename = hexlify(blkhash)
+    def _batches(self, items):
+        batch_size = self.batch_size
+        for i in xrange(0, len(items), batch_size):
+            yield items[i:i + batch_size]
+
+    def _check_rear_blocks(self, blkhashes):
+        """Check many blocks for existence at once.
+
+        Submit an info request for each block of a batch before waiting
+        for any of them, so that the round trips overlap.
+        Return a list of booleans, one for each of the given hashes.
+        """
+        found = []
         ioctx = self.ioctx_pool.pool_get()
-        req = Request.get_info_request(ioctx, self.dst_port, filename)
-        req.submit()
-        req.wait()
-        ret = req.success()
-        req.put()
-        self.ioctx_pool.pool_put(ioctx)
-        if ret:
-            return True
-        else:
-            return False
+        try:
+            for batch in self._batches(blkhashes):
+                reqs = []
+                try:
+                    for h in batch:
+                        req = Request.get_info_request(ioctx, self.dst_port,
+                                                       hexlify(h))
+                        reqs.append(req)
+                        req.submit()
+                    for req in reqs:
+                        req.wait()
+                        found.append(bool(req.success()))
+                finally:
+                    for req in reqs:
+                        req.put()
+        finally:
+            self.ioctx_pool.pool_put(ioctx)
+        return found
+
+    def _write_rear_blocks(self, blkhashes, blocks):
+        """Write many blocks at once.
+
+        Submit a write request for each block of a batch before waiting
+        for any of them, so that the writes proceed concurrently.
+        """
+        ioctx = self.ioctx_pool.pool_get()
+        try:
+            items = zip(blkhashes, blocks)
+            for batch in self._batches(items):
+                reqs = []
+                ok = True
+                try:
+                    for h, data in batch:
+                        req = Request.get_write_request(
+                            ioctx, self.dst_port, hexlify(h), data=data,
+                            offset=0, datalen=len(data))
+                        reqs.append(req)
+                        req.submit()
+                    for req in reqs:
+                        req.wait()
+                        ok = req.success() and ok
+                finally:
+                    for req in reqs:
+                        req.put()
+                if not ok:
+                    raise IOError("archipelago: Write request error")
+        finally:
+            self.ioctx_pool.pool_put(ioctx)
 
     def block_hash(self, data):
         """Hash a block of data"""
@@ -92,14 +148,9 @@ class ArchipelagoBlocker(object):
         """Check hashes for existence and
            return those missing from block storage.
         """
-        notfound = []
-        append = notfound.append
-
-        for h in hashes:
-            if h not in notfound and not self._check_rear_block(h):
-                append(h)
-
-        return notfound
+        unique = list(OrderedDict.fromkeys(hashes))
+        found = self._check_rear_blocks(unique)
+        return [h for h, f in zip(unique, found) if not f]
 
     def block_retr(self, hashes):
         """Retrieve blocks from storage by their hashes."""
@@ -170,11 +221,14 @@ class ArchipelagoBlocker(object):
         """
         block_hash = self.block_hash
         hashlist = [block_hash(b) for b in blocklist]
-        missing = [i for i, h in enumerate(hashlist) if not
-                   self._check_rear_block(h)]
+        found = self._check_rear_blocks(hashlist)
+        missing = [i for i, f in enumerate(found) if not f]
+
+        # The same block may appear more than once, write it only once.
+        towrite = OrderedDict()
         for i in missing:
-            with self._get_rear_block(hashlist[i], 1) as rbl:
-                rbl.sync_write(blocklist[i])  # XXX: verify?
+            towrite.setdefault(hashlist[i], blocklist[i])
+        self._write_rear_blocks(towrite.keys(), towrite.values())
 
         return hashlist, missing
 
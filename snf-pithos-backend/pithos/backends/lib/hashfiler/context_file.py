@@ -0,0 +1,91 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import errno
+
+from mmap import mmap, ACCESS_READ
+from tempfile import mkstemp
+
+FAN_OUT_DEPTH = 2
+FAN_OUT_WIDTH = 2
+
+
+def fan_out_path(root, name, depth=FAN_OUT_DEPTH, width=FAN_OUT_WIDTH):
+    """Return the path of name under root, nested in depth levels of
+       directories named after consecutive width-sized prefixes of name.
+    """
+    parts = [name[i * width:(i + 1) * width] for i in xrange(depth)]
+    return os.path.join(root, *(parts + [name]))
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def file_write(path, data, umask=0o022):
+    """Atomically write data to path.
+
+       The data is written to a temporary file in the same directory,
+       which is then renamed over path. Concurrent writers of the same
+       path therefore never expose a partially written file to readers.
+    """
+    dirname = os.path.dirname(path)
+    _makedirs(dirname)
+    fd, tmppath = mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        os.fchmod(fd, 0o666 & ~umask)
+        view = buffer(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+    except Exception:
+        exc_info = sys.exc_info()
+        try:
+            os.close(fd)
+            os.unlink(tmppath)
+        except OSError:
+            pass
+        raise exc_info[0], exc_info[1], exc_info[2]
+    os.close(fd)
+    os.rename(tmppath, path)
+
+
+def file_read(path):
+    """Return the contents of the file at path, or None if it does not exist.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    try:
+        size = os.fstat(fd).st_size
+        if size == 0:
+            return ''
+        m = mmap(fd, size, access=ACCESS_READ)
+        try:
+            return m[:]
+        finally:
+            m.close()
+    finally:
+        os.close(fd)
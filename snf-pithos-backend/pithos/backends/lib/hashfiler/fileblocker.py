@@ -0,0 +1,161 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from hashlib import new as newhasher
+from binascii import hexlify, unhexlify
+from os.path import exists
+
+from context_file import fan_out_path, file_read, file_write
+
+
+class FileBlocker(object):
+    """Content-addressed block storage on a local filesystem.
+       Required constructor parameters: blocksize, blockpath, hashtype.
+       Optional constructor parameters: umask.
+
+       Each block is stored in its own file, named after the hex digest
+       of its contents and placed under a two-level fan-out directory
+       hierarchy (e.g. ab/cd/abcd...).
+    """
+
+    blocksize = None
+    blockpath = None
+    hashtype = None
+
+    def __init__(self, **params):
+        blocksize = params['blocksize']
+        blockpath = params['blockpath']
+        hashtype = params['hashtype']
+        try:
+            hasher = newhasher(hashtype)
+        except ValueError:
+            msg = "Variable hashtype '%s' is not available from hashlib"
+            raise ValueError(msg % (hashtype,))
+
+        hasher.update("")
+        emptyhash = hasher.digest()
+
+        self.blocksize = blocksize
+        self.blockpath = blockpath
+        self.umask = params.get('umask', 0o022)
+        self.hashtype = hashtype
+        self.hashlen = len(emptyhash)
+        self.emptyhash = emptyhash
+
+    def _pad(self, block):
+        return block + ('\x00' * (self.blocksize - len(block)))
+
+    def _block_path(self, blkhash):
+        return fan_out_path(self.blockpath, hexlify(blkhash))
+
+    def _block_exists(self, blkhash):
+        return blkhash == self.emptyhash or exists(self._block_path(blkhash))
+
+    def _read_block(self, blkhash):
+        if blkhash == self.emptyhash:
+            return self._pad('')
+        block = file_read(self._block_path(blkhash))
+        if block is None:
+            return None
+        return self._pad(block)
+
+    def block_hash(self, data):
+        """Hash a block of data"""
+        hasher = newhasher(self.hashtype)
+        hasher.update(data.rstrip('\x00'))
+        return hasher.digest()
+
+    def block_ping(self, hashes):
+        """Check hashes for existence and
+           return those missing from block storage.
+        """
+        notfound = []
+        append = notfound.append
+        block_exists = self._block_exists
+
+        for h in hashes:
+            if h not in notfound and not block_exists(h):
+                append(h)
+
+        return notfound
+
+    def block_retr(self, hashes):
+        """Retrieve blocks from storage by their hashes."""
+        blocks = []
+        append = blocks.append
+
+        for h in hashes:
+            block = self._read_block(h)
+            if block is None:
+                break
+            append(block)
+
+        return blocks
+
+    def block_retr_archipelago(self, hashes):
+        """Retrieve blocks from storage by their hex-encoded hashes."""
+        blocks = []
+        append = blocks.append
+
+        for h in hashes:
+            try:
+                block = self._read_block(unhexlify(h))
+            except TypeError:
+                block = None
+            if block is None:
+                break
+            append(block)
+
+        return blocks
+
+    def block_stor(self, blocklist):
+        """Store a bunch of blocks and return (hashes, missing).
+           Hashes is a list of the hashes of the blocks,
+           missing is a list of indices in that list indicating
+           which blocks were missing from the store.
+        """
+        block_hash = self.block_hash
+        hashlist = [block_hash(b) for b in blocklist]
+        missing = [i for i, h in enumerate(hashlist) if not
+                   self._block_exists(h)]
+        for i in missing:
+            file_write(self._block_path(hashlist[i]),
+                       blocklist[i].rstrip('\x00'), self.umask)
+
+        return hashlist, missing
+
+    def block_delta(self, blkhash, offset, data):
+        """Construct and store a new block from a given block
+           and a data 'patch' applied at offset. Return:
+           (the hash of the new block, if the block already existed)
+        """
+
+        blocksize = self.blocksize
+        if offset >= blocksize or not data:
+            return None, None
+
+        block = self.block_retr((blkhash,))
+        if not block:
+            return None, None
+
+        block = block[0]
+        newblock = block[:offset] + data
+        if len(newblock) > blocksize:
+            newblock = newblock[:blocksize]
+        elif len(newblock) < blocksize:
+            newblock += block[len(newblock):]
+
+        h, a = self.block_stor((newblock,))
+        return h[0], 1 if a else 0
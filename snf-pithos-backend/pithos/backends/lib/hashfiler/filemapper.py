@@ -0,0 +1,58 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from hashlib import sha1
+from binascii import hexlify, unhexlify
+
+from context_file import fan_out_path, file_read, file_write
+
+
+class FileMapper(object):
+    """Hashes map storage on a local filesystem.
+       Required constructor parameters: mappath, namelen.
+       Optional constructor parameters: umask.
+
+       Each map is stored in its own file as the concatenation of the raw
+       block hashes, fanned out by the digest of the map name.
+    """
+
+    mappath = None
+    namelen = None
+
+    def __init__(self, **params):
+        self.params = params
+        self.namelen = params['namelen']
+        self.mappath = params['mappath']
+        self.umask = params.get('umask', 0o022)
+
+    def _map_path(self, maphash):
+        return fan_out_path(self.mappath, sha1(maphash).hexdigest())
+
+    def map_retr(self, maphash, size):
+        """Return as a list, part of the hashes map of an object
+           at the given block offset.
+           By default, return the whole hashes map.
+        """
+        data = file_read(self._map_path(maphash))
+        if data is None:
+            raise Exception("Could not retrieve mapfile %s." % maphash)
+        namelen = self.namelen
+        return [hexlify(data[i:i + namelen])
+                for i in xrange(0, len(data), namelen)]
+
+    def map_stor(self, maphash, hashes, size, block_size):
+        """Store hashes in the given hashes map."""
+        data = ''.join(unhexlify(h) for h in hashes)
+        file_write(self._map_path(maphash), data, self.umask)
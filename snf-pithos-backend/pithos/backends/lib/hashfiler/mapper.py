@@ -13,24 +13,28 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from archipelagomapper import ArchipelagoMapper
-
 
 class Mapper(object):
     """Mapper.
-       Required constructor parameters: namelen.
+       Required constructor parameters: namelen and either mappath
+       (filesystem storage) or archipelago_cfile (Archipelago storage).
     """
 
     def __init__(self, **params):
-        self.archip_map = ArchipelagoMapper(**params)
+        if params.get('mappath'):
+            from filemapper import FileMapper
+            self.rmap = FileMapper(**params)
+        else:
+            from archipelagomapper import ArchipelagoMapper
+            self.rmap = ArchipelagoMapper(**params)
 
     def map_retr(self, maphash, size):
         """Return as a list, part of the hashes map of an object
            at the given block offset.
            By default, return the whole hashes map.
         """
-        return self.archip_map.map_retr(maphash, size)
+        return self.rmap.map_retr(maphash, size)
 
     def map_stor(self, maphash, hashes, size, blocksize):
         """Store hashes in the given hashes map."""
-        self.archip_map.map_stor(maphash, hashes, size, blocksize)
+        self.rmap.map_stor(maphash, hashes, size, blocksize)
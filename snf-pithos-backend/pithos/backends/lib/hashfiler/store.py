@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 from blocker import Blocker
 from mapper import Mapper
 
@@ -21,17 +23,33 @@ class Store(object):
     """Store.
        Required constructor parameters: block_size, hash_algorithm,
                                         archipelago_cfile, namelen
+       Optional constructor parameters: path, umask, batch_size
+
+       If path is given, blocks and maps are kept in a content-addressed
+       store under the 'blocks' and 'maps' directories of path on the
+       local filesystem, instead of Archipelago.
+       batch_size bounds the number of Archipelago requests kept in flight
+       when checking or storing many blocks at once.
     """
 
     def __init__(self, **params):
+        path = params.get('path')
+        umask = params.get('umask', 0o022)
         pb = {'blocksize': params['block_size'],
               'hashtype': params['hash_algorithm'],
               'archipelago_cfile': params['archipelago_cfile'],
+              'batch_size': params.get('batch_size'),
               }
+        if path:
+            pb.update({'blockpath': os.path.join(path, 'blocks'),
+                       'umask': umask})
         self.blocker = Blocker(**pb)
         pm = {'namelen': self.blocker.hashlen,
               'archipelago_cfile': params['archipelago_cfile'],
               }
+        if path:
+            pm.update({'mappath': os.path.join(path, 'maps'),
+                       'umask': umask})
         self.mapper = Mapper(**pm)
 
     def map_get(self, name, size):
@@ -0,0 +1,30 @@
+"""Add xfeaturemembers table
+
+Revision ID: 3c9e6c5a0f21
+Revises: 5adc52055209
+Create Date: 2026-10-18 02:09:20.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c9e6c5a0f21'
+down_revision = '5adc52055209'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('xfeaturemembers',
+                    sa.Column('member', sa.String(256), primary_key=True),
+                    sa.Column('feature_id', sa.Integer,
+                              sa.ForeignKey('xfeatures.feature_id',
+                                            ondelete='CASCADE'),
+                              primary_key=True),
+                    mysql_engine='InnoDB')
+    op.execute("insert into xfeaturemembers (member, feature_id) "
+               "select distinct value, feature_id from xfeaturevals")
+
+
+def downgrade():
+    op.drop_table('xfeaturemembers')
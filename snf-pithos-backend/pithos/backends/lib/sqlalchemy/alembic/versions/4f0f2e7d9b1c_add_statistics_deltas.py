@@ -0,0 +1,85 @@
+"""Add statistics_deltas table
+
+Revision ID: 4f0f2e7d9b1c
+Revises: 3c9e6c5a0f21
+Create Date: 2016-03-21 16:42:07.203115
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f0f2e7d9b1c'
+down_revision = '3c9e6c5a0f21'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import table, column, select, and_
+
+
+def upgrade():
+    op.create_table('statistics_deltas',
+                    sa.Column('serial', sa.Integer, primary_key=True),
+                    sa.Column('node', sa.Integer,
+                              sa.ForeignKey('nodes.node',
+                                            ondelete='CASCADE',
+                                            onupdate='CASCADE')),
+                    sa.Column('cluster', sa.Integer, nullable=False,
+                              default=0),
+                    sa.Column('population', sa.Integer, nullable=False,
+                              default=0),
+                    sa.Column('size', sa.BigInteger, nullable=False,
+                              default=0),
+                    sa.Column('mtime', sa.DECIMAL(precision=16, scale=6)),
+                    mysql_engine='InnoDB')
+    op.create_index('idx_statistics_deltas_node_cluster', 'statistics_deltas',
+                    ['node', 'cluster'])
+
+
+def fold_statistics_deltas():
+    """Fold the outstanding deltas into the statistics, so that dropping
+       the deltas does not lose any changes.
+    """
+    connection = op.get_bind()
+
+    def stats_table(name, *columns):
+        columns += (column('node', sa.Integer),
+                    column('cluster', sa.Integer),
+                    column('population', sa.Integer),
+                    column('size', sa.BigInteger),
+                    column('mtime', sa.DECIMAL(precision=16, scale=6)))
+        return table(name, *columns)
+    st = stats_table('statistics')
+    sd = stats_table('statistics_deltas', column('serial', sa.Integer))
+
+    s = select([sd.c.node, sd.c.cluster, sd.c.population, sd.c.size,
+                sd.c.mtime]).order_by(sd.c.serial)
+    totals = {}
+    for node, cluster, population, size, mtime in connection.execute(s):
+        try:
+            total = totals[(node, cluster)]
+        except KeyError:
+            total = totals[(node, cluster)] = [[], 0, None]
+        total[0].append(population)
+        total[1] += size
+        total[2] = mtime
+
+    for (node, cluster), (populations, size, mtime) in totals.iteritems():
+        where = and_(st.c.node == node, st.c.cluster == cluster)
+        row = connection.execute(
+            select([st.c.population, st.c.size], where)).fetchone()
+        population, presize = row or (0, 0)
+        for delta in populations:
+            population = max(population + delta, 0)
+        values = {'population': population, 'size': presize + size,
+                  'mtime': mtime}
+        if row:
+            connection.execute(st.update().where(where).values(values))
+        else:
+            values.update({'node': node, 'cluster': cluster})
+            connection.execute(st.insert().values(values))
+
+
+def downgrade():
+    fold_statistics_deltas()
+    op.drop_index('idx_statistics_deltas_node_cluster',
+                  tablename='statistics_deltas')
+    op.drop_table('statistics_deltas')
@@ -48,6 +48,12 @@ class Groups(DBWorker):
         except NoSuchTableError:
             tables = create_tables(self.engine)
             map(lambda t: self.__setattr__(t.name, t), tables)
+        self.group_cache_reset()
+
+    def group_cache_reset(self):
+        """Forget the cached group memberships."""
+
+        self._group_parents_cache = {}
 
     def group_names(self, owner):
         """List all group names belonging to owner."""
@@ -74,6 +80,7 @@ class Groups(DBWorker):
     def group_add(self, owner, group, member):
         """Add a member to a group."""
 
+        self.group_cache_reset()
         s = self.groups.select()
         s = s.where(self.groups.c.owner == owner)
         s = s.where(self.groups.c.name == group)
@@ -91,6 +98,7 @@ class Groups(DBWorker):
            Receive groups as a mapping object.
         """
 
+        self.group_cache_reset()
         values = list({'owner': owner,
                        'name': k,
                        'member': m}
@@ -103,6 +111,7 @@ class Groups(DBWorker):
     def group_remove(self, owner, group, member):
         """Remove a member from a group."""
 
+        self.group_cache_reset()
         s = self.groups.delete().where(and_(self.groups.c.owner == owner,
                                             self.groups.c.name == group,
                                             self.groups.c.member == member))
@@ -112,6 +121,7 @@ class Groups(DBWorker):
     def group_delete(self, owner, group):
         """Delete a group."""
 
+        self.group_cache_reset()
         s = self.groups.delete().where(and_(self.groups.c.owner == owner,
                                             self.groups.c.name == group))
         r = self.conn.execute(s)
@@ -120,6 +130,7 @@ class Groups(DBWorker):
     def group_destroy(self, owner):
         """Delete all groups belonging to owner."""
 
+        self.group_cache_reset()
         s = self.groups.delete().where(self.groups.c.owner == owner)
         r = self.conn.execute(s)
         r.close()
@@ -149,9 +160,14 @@ class Groups(DBWorker):
     def group_parents(self, member):
         """Return all (owner, group) tuples that contain member."""
 
+        try:
+            return self._group_parents_cache[member]
+        except KeyError:
+            pass
         s = select([self.groups.c.owner, self.groups.c.name],
                    self.groups.c.member == member)
         r = self.conn.execute(s)
         l = r.fetchall()
         r.close()
+        self._group_parents_cache[member] = l
         return l
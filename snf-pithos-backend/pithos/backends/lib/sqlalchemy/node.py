@@ -36,6 +36,9 @@ ROOTNODE = 0
 
 (MATCH_PREFIX, MATCH_EXACT) = range(2)
 
+# Number of rows fetched per query by delimiter listings.
+DELIMITER_LISTING_PAGE_SIZE = 10000
+
 inf = float('inf')
 
 
@@ -80,6 +83,15 @@ def safe_long(v):
     return long(v) if v is not None else v
 
 
+def fold_population(population, deltas):
+    """Apply the population deltas in order. Like successive statistics
+       updates, never let the population drop below zero.
+    """
+    for delta in deltas:
+        population = max(population + delta, 0)
+    return population
+
+
 def create_tables(engine):
     metadata = MetaData()
 
@@ -127,6 +139,22 @@ def create_tables(engine):
                           primary_key=True, autoincrement=False))
     Table('statistics', metadata, *columns, mysql_engine='InnoDB')
 
+    #create statistics deltas table
+    columns = []
+    columns.append(Column('serial', Integer, primary_key=True))
+    columns.append(Column('node', Integer,
+                          ForeignKey('nodes.node',
+                                     ondelete='CASCADE',
+                                     onupdate='CASCADE')))
+    columns.append(Column('cluster', Integer, nullable=False, default=0))
+    columns.append(Column('population', Integer, nullable=False, default=0))
+    columns.append(Column('size', BigInteger, nullable=False, default=0))
+    columns.append(Column('mtime', DECIMAL(precision=16, scale=6)))
+    statistics_deltas = Table('statistics_deltas', metadata, *columns,
+                              mysql_engine='InnoDB')
+    Index('idx_statistics_deltas_node_cluster', statistics_deltas.c.node,
+          statistics_deltas.c.cluster)
+
     #create versions table
     columns = []
     columns.append(Column('serial', Integer, primary_key=True))
@@ -220,12 +248,15 @@ class Node(DBWorker):
     def __init__(self, **params):
         self._props = params.pop('props')
         self.mapfile_prefix = params.pop('mapfile_prefix', 'snf_file_')
+        self.deferred_statistics = params.pop('deferred_statistics', False)
         DBWorker.__init__(self, **params)
         try:
             metadata = MetaData(self.engine)
             self.nodes = Table('nodes', metadata, autoload=True)
             self.policy = Table('policy', metadata, autoload=True)
             self.statistics = Table('statistics', metadata, autoload=True)
+            self.statistics_deltas = Table('statistics_deltas', metadata,
+                                           autoload=True)
             self.versions = Table('versions', metadata, autoload=True)
             self.attributes = Table('attributes', metadata, autoload=True)
             self.mapfile_seq = Sequence('mapfile_seq', metadata)
@@ -651,24 +682,50 @@ class Node(DBWorker):
     def statistics_get(self, node, cluster=0):
         """Return population, total size and last mtime
            for all versions under node that belong to the cluster.
+           Deltas not yet folded into the statistics are included.
         """
 
-        s = select([self.statistics.c.population,
-                    self.statistics.c.size,
-                    self.statistics.c.mtime])
-        s = s.where(and_(self.statistics.c.node == node,
-                         self.statistics.c.cluster == cluster))
+        st = self.statistics
+        s = select([st.c.population, st.c.size, st.c.mtime],
+                   and_(st.c.node == node, st.c.cluster == cluster))
         r = self.conn.execute(s)
         row = r.fetchone()
         r.close()
-        return row
+
+        sd = self.statistics_deltas
+        s = select([sd.c.population, sd.c.size, sd.c.mtime],
+                   and_(sd.c.node == node, sd.c.cluster == cluster))
+        s = s.order_by(sd.c.serial)
+        r = self.conn.execute(s)
+        deltas = r.fetchall()
+        r.close()
+        if not deltas:
+            return row
+
+        population, size, mtime = row or (0, 0, None)
+        population = fold_population(population, [d[0] for d in deltas])
+        size += sum(d[1] for d in deltas)
+        return (population, size, deltas[-1][2])
 
     def statistics_update(self, node, population, size, mtime, cluster=0):
         """Update the statistics of the given node.
            Statistics keep track the population, total
            size of objects and mtime in the node's namespace.
            May be zero or positive or negative numbers.
+
+           If deferred statistics are enabled, the change is appended
+           to the statistics deltas instead, so that concurrent writers
+           do not contend for the statistics row of the node.
         """
+        if self.deferred_statistics:
+            s = self.statistics_deltas.insert()
+            s = s.values(node=node, population=population, size=size,
+                         mtime=mtime, cluster=cluster)
+            self.conn.execute(s).close()
+            return
+        self._statistics_apply(node, (population,), size, mtime, cluster)
+
+    def _statistics_apply(self, node, populations, size, mtime, cluster=0):
         s = select([self.statistics.c.population, self.statistics.c.size],
                    and_(self.statistics.c.node == node,
                         self.statistics.c.cluster == cluster))
@@ -679,8 +736,7 @@ class Node(DBWorker):
             prepopulation, presize = (0, 0)
         else:
             prepopulation, presize = r
-        population += prepopulation
-        population = max(population, 0)
+        population = fold_population(prepopulation, populations)
         size += presize
 
         #insert or replace
@@ -720,6 +776,38 @@ class Node(DBWorker):
             population = 0  # Population isn't recursive
             i += 1
 
+    def statistics_compact(self, limit=10000):
+        """Fold up to limit of the oldest statistics deltas
+           into the statistics. Return the number of deltas folded.
+        """
+
+        sd = self.statistics_deltas
+        s = select([sd.c.serial, sd.c.node, sd.c.cluster, sd.c.population,
+                    sd.c.size, sd.c.mtime], for_update=True)
+        s = s.order_by(sd.c.serial).limit(limit)
+        r = self.conn.execute(s)
+        rows = r.fetchall()
+        r.close()
+        if not rows:
+            return 0
+
+        totals = {}
+        for serial, node, cluster, population, size, mtime in rows:
+            try:
+                total = totals[(node, cluster)]
+            except KeyError:
+                total = totals[(node, cluster)] = [[], 0, None]
+            total[0].append(population)
+            total[1] += size
+            total[2] = mtime  # rows are ordered, keep the latest
+        for (node, cluster), total in totals.iteritems():
+            populations, size, mtime = total
+            self._statistics_apply(node, populations, size, mtime, cluster)
+
+        s = sd.delete().where(sd.c.serial.in_([row[0] for row in rows]))
+        self.conn.execute(s).close()
+        return len(rows)
+
     def statistics_latest(self, node, before=inf, except_cluster=0):
         """Return population, total size and last mtime
            for all latest versions under node that
@@ -1370,13 +1458,17 @@ class Node(DBWorker):
         mappend = matches.append
         skip_prefix = None
         one_more = False
+        done = False
 
-        rp = self.conn.execute(s, start=start)
-
-        while count < limit or one_more:
-            props_many = rp.fetchmany(10000)
-            if not props_many:
-                break
+        # Fetch the paths in pages. When a page ends inside a common prefix,
+        # start the next one after all the paths under that prefix, so that
+        # the database seeks past the whole subtree instead of returning it.
+        page_size = DELIMITER_LISTING_PAGE_SIZE
+        s = s.limit(page_size)
+        while True:
+            rp = self.conn.execute(s, start=start)
+            props_many = rp.fetchall()
+            rp.close()
 
             for props in props_many:
                 path = props[0]
@@ -1393,6 +1485,7 @@ class Node(DBWorker):
                     if idx > 0 and idx + dz != len(path):
                         pf = path[:idx + dz]
                         pappend(pf)
+                    done = True
                     break
 
                 if idx > 0 and idx + dz != len(path):
@@ -1408,9 +1501,14 @@ class Node(DBWorker):
                         # Get one more, in case there is a path.
                         one_more = True
                     else:
+                        done = True
                         break
 
-        rp.close()
+            if done or len(props_many) < page_size:
+                break
+            start = props_many[-1][0]
+            if skip_prefix is not None:
+                start = max(start, strprevling(strnextling(skip_prefix)))
 
         return matches, prefixes
 
@@ -1437,9 +1535,15 @@ class Node(DBWorker):
         r.close()
         return l
 
-    def domain_object_list(self, domain, paths, cluster=None):
+    def domain_object_list(self, domain, paths, cluster=None, prefix=None,
+                           meta=None, sizeq=None):
         """Return a list of (path, property list, attribute dictionary)
            for the objects in the specific domain and cluster.
+
+           The objects can be further restricted to paths starting with
+           prefix, to objects having all the attributes of the meta
+           dictionary in the domain, and to objects whose size is in the
+           range set by sizeq, as in latest_version_list.
         """
 
         v = self.versions.alias('v')
@@ -1461,6 +1565,21 @@ class Node(DBWorker):
         s = s.where(a.c.is_latest == true())
         if paths:
             s = s.where(n.c.path.in_(paths))
+        if prefix:
+            s = s.where(n.c.path.like(self.escape_like(prefix) + '%',
+                                      escape=ESCAPE_CHAR))
+        for key, value in (meta or {}).items():
+            subs = select([1])
+            subs = subs.where(self.attributes.c.serial == v.c.serial)
+            subs = subs.where(self.attributes.c.domain == domain)
+            subs = subs.where(self.attributes.c.key == key)
+            subs = subs.where(self.attributes.c.value == value)
+            s = s.where(exists(subs.correlate(v)))
+        if sizeq and len(sizeq) == 2:
+            if sizeq[0]:
+                s = s.where(v.c.size >= sizeq[0])
+            if sizeq[1]:
+                s = s.where(v.c.size < sizeq[1])
 
         r = self.conn.execute(s)
         rows = r.fetchall()
@@ -13,8 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from sqlalchemy.sql import select, literal, or_, and_
-from sqlalchemy.sql.expression import join, union
+from sqlalchemy.sql import select, or_, and_
 
 from xfeatures import XFeatures
 from groups import Groups
@@ -36,6 +35,40 @@ class Permissions(XFeatures, Groups, Public, Node):
         Groups.__init__(self, **params)
         Public.__init__(self, **params)
         Node.__init__(self, **params)
+        self.access_cache_reset()
+
+    def access_cache_reset(self):
+        """Forget the cached permissions and group memberships."""
+
+        self._access_cache = {}
+        self.group_cache_reset()
+
+    def _access_cache_load(self, paths):
+        """Return the cache mapping paths to (feature, permissions) tuples,
+           or None for paths without a feature. Paths that are not
+           already cached are fetched with a single query."""
+
+        cache = self._access_cache
+        missing = [p for p in set(paths) if p not in cache]
+        if not missing:
+            return cache
+        for p in missing:
+            cache[p] = None
+        xfeatures_xfeaturevals = self.xfeatures.outerjoin(self.xfeaturevals)
+        s = select([self.xfeatures.c.path,
+                    self.xfeatures.c.feature_id,
+                    self.xfeaturevals.c.key,
+                    self.xfeaturevals.c.value],
+                   from_obj=[xfeatures_xfeaturevals])
+        s = s.where(self.xfeatures.c.path.in_(missing))
+        r = self.conn.execute(s)
+        for path, feature, key, value in r.fetchall():
+            if cache[path] is None:
+                cache[path] = (feature, defaultdict(list))
+            if key is not None:
+                cache[path][1][key].append(value)
+        r.close()
+        return cache
 
     def access_grant(self, path, access, members=()):
         """Grant members with access to path.
@@ -44,8 +77,10 @@ class Permissions(XFeatures, Groups, Public, Node):
 
         if not members:
             return
+        self._access_cache.pop(path, None)
         feature = self.xfeature_create(path)
         self.feature_setmany(feature, access, members)
+        self.feature_members_sync(feature)
 
     def access_set(self, path, permissions):
         """Set permissions for path. The permissions dict
@@ -53,6 +88,7 @@ class Permissions(XFeatures, Groups, Public, Node):
 
         r = permissions.get('read', [])
         w = permissions.get('write', [])
+        self._access_cache.pop(path, None)
         if not r and not w:
             self.xfeature_destroy(path)
             return
@@ -63,6 +99,7 @@ class Permissions(XFeatures, Groups, Public, Node):
             self.feature_setmany(feature, READ, r)
         if w:
             self.feature_setmany(feature, WRITE, w)
+        self.feature_members_sync(feature)
 
     def access_get_for_bulk(self, perms):
         """Get permissions for path."""
@@ -96,6 +133,23 @@ class Permissions(XFeatures, Groups, Public, Node):
             del(permissions[WRITE])
         return permissions
 
+    def access_get_bulk(self, paths):
+        """Get permissions for many paths at once.
+           Return a dict mapping each path to its permissions."""
+
+        cache = self._access_cache_load(paths)
+        result = {}
+        for path in paths:
+            permissions = {}
+            if cache[path] is not None:
+                values = cache[path][1]
+                if values.get(READ):
+                    permissions['read'] = list(values[READ])
+                if values.get(WRITE):
+                    permissions['write'] = list(values[WRITE])
+            result[path] = permissions
+        return result
+
     def access_members(self, path):
         feature = self.xfeature_get(path)
         if not feature:
@@ -116,22 +170,25 @@ class Permissions(XFeatures, Groups, Public, Node):
     def access_clear(self, path):
         """Revoke access to path (both permissions and public)."""
 
+        self._access_cache.pop(path, None)
         self.xfeature_destroy(path)
         self.public_unset(path)
 
     def access_clear_bulk(self, paths):
         """Revoke access to path (both permissions and public)."""
 
+        for path in paths:
+            self._access_cache.pop(path, None)
         self.xfeature_destroy_bulk(paths)
         self.public_unset_bulk(paths)
 
     def access_check(self, path, access, member):
         """Return true if the member has this access to the path."""
 
-        feature = self.xfeature_get(path)
-        if not feature:
+        cached = self._access_cache_load([path])[path]
+        if cached is None:
             return False
-        members = self.feature_get(feature, access)
+        members = cached[1].get(access, [])
         if member in members or '*' in members:
             return True
         for owner, group in self.group_parents(member):
@@ -183,7 +240,8 @@ class Permissions(XFeatures, Groups, Public, Node):
             valid.append(subp)
             if subp != path:
                 valid.append(subp + '/')
-        return [x for x in valid if self.xfeature_get(x)]
+        cache = self._access_cache_load(valid)
+        return [x for x in valid if cache[x] is not None]
 
     def access_inherit_bulk(self, paths):
         """Return the paths influencing the access for path."""
@@ -212,19 +270,13 @@ class Permissions(XFeatures, Groups, Public, Node):
 
         """
 
-        xfeatures_xfeaturevals = self.xfeatures.join(self.xfeaturevals)
-
-        selectable = (self.groups.c.owner + ':' + self.groups.c.name)
-        member_groups = select([selectable.label('value')],
-                               self.groups.c.member == member)
-
-        members = select([literal(member).label('value')])
-        any = select([literal('*').label('value')])
-
-        u = union(member_groups, members, any).alias()
-        inner_join = join(xfeatures_xfeaturevals, u,
-                          self.xfeaturevals.c.value == u.c.value)
-        s = select([self.xfeatures.c.path], from_obj=[inner_join]).distinct()
+        members = [member, '*']
+        members.extend(owner + ':' + group
+                       for owner, group in self.group_parents(member))
+        s = select([self.xfeatures.c.path],
+                   and_(self.xfeaturemembers.c.member.in_(members),
+                        self.xfeaturemembers.c.feature_id ==
+                        self.xfeatures.c.feature_id)).distinct()
         if prefix:
             like = lambda p: self.xfeatures.c.path.like(
                 self.escape_like(p) + '%', escape=ESCAPE_CHAR)
@@ -244,7 +296,8 @@ class Permissions(XFeatures, Groups, Public, Node):
                                 self.nodes.c.node.in_(container_nodes))
             s = select([self.nodes.c.path], condition)
             r = self.conn.execute(s)
-            l += [row[0] for row in r.fetchall() if row[0] not in l]
+            granted = set(l)
+            l += [row[0] for row in r.fetchall() if row[0] not in granted]
             r.close()
         return l
 
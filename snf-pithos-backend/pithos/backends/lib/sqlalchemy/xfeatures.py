@@ -41,6 +41,14 @@ def create_tables(engine):
     columns.append(Column('value', String(256), primary_key=True))
     Table('xfeaturevals', metadata, *columns, mysql_engine='InnoDB')
 
+    columns = []
+    columns.append(Column('member', String(256), primary_key=True))
+    columns.append(Column('feature_id', Integer,
+                          ForeignKey('xfeatures.feature_id',
+                                     ondelete='CASCADE'),
+                          primary_key=True))
+    Table('xfeaturemembers', metadata, *columns, mysql_engine='InnoDB')
+
     metadata.create_all(engine)
     return metadata.sorted_tables
 
@@ -56,6 +64,8 @@ class XFeatures(DBWorker):
             metadata = MetaData(self.engine)
             self.xfeatures = Table('xfeatures', metadata, autoload=True)
             self.xfeaturevals = Table('xfeaturevals', metadata, autoload=True)
+            self.xfeaturemembers = Table('xfeaturemembers', metadata,
+                                         autoload=True)
         except NoSuchTableError:
             tables = create_tables(self.engine)
             map(lambda t: self.__setattr__(t.name, t), tables)
@@ -184,6 +194,24 @@ class XFeatures(DBWorker):
             r = self.conn.execute(s)
             r.close()
 
+    def feature_members_sync(self, feature):
+        """Record the members having any key of feature in xfeaturemembers,
+           which is indexed by member."""
+
+        s = self.xfeaturemembers.delete()
+        s = s.where(self.xfeaturemembers.c.feature_id == feature)
+        r = self.conn.execute(s)
+        r.close()
+        s = select([self.xfeaturevals.c.value],
+                   self.xfeaturevals.c.feature_id == feature).distinct()
+        r = self.conn.execute(s)
+        values = [{'member': row[0], 'feature_id': feature}
+                  for row in r.fetchall()]
+        r.close()
+        if values:
+            s = self.xfeaturemembers.insert()
+            self.conn.execute(s, values)
+
     def feature_get(self, feature, key):
         """Return the list of values for a key of a feature."""
 
@@ -32,6 +32,12 @@ class Groups(DBWorker):
                             primary key (owner, name, member) ) """)
         execute(""" create index if not exists idx_groups_member
                     on groups(member) """)
+        self.group_cache_reset()
+
+    def group_cache_reset(self):
+        """Forget the cached group memberships."""
+
+        self._group_parents_cache = {}
 
     def group_names(self, owner):
         """List all group names belonging to owner."""
@@ -53,6 +59,7 @@ class Groups(DBWorker):
     def group_add(self, owner, group, member):
         """Add a member to a group."""
 
+        self.group_cache_reset()
         q = ("insert or ignore into groups (owner, name, member) "
              "values (?, ?, ?)")
         self.execute(q, (owner, group, member))
@@ -62,6 +69,7 @@ class Groups(DBWorker):
            Receive groups as a mapping object.
         """
 
+        self.group_cache_reset()
         q = ("insert or ignore into groups (owner, name, member) "
              "values (?, ?, ?)")
         self.executemany(q, ((owner, group, member)
@@ -71,18 +79,21 @@ class Groups(DBWorker):
     def group_remove(self, owner, group, member):
         """Remove a member from a group."""
 
+        self.group_cache_reset()
         q = "delete from groups where owner = ? and name = ? and member = ?"
         self.execute(q, (owner, group, member))
 
     def group_delete(self, owner, group):
         """Delete a group."""
 
+        self.group_cache_reset()
         q = "delete from groups where owner = ? and name = ?"
         self.execute(q, (owner, group))
 
     def group_destroy(self, owner):
         """Delete all groups belonging to owner."""
 
+        self.group_cache_reset()
         q = "delete from groups where owner = ?"
         self.execute(q, (owner,))
 
@@ -103,6 +114,12 @@ class Groups(DBWorker):
     def group_parents(self, member):
         """Return all (owner, group) tuples that contain member."""
 
+        try:
+            return self._group_parents_cache[member]
+        except KeyError:
+            pass
         q = "select owner, name from groups where member = ?"
         self.execute(q, (member,))
-        return self.fetchall()
+        parents = self.fetchall()
+        self._group_parents_cache[member] = parents
+        return parents
@@ -79,6 +79,8 @@ class Node(DBWorker):
         for p in self._props:
             setattr(self, p.upper(), self._props[p])
         self.mapfile_prefix = params.pop('mapfile_prefix', 'snf_file_')
+        # Statistics are always updated in place.
+        params.pop('deferred_statistics', None)
         DBWorker.__init__(self, **params)
         execute = self.execute
 
@@ -496,6 +498,13 @@ class Node(DBWorker):
             population = 0  # Population isn't recursive
             i += 1
 
+    def statistics_compact(self, limit=10000):
+        """Statistics are always updated in place, there is nothing
+           to fold. Return the number of deltas folded.
+        """
+
+        return 0
+
     def statistics_latest(self, node, before=inf, except_cluster=0):
         """Return population, total size and last mtime
            for all latest versions under node that
@@ -1154,9 +1163,15 @@ class Node(DBWorker):
         self.execute(q, args)
         return self.fetchone()
 
-    def domain_object_list(self, domain, paths, cluster=None):
+    def domain_object_list(self, domain, paths, cluster=None, prefix=None,
+                           meta=None, sizeq=None):
         """Return a list of (path, property list, attribute dictionary)
            for the objects in the specific domain and cluster.
+
+           The objects can be further restricted to paths starting with
+           prefix, to objects having all the attributes of the meta
+           dictionary in the domain, and to objects whose size is in the
+           range set by sizeq, as in latest_version_list.
         """
 
         props = ('n.path', 'v.serial', 'v.node', 'v.hash', 'v.size', 'v.type',
@@ -1174,8 +1189,23 @@ class Node(DBWorker):
             q += ("and path in (%s) " % ','.join('?' for _ in paths))
             map(args.append, paths)
         if cluster is not None:
-            q += "and v.cluster = ?"
+            q += "and v.cluster = ? "
             args += [cluster]
+        if prefix:
+            q += "and n.path like ? escape '\\' "
+            args.append(self.escape_like(prefix) + '%')
+        for key, value in (meta or {}).items():
+            q += ("and exists (select 1 from attributes where "
+                  "serial = v.serial and domain = ? and key = ? and "
+                  "value = ?) ")
+            args += [domain, key, value]
+        if sizeq and len(sizeq) == 2:
+            if sizeq[0]:
+                q += "and v.size >= ? "
+                args.append(sizeq[0])
+            if sizeq[1]:
+                q += "and v.size < ? "
+                args.append(sizeq[1])
 
         self.execute(q, args)
         rows = self.fetchall()
@@ -31,6 +31,36 @@ class Permissions(XFeatures, Groups, Public, Node):
         Groups.__init__(self, **params)
         Public.__init__(self, **params)
         Node.__init__(self, **params)
+        self.access_cache_reset()
+
+    def access_cache_reset(self):
+        """Forget the cached permissions and group memberships."""
+
+        self._access_cache = {}
+        self.group_cache_reset()
+
+    def _access_cache_load(self, paths):
+        """Return the cache mapping paths to (feature, permissions) tuples,
+           or None for paths without a feature. Paths that are not
+           already cached are fetched with a single query."""
+
+        cache = self._access_cache
+        missing = [p for p in set(paths) if p not in cache]
+        if not missing:
+            return cache
+        for p in missing:
+            cache[p] = None
+        q = ("select x.path, x.feature_id, xvals.key, xvals.value "
+             "from xfeatures x left join xfeaturevals xvals "
+             "on xvals.feature_id = x.feature_id "
+             "where x.path in (%s)") % ','.join('?' for _ in missing)
+        self.execute(q, missing)
+        for path, feature, key, value in self.fetchall():
+            if cache[path] is None:
+                cache[path] = (feature, defaultdict(list))
+            if key is not None:
+                cache[path][1][key].append(value)
+        return cache
 
     def access_grant(self, path, access, members=()):
         """Grant members with access to path.
@@ -39,8 +69,10 @@ class Permissions(XFeatures, Groups, Public, Node):
 
         if not members:
             return
+        self._access_cache.pop(path, None)
         feature = self.xfeature_create(path)
         self.feature_setmany(feature, access, members)
+        self.feature_members_sync(feature)
 
     def access_set(self, path, permissions):
         """Set permissions for path. The permissions dict
@@ -48,6 +80,7 @@ class Permissions(XFeatures, Groups, Public, Node):
 
         r = permissions.get('read', [])
         w = permissions.get('write', [])
+        self._access_cache.pop(path, None)
         if not r and not w:
             self.xfeature_destroy(path)
             return
@@ -58,6 +91,7 @@ class Permissions(XFeatures, Groups, Public, Node):
             self.feature_setmany(feature, READ, r)
         if w:
             self.feature_setmany(feature, WRITE, w)
+        self.feature_members_sync(feature)
 
     def access_get_for_bulk(self, perms):
         """Get permissions for paths."""
@@ -92,6 +126,23 @@ class Permissions(XFeatures, Groups, Public, Node):
             del(permissions[WRITE])
         return permissions
 
+    def access_get_bulk(self, paths):
+        """Get permissions for many paths at once.
+           Return a dict mapping each path to its permissions."""
+
+        cache = self._access_cache_load(paths)
+        result = {}
+        for path in paths:
+            permissions = {}
+            if cache[path] is not None:
+                values = cache[path][1]
+                if values.get(READ):
+                    permissions['read'] = list(values[READ])
+                if values.get(WRITE):
+                    permissions['write'] = list(values[WRITE])
+            result[path] = permissions
+        return result
+
     def access_members(self, path):
         feature = self.xfeature_get(path)
         if not feature:
@@ -112,22 +163,25 @@ class Permissions(XFeatures, Groups, Public, Node):
     def access_clear(self, path):
         """Revoke access to path (both permissions and public)."""
 
+        self._access_cache.pop(path, None)
         self.xfeature_destroy(path)
         self.public_unset(path)
 
     def access_clear_bulk(self, paths):
         """Revoke access to path (both permissions and public)."""
 
+        for path in paths:
+            self._access_cache.pop(path, None)
         self.xfeature_destroy_bulk(paths)
         self.public_unset_bulk(paths)
 
     def access_check(self, path, access, member):
         """Return true if the member has this access to the path."""
 
-        feature = self.xfeature_get(path)
-        if not feature:
+        cached = self._access_cache_load([path])[path]
+        if cached is None:
             return False
-        members = self.feature_get(feature, access)
+        members = cached[1].get(access, [])
         if member in members or '*' in members:
             return True
         for owner, group in self.group_parents(member):
@@ -170,7 +224,8 @@ class Permissions(XFeatures, Groups, Public, Node):
             valid.append(subp)
             if subp != path:
                 valid.append(subp + '/')
-        return [x for x in valid if self.xfeature_get(x)]
+        cache = self._access_cache_load(valid)
+        return [x for x in valid if cache[x] is not None]
 
     def access_inherit_bulk(self, paths):
         """Return the paths influencing the access for paths."""
@@ -199,13 +254,14 @@ class Permissions(XFeatures, Groups, Public, Node):
 
         """
 
+        members = [member, '*']
+        members.extend(owner + ':' + group
+                       for owner, group in self.group_parents(member))
         q = ("select distinct path from xfeatures inner join "
-             "  (select distinct feature_id, key from xfeaturevals inner join "
-             "     (select owner || ':' || name as value from groups "
-             "      where member = ? union select ? union select '*') "
-             "   using (value)) "
-             "using (feature_id)")
-        p = (member, member)
+             "  (select feature_id from xfeaturemembers "
+             "   where member in (%s)) "
+             "using (feature_id)") % ','.join('?' for _ in members)
+        p = tuple(members)
         if prefix:
             q += " where "
             paths = self.access_inherit(prefix) or [prefix]
@@ -224,7 +280,8 @@ class Permissions(XFeatures, Groups, Public, Node):
                 q += ("or node in (%s)" % select_containers)
                 args += [node]
             self.execute(q, args)
-            l += [r[0] for r in self.fetchall() if r[0] not in l]
+            granted = set(l)
+            l += [r[0] for r in self.fetchall() if r[0] not in granted]
         return l
 
     def access_list_shared(self, prefix=''):
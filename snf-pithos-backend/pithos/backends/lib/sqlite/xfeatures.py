@@ -44,6 +44,26 @@ class XFeatures(DBWorker):
                                 xfeatures(feature_id)
                             on delete cascade ) """)
 
+        execute(""" select name from sqlite_master
+                    where type = 'table' and name = 'xfeaturemembers' """)
+        if self.fetchone() is None:
+            execute(""" create table xfeaturemembers
+                              ( member     text,
+                                feature_id integer,
+                                primary key (member, feature_id)
+                                foreign key (feature_id) references
+                                    xfeatures(feature_id)
+                                on delete cascade ) """)
+            # Index the features of databases created before the table
+            wrapper = self.wrapper
+            wrapper.execute()
+            try:
+                execute(""" insert into xfeaturemembers (member, feature_id)
+                            select distinct value, feature_id
+                            from xfeaturevals """)
+            finally:
+                wrapper.commit()
+
 #     def xfeature_inherit(self, path):
 #         """Return the (path, feature) inherited by the path, or None."""
 #
@@ -112,6 +132,17 @@ class XFeatures(DBWorker):
             d[key].append(value)
         return d
 
+    def feature_members_sync(self, feature):
+        """Record the members having any key of feature in xfeaturemembers,
+           which is indexed by member."""
+
+        q = "delete from xfeaturemembers where feature_id = ?"
+        self.execute(q, (feature,))
+        q = ("insert into xfeaturemembers (member, feature_id) "
+             "select distinct value, feature_id from xfeaturevals "
+             "where feature_id = ?")
+        self.execute(q, (feature,))
+
     def feature_set(self, feature, key, value):
         """Associate a key, value pair with a feature."""
 
@@ -0,0 +1,59 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+
+
+def merkle_root(hashes, blockhash):
+    """Return the Merkle root of a list of block hashes.
+
+    The root is the one Pithos has always computed: the leaves are padded
+    with zero hashes up to the next power of two (at least two), and each
+    level is built by hashing the concatenation of pairs of nodes of the
+    level below.
+
+    Every level is kept in a single contiguous buffer and pairs are hashed
+    straight out of it with a copied hasher, without building intermediate
+    strings. Subtrees made up only of padding are never hashed, as their
+    value depends only on their height.
+    """
+    hasher = hashlib.new(blockhash)
+    hashlen = hasher.digest_size
+
+    def _hash(data):
+        h = hasher.copy()
+        h.update(data)
+        return h.digest()
+
+    if len(hashes) == 0:
+        return _hash('')
+    if len(hashes) == 1:
+        return hashes[0]
+
+    level = ''.join(hashes)
+    if len(level) != len(hashes) * hashlen:
+        raise ValueError("Invalid hash length")
+    pairlen = 2 * hashlen
+    zero = '\x00' * hashlen
+    while len(level) > hashlen:
+        end = len(level) - len(level) % pairlen
+        nodes = [_hash(buffer(level, offset, pairlen))
+                 for offset in xrange(0, end, pairlen)]
+        if end < len(level):
+            # Pair the last node with a padding subtree.
+            nodes.append(_hash(level[end:] + zero))
+        level = ''.join(nodes)
+        zero = _hash(zero + zero)
+    return level
@@ -21,11 +21,11 @@ import binascii
 
 from collections import defaultdict, OrderedDict
 from functools import wraps, partial
+from itertools import chain
 from traceback import format_exc
 from time import time
 
 from pithos.workers import glue
-from archipelago.common import Segment, Xseg_ctx
 from objpool import ObjectPool
 
 try:
@@ -33,6 +33,7 @@ try:
 except ImportError:
     AstakosClient = None
 
+from pithos.backends.merkle import merkle_root
 from pithos.backends.exceptions import (
     NotAllowedError, QuotaError,
     AccountExists, ContainerExists, AccountNotEmpty,
@@ -72,6 +73,11 @@ class HashMap(list):
         if len(self) == 1:
             return self.__getitem__(0)
 
+        hashlen = hashlib.new(self.blockhash).digest_size
+        if all(len(x) == hashlen for x in self):
+            return merkle_root(self, self.blockhash)
+
+        # Not a list of proper hashes, hash it the plain way.
         h = list(self)
         s = 2
         while s < len(h):
@@ -119,6 +125,9 @@ DEFAULT_RESOURCE_MAX_METADATA = 32
 DEFAULT_ACC_MAX_GROUPS = 32
 DEFAULT_ACC_MAX_GROUP_MEMBERS = 32
 
+# Number of size changes coalesced into a commission before issuing it
+DEFAULT_COMMISSION_BATCH_SIZE = 1000
+
 logger = logging.getLogger(__name__)
 
 _propnames = ('serial', 'node', 'hash', 'size', 'type', 'source', 'mtime',
@@ -247,7 +256,9 @@ class ModularBackend(object):
                  mapfile_prefix=DEFAULT_MAPFILE_PREFIX,
                  resource_max_metadata=DEFAULT_RESOURCE_MAX_METADATA,
                  acc_max_groups=DEFAULT_ACC_MAX_GROUPS,
-                 acc_max_group_members=DEFAULT_ACC_MAX_GROUP_MEMBERS):
+                 acc_max_group_members=DEFAULT_ACC_MAX_GROUP_MEMBERS,
+                 deferred_statistics=False,
+                 commission_batch_size=DEFAULT_COMMISSION_BATCH_SIZE):
 
         not_nullable = ('block_size', 'hash_algorithm',
                         'public_url_security', 'public_url_alphabet',
@@ -255,7 +266,7 @@ class ModularBackend(object):
                         'archipelago_conf_file', 'xseg_pool_size',
                         'map_check_interval', 'mapfile_prefix',
                         'resource_max_metadata', 'acc_max_groups',
-                        'acc_max_group_members')
+                        'acc_max_group_members', 'commission_batch_size')
         for f in not_nullable:
             if locals()[f] is None:
                 raise ValueError("Backend argument %s cannot be None" % f)
@@ -280,6 +291,7 @@ class ModularBackend(object):
         self.resource_max_metadata = resource_max_metadata
         self.acc_max_groups = acc_max_groups
         self.acc_max_group_members = acc_max_group_members
+        self.commission_batch_size = commission_batch_size
 
         def load_module(m):
             __import__(m)
@@ -293,7 +305,8 @@ class ModularBackend(object):
         for x in ['READ', 'WRITE']:
             setattr(self, x, getattr(self.db_module, x))
         params.update({'mapfile_prefix': self.mapfile_prefix,
-                       'props': _props(_propnames)})
+                       'props': _props(_propnames),
+                       'deferred_statistics': deferred_statistics})
         self.permissions = self.db_module.Permissions(**params)
         self.node = self.db_module.Node(**params)
         for x in ['ROOTNODE', 'MATCH_PREFIX', 'MATCH_EXACT']:
@@ -303,11 +316,6 @@ class ModularBackend(object):
 
         self.ALLOWED = ['read', 'write']
 
-        glue.WorkerGlue.setupXsegPool(ObjectPool, Segment, Xseg_ctx,
-                                      cfile=archipelago_conf_file,
-                                      pool_size=xseg_pool_size)
-
-        self.ioctx_pool = glue.WorkerGlue.ioctx_pool
         self.block_module = load_module(block_module)
         self.block_params = block_params
         params = {'block_size': self.block_size,
@@ -315,6 +323,16 @@ class ModularBackend(object):
                   'archipelago_cfile': archipelago_conf_file}
         if block_params is not None:
             params.update(block_params)
+
+        # A filesystem block store ('path' in block_params) does not talk to
+        # Archipelago, so there is no need for an xseg pool.
+        if not params.get('path'):
+            from archipelago.common import Segment, Xseg_ctx
+            glue.WorkerGlue.setupXsegPool(ObjectPool, Segment, Xseg_ctx,
+                                          cfile=archipelago_conf_file,
+                                          pool_size=xseg_pool_size)
+
+        self.ioctx_pool = glue.WorkerGlue.ioctx_pool
         self.store = self.block_module.Store(**params)
 
         self.astakos_auth_url = astakos_auth_url
@@ -332,6 +350,7 @@ class ModularBackend(object):
                 pool_size=astakosclient_poolsize)
 
         self.serials = []
+        self._reset_pending_commissions()
 
         self._move_object = partial(self._copy_object, is_move=True)
 
@@ -350,11 +369,21 @@ class ModularBackend(object):
         self.lock_container_path = lock_container_path
         self.wrapper.execute()
         self.serials = []
+        self._reset_pending_commissions()
         self._reset_allowed_paths()
         self.in_transaction = True
 
     def post_exec(self, success_status=True):
         if success_status:
+            try:
+                self._issue_commissions()
+            except Exception:
+                # The transaction cannot be committed without its
+                # commissions: reject the ones already issued and roll back.
+                exc_info = sys.exc_info()
+                self.post_exec(False)
+                raise exc_info[0], exc_info[1], exc_info[2]
+
             # register serials
             if self.serials:
                 self.commission_serials.insert_many(
@@ -381,6 +410,7 @@ class ModularBackend(object):
                     reject_serials=self.serials)
                 self.commission_serials.delete_many(
                     r['rejected'])
+            self._reset_pending_commissions()
             self.wrapper.rollback()
         self.in_transaction = False
 
@@ -900,17 +930,18 @@ class ModularBackend(object):
                     user, account, -size, project, name=path)
         else:
             # remove only contents
-            src_names = self._list_objects_no_limit(
+            batches = self._iter_objects(
                 user, account, container, prefix='', delimiter=None,
                 virtual=False, domain=None, keys=[], shared=False, until=None,
                 size_range=None, all_props=True, public=False,
                 listing_limit=listing_limit)
             freed_space = 0
-            for t in src_names:
-                del_size = self._delete_object(user, account, container, t[0],
-                                               delimiter=None,
-                                               report_size_change=False)
-                freed_space += del_size
+            for src_names in batches:
+                for t in src_names:
+                    del_size = self._delete_object(
+                        user, account, container, t[0], delimiter=None,
+                        report_size_change=False)
+                    freed_space += del_size
 
             self._report_size_change(
                 user, account, -freed_space, project, name='/'.join((account,
@@ -960,8 +991,8 @@ class ModularBackend(object):
                 node, path, prefix, delimiter, marker, limit, virtual, domain,
                 keys, until, size_range, allowed, all_props)
 
-        # apply limits
-        start, limit = self._list_limits(objects, marker, limit)
+        # apply limits; the marker has already been applied by the queries
+        start, limit = self._list_limits(objects, None, limit)
         return objects[start:start + limit]
 
     def _list_public_object_properties(self, user, account, container, prefix,
@@ -977,22 +1008,28 @@ class ModularBackend(object):
                        nodes, all_props=all_props, order_by_path=True))]
         return objects
 
-    def _list_objects_no_limit(self, user, account, container, prefix,
-                               delimiter, virtual, domain, keys, shared, until,
-                               size_range, all_props, public,
-                               listing_limit=10000):
-        objects = []
+    def _iter_objects(self, user, account, container, prefix, delimiter,
+                      virtual, domain, keys, shared, until, size_range,
+                      all_props, public, listing_limit=10000):
+        """Yield the objects of the listing in batches of listing_limit.
+
+        Each batch is fetched starting right after the path of the last
+        object of the previous one, so only a single batch is kept in
+        memory. Objects removed from the listing while iterating are safe,
+        as they always sort before the next batch.
+        """
+        _, limit = self._list_limits(None, None, listing_limit)
+        marker = None
         while True:
-            marker = objects[-1][0] if objects else None
-            limit = listing_limit
             l = self._list_objects(
                 user, account, container, prefix, delimiter, marker, limit,
                 virtual, domain, keys, shared, until, size_range, all_props,
                 public)
-            objects.extend(l)
-            if not l or len(l) < limit:
+            if l:
+                yield l
+            if len(l) < limit:
                 break
-        return objects
+            marker = l[-1][0]
 
     def _list_object_permissions(self, user, account, container, prefix,
                                  shared, public):
@@ -1685,7 +1722,8 @@ class ModularBackend(object):
             cross_project = src_project != dest_project
 
         # do not perform bulk report size change in the other cases in order to
-        # catch early failures due to quota restrictions
+        # catch early failures due to quota restrictions, every
+        # commission_batch_size changes
         bulk_report_size_change = is_move and not (cross_account or
                                                    cross_project)
 
@@ -1741,33 +1779,40 @@ class ModularBackend(object):
         if delimiter:
             prefix = (src_name + delimiter if not
                       src_name.endswith(delimiter) else src_name)
-            src_names = self._list_objects_no_limit(
+            dest_prefix = (dest_name + delimiter if not
+                           dest_name.endswith(delimiter) else dest_name)
+            batches = self._iter_objects(
                 user, src_account, src_container, prefix, delimiter=None,
                 virtual=False, domain=None, keys=[], shared=False, until=None,
                 size_range=None, all_props=True, public=False,
                 listing_limit=listing_limit)
-            src_names.sort(key=lambda x: x[2])  # order by nodes
-            paths = [elem[0] for elem in src_names]
-            nodes = [elem[2] for elem in src_names]
-            # TODO: Will do another fetch of the properties
-            # in duplicate version...
-            props = self._get_versions(nodes)
-
-            for prop, vsrc_name, node in zip(props, paths, nodes):
-                dest_prefix = (dest_name + delimiter if not
-                               dest_name.endswith(delimiter) else dest_name)
-                _version_id = prop[self.SERIAL]
-                _type = prop[self.TYPE]
-                _dest_name = vsrc_name.replace(prefix, dest_prefix, 1)
-                serials, size_delta, del_size = self._copy_object(
-                    user, src_account, src_container, vsrc_name,
-                    dest_account, dest_container, _dest_name, _type,
-                    src_version=_version_id, is_move=is_move,
-                    delimiter=None,
-                    report_size_change=(not bulk_report_size_change))
-                dest_versions.extend(serials)
-                occupied_space += size_delta
-                freed_space += del_size
+            if (src_account, src_container) == (dest_account,
+                                                dest_container) and \
+                    dest_prefix.startswith(prefix):
+                # The copies would show up in the listing while iterating.
+                batches = [list(chain(*batches))]
+
+            for src_names in batches:
+                src_names.sort(key=lambda x: x[2])  # order by nodes
+                paths = [elem[0] for elem in src_names]
+                nodes = [elem[2] for elem in src_names]
+                # TODO: Will do another fetch of the properties
+                # in duplicate version...
+                props = self._get_versions(nodes)
+
+                for prop, vsrc_name, node in zip(props, paths, nodes):
+                    _version_id = prop[self.SERIAL]
+                    _type = prop[self.TYPE]
+                    _dest_name = vsrc_name.replace(prefix, dest_prefix, 1)
+                    serials, size_delta, del_size = self._copy_object(
+                        user, src_account, src_container, vsrc_name,
+                        dest_account, dest_container, _dest_name, _type,
+                        src_version=_version_id, is_move=is_move,
+                        delimiter=None,
+                        report_size_change=(not bulk_report_size_change))
+                    dest_versions.extend(serials)
+                    occupied_space += size_delta
+                    freed_space += del_size
 
         # bulk repost size change
         if report_size_change and bulk_report_size_change:
@@ -1902,18 +1947,21 @@ class ModularBackend(object):
 
         if delimiter:
             prefix = name + delimiter if not name.endswith(delimiter) else name
-            src_names = self._list_objects_no_limit(
+            batches = self._iter_objects(
                 user, account, container, prefix, delimiter=None,
                 virtual=False, domain=None, keys=[], shared=False, until=None,
                 size_range=None, all_props=True, public=False,
                 listing_limit=listing_limit)
-            for t in src_names:
-                path = '/'.join((account, container, t[0]))
-                del_size = self._delete_object(user, account, container, t[0],
-                                               delimiter=None,
-                                               report_size_change=False)
-                freed_space += del_size
-                paths.append(path)
+            for src_names in batches:
+                for t in src_names:
+                    path = '/'.join((account, container, t[0]))
+                    del_size = self._delete_object(
+                        user, account, container, t[0], delimiter=None,
+                        report_size_change=False)
+                    freed_space += del_size
+                    paths.append(path)
+                self.permissions.access_clear_bulk(paths)
+                paths = []
         self.permissions.access_clear_bulk(paths)
 
         if report_size_change:
@@ -2381,6 +2429,10 @@ class ModularBackend(object):
     def _report_size_change(self, user, account, size, source, name=''):
         """Report quota modifications.
 
+        Changes are summed up per holder and source and issued as a single
+        commission per holder, either when commission_batch_size changes
+        have been collected or when the transaction is committed.
+
         Raises: AstakosClientException
         """
 
@@ -2390,11 +2442,41 @@ class ModularBackend(object):
         if not self.using_external_quotaholder:
             return
 
-        serial = self.astakosclient.issue_one_commission(
-            holder=account,
-            provisions={(source, 'pithos.diskspace'): size},
-            name=name)
-        self.serials.append(serial)
+        pending = self.pending_commissions.setdefault(
+            account, OrderedDict())
+        key = (source, DEFAULT_DISKSPACE_RESOURCE)
+        pending[key] = pending.get(key, 0) + size
+        if name:
+            self.pending_names[account].append(name)
+        self.pending_changes += 1
+        if self.pending_changes >= self.commission_batch_size:
+            self._issue_commissions()
+
+    def _reset_pending_commissions(self):
+        self.pending_commissions = OrderedDict()
+        self.pending_names = defaultdict(list)
+        self.pending_changes = 0
+
+    def _issue_commissions(self):
+        """Issue the size changes collected by _report_size_change.
+
+        Raises: AstakosClientException
+        """
+
+        pending = self.pending_commissions
+        names = self.pending_names
+        self._reset_pending_commissions()
+        for holder, provisions in pending.iteritems():
+            provisions = dict((k, v) for k, v in provisions.iteritems() if v)
+            if not provisions:
+                continue
+            holder_names = names.get(holder, [])
+            name = holder_names[0] if holder_names else ''
+            if len(holder_names) > 1:
+                name = '%s (and %d more)' % (name, len(holder_names) - 1)
+            serial = self.astakosclient.issue_one_commission(
+                holder=holder, provisions=provisions, name=name)
+            self.serials.append(serial)
 
     # Policy functions.
 
@@ -2575,6 +2657,7 @@ class ModularBackend(object):
     def _reset_allowed_paths(self):
         self.read_allowed_paths = defaultdict(set)
         self.write_allowed_paths = defaultdict(set)
+        self.permissions.access_cache_reset()
 
     @check_allowed_paths(action=0)
     def _can_read_account(self, user, account):
@@ -2652,13 +2735,23 @@ class ModularBackend(object):
 
     @debug_method
     @backend_method
-    def get_domain_objects(self, domain, user=None, check_permissions=True):
+    def get_domain_objects(self, domain, user=None, check_permissions=True,
+                           account=None, public=False, meta=None,
+                           size_range=None):
         """List objects having metadata in the specific domain
 
            If user is provided list only objects accessible to the user.
            Otherwise list all the objects for the specific domain
            ignoring permissions (check_permissions should be False)
 
+           The list is further restricted to objects of the given account,
+           to objects readable by everyone if public is set, to objects
+           having all the key/value pairs of meta in the specific domain,
+           and to objects whose size is in size_range (a (min, max) tuple
+           with an exclusive max). These filters are applied by the
+           database and the permissions of the matching objects are loaded
+           all at once.
+
            Raises:
                NotAllowedError: if check_permissions is True and user has not
                                 access to the object
@@ -2676,11 +2769,24 @@ class ModularBackend(object):
                                      'if user is provided '
                                      'permission check should be enforced.')
             allowed_paths = None
+        if public:
+            public_paths = self.permissions.access_list_paths(
+                '*', include_containers=False)
+            if allowed_paths is not None:
+                public_paths = set(public_paths)
+                public_paths.intersection_update(allowed_paths)
+            allowed_paths = list(public_paths)
+            if not allowed_paths:
+                return []
+        prefix = account + '/' if account else None
         obj_list = self.node.domain_object_list(
-            domain, allowed_paths, CLUSTER_NORMAL)
+            domain, allowed_paths, CLUSTER_NORMAL, prefix=prefix, meta=meta,
+            sizeq=size_range)
+        permissions = self.permissions.access_get_bulk(
+            [path for path, _, _ in obj_list])
         return [(path,
                  self._build_metadata(props, user_defined_meta),
-                 self.permissions.access_get(path)) for
+                 permissions[path]) for
                 path, props, user_defined_meta in obj_list]
 
     # util functions
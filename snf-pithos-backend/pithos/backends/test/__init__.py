@@ -13,7 +13,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from pithos.backends.test import common, quota, uuid_methods, snapshots
+from pithos.backends.test import (common, quota, uuid_methods, snapshots,
+                                  statistics, listing)
+from pithos.backends.test.blocker import TestArchipelagoBlocker  # noqa
+from pithos.backends.test.filestore import TestFileStore  # noqa
+from pithos.backends.test.merkle import TestMerkleRoot  # noqa
+from pithos.backends.test.permissions import TestPermissionsCache  # noqa
 
 from sqlalchemy import create_engine
 
@@ -22,7 +27,9 @@ import time
 
 
 class TestSQLAlchemyBackend(common.CommonMixin, uuid_methods.TestUUIDMixin,
-                            quota.TestQuotaMixin, snapshots.TestSnapshotsMixin):
+                            quota.TestQuotaMixin, snapshots.TestSnapshotsMixin,
+                            statistics.TestStatisticsMixin,
+                            listing.TestListingMixin):
     db_module = 'pithos.backends.lib.sqlalchemy'
     db_connection_str = \
         '%(scheme)s://%(user)s:%(pwd)s@%(host)s:%(port)s/%(name)s'
@@ -60,7 +67,9 @@ class TestSQLAlchemyBackend(common.CommonMixin, uuid_methods.TestUUIDMixin,
 
 
 class TestSQLiteBackend(common.CommonMixin, uuid_methods.TestUUIDMixin,
-                        quota.TestQuotaMixin, snapshots.TestSnapshotsMixin):
+                        quota.TestQuotaMixin, snapshots.TestSnapshotsMixin,
+                        statistics.TestStatisticsMixin,
+                        listing.TestListingMixin):
     db_module = 'pithos.backends.lib.sqlite'
     db_connection = location = '/tmp/test_pithos_backend.db'
     mapfile_prefix = 'snf_test_pithos_backend_sqlite_%s_' % \
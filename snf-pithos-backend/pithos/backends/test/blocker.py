@@ -0,0 +1,188 @@
+# Copyright (C) 2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from binascii import hexlify
+
+from mock import patch
+
+from pithos.backends.lib.hashfiler import archipelagoblocker
+from pithos.backends.lib.hashfiler.archipelagoblocker import \
+    ArchipelagoBlocker
+from pithos.workers import glue
+
+import os
+import tempfile
+import unittest
+
+
+class FakeIoctx(object):
+    """Keep the blocks of a fake blocker and log the requests on them."""
+
+    def __init__(self):
+        self.blocks = {}
+        self.fail = set()
+        self.log = []
+        self.inflight = 0
+        self.max_inflight = 0
+
+
+class FakeIoctxPool(object):
+    def __init__(self):
+        self.ioctx = FakeIoctx()
+        self.out = 0
+
+    def pool_get(self):
+        self.out += 1
+        return self.ioctx
+
+    def pool_put(self, ioctx):
+        assert ioctx is self.ioctx
+        self.out -= 1
+
+
+class FakeRequest(object):
+    def __init__(self, ioctx, op, name, data=None):
+        self.ioctx = ioctx
+        self.op = op
+        self.name = name
+        self.data = data
+        self.result = None
+
+    @classmethod
+    def get_info_request(cls, ioctx, port, name):
+        return cls(ioctx, 'info', name)
+
+    @classmethod
+    def get_write_request(cls, ioctx, port, name, data, offset, datalen):
+        assert offset == 0 and datalen == len(data)
+        return cls(ioctx, 'write', name, data)
+
+    def submit(self):
+        ioctx = self.ioctx
+        ioctx.log.append(('submit', self.op, self.name))
+        ioctx.inflight += 1
+        ioctx.max_inflight = max(ioctx.max_inflight, ioctx.inflight)
+
+    def wait(self):
+        ioctx = self.ioctx
+        ioctx.log.append(('wait', self.op, self.name))
+        if self.op == 'info':
+            self.result = self.name in ioctx.blocks
+        elif self.name in ioctx.fail:
+            self.result = False
+        else:
+            ioctx.blocks[self.name] = self.data
+            self.result = True
+
+    def success(self):
+        return self.result
+
+    def put(self):
+        self.ioctx.inflight -= 1
+
+
+class TestArchipelagoBlocker(unittest.TestCase):
+    block_size = 4
+    hash_algorithm = 'sha256'
+    batch_size = 3
+
+    def setUp(self):
+        fd, self.cfile = tempfile.mkstemp()
+        os.write(fd, '[mapperd]\nblockerb_port = 1000\n')
+        os.close(fd)
+        self.pool = FakeIoctxPool()
+        self.ioctx = self.pool.ioctx
+        patches = [patch.object(glue.WorkerGlue, 'ioctx_pool', self.pool),
+                   patch.object(archipelagoblocker, 'Request', FakeRequest)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.blocker = ArchipelagoBlocker(blocksize=self.block_size,
+                                          hashtype=self.hash_algorithm,
+                                          archipelago_cfile=self.cfile,
+                                          batch_size=self.batch_size)
+
+    def tearDown(self):
+        os.remove(self.cfile)
+
+    def assertBatches(self, op, names, sizes):
+        """Assert that the requests for names were made in batches of the
+           given sizes, all submitted before waiting for any of them.
+        """
+        log = [entry for entry in self.ioctx.log if entry[1] == op]
+        expected = []
+        for size in sizes:
+            batch, names = names[:size], names[size:]
+            expected += [('submit', op, name) for name in batch]
+            expected += [('wait', op, name) for name in batch]
+        self.assertEqual(names, [])
+        self.assertEqual(log, expected)
+        self.assertTrue(self.ioctx.max_inflight <= self.batch_size)
+        self.assertEqual(self.ioctx.inflight, 0)
+        self.assertEqual(self.pool.out, 0)
+
+    def _hashes(self, count):
+        return [self.blocker.block_hash('%04d' % i) for i in range(count)]
+
+    def test_batch_size(self):
+        blocker = ArchipelagoBlocker(blocksize=self.block_size,
+                                     hashtype=self.hash_algorithm,
+                                     archipelago_cfile=self.cfile)
+        self.assertEqual(blocker.batch_size,
+                         archipelagoblocker.DEFAULT_BATCH_SIZE)
+        self.assertEqual(self.blocker.batch_size, self.batch_size)
+
+    def test_check_batches(self):
+        for count, sizes in [(0, []), (1, [1]), (3, [3]), (4, [3, 1]),
+                             (6, [3, 3]), (7, [3, 3, 1])]:
+            self.ioctx.log = []
+            hashes = self._hashes(count)
+            found = self.blocker._check_rear_blocks(hashes)
+            self.assertEqual(found, [False] * count)
+            self.assertBatches('info', [hexlify(h) for h in hashes], sizes)
+
+    def test_block_ping(self):
+        hashes = self._hashes(7)
+        for h in hashes[1::2]:
+            self.ioctx.blocks[hexlify(h)] = ''
+        missing = self.blocker.block_ping(hashes + hashes[:2])
+        self.assertEqual(missing, hashes[::2])
+        self.assertBatches('info', [hexlify(h) for h in hashes], [3, 3, 1])
+
+    def test_block_stor(self):
+        blocks = ['%04d' % i for i in range(8)]
+        existing = self.blocker.block_hash(blocks[2])
+        self.ioctx.blocks[hexlify(existing)] = blocks[2]
+
+        hashes, missing = self.blocker.block_stor(blocks + blocks[:1])
+        self.assertEqual(hashes[:-1], [self.blocker.block_hash(b)
+                                       for b in blocks])
+        self.assertEqual(hashes[-1], hashes[0])
+        self.assertEqual(missing, [0, 1, 3, 4, 5, 6, 7, 8])
+        self.assertBatches('info', [hexlify(h) for h in hashes], [3, 3, 3])
+        # Missing blocks are written once, the last batch is partial
+        written = [hexlify(hashes[i]) for i in missing[:-1]]
+        self.assertBatches('write', written, [3, 3, 1])
+        for i, block in enumerate(blocks):
+            self.assertEqual(self.ioctx.blocks[hexlify(hashes[i])], block)
+
+    def test_block_stor_failure(self):
+        blocks = ['%04d' % i for i in range(5)]
+        hashes = [hexlify(self.blocker.block_hash(b)) for b in blocks]
+        self.ioctx.fail.add(hashes[1])
+        self.assertRaises(IOError, self.blocker.block_stor, blocks)
+        # The failed batch is waited for and released, the next one is not
+        # submitted
+        self.assertBatches('write', hashes[:3], [3])
@@ -0,0 +1,90 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from binascii import hexlify
+
+from mock import patch
+
+from pithos.backends.lib.hashfiler import Store
+from pithos.backends.lib.hashfiler import context_file
+from pithos.backends.test.util import get_random_data
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestFileStore(unittest.TestCase):
+    block_size = 1024
+    hash_algorithm = 'sha256'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = Store(block_size=self.block_size,
+                           hash_algorithm=self.hash_algorithm,
+                           archipelago_cfile=None,
+                           path=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_block_put_get(self):
+        data = get_random_data(self.block_size / 2)
+        h = self.store.block_put(data)
+        padding = '\x00' * (self.block_size - len(data))
+        self.assertEqual(self.store.block_get(h), data + padding)
+        self.assertEqual(self.store.block_get_archipelago(hexlify(h)),
+                         data + padding)
+        hexh = hexlify(h)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.path, 'blocks', hexh[:2], hexh[2:4], hexh)))
+
+        # Storing the same block twice is a no-op
+        self.assertEqual(self.store.block_put(data), h)
+
+    def test_block_get_missing(self):
+        h = '\x01' * 32
+        self.assertEqual(self.store.block_get(h), None)
+        self.assertEqual(self.store.block_get_archipelago(hexlify(h)), None)
+
+    def test_block_search(self):
+        h = self.store.block_put(get_random_data(self.block_size))
+        missing = '\x01' * 32
+        self.assertEqual(self.store.block_search([h, missing, missing]),
+                         [missing])
+
+    def test_block_update(self):
+        data = get_random_data(self.block_size)
+        h = self.store.block_put(data)
+        nh = self.store.block_update(h, 10, 'abc')
+        self.assertEqual(self.store.block_get(nh),
+                         data[:10] + 'abc' + data[13:])
+
+    def test_map_put_get(self):
+        hashes = [hexlify(self.store.block_put(get_random_data(10)))
+                  for _ in range(3)]
+        self.store.map_put('snf_file_1', hashes, 3 * self.block_size,
+                           self.block_size)
+        self.assertEqual(self.store.map_get('snf_file_1',
+                                            3 * self.block_size), hashes)
+        self.assertRaises(Exception, self.store.map_get, 'snf_file_2', 0)
+
+    def test_file_write_failure(self):
+        path = os.path.join(self.path, 'a', 'file')
+        with patch.object(context_file.os, 'write',
+                          side_effect=IOError('disk full')):
+            self.assertRaises(IOError, context_file.file_write, path, 'data')
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
@@ -0,0 +1,116 @@
+# Copyright (C) 2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch
+
+from pithos.backends.random_word import get_random_word
+
+PATHS = ['a', 'b/1', 'b/2', 'b/3', 'b/4/x', 'c', 'd/1', 'e', 'f/1', 'f/2',
+         'g', 'h/1/2', 'h/2', 'i']
+DIR_PATHS = ['dir', 'dir/1', 'dir/2', 'dir/3', 'dir/4/x', 'dir/5']
+
+
+class TestListingMixin(object):
+    def _list_names(self, container, **kwargs):
+        return [name for name, _ in self.b.list_objects(
+            self.account, self.account, container, **kwargs)]
+
+    def _put_objects(self, paths):
+        account = self.account
+        container = get_random_word(length=8)
+        self.b.put_container(account, account, container)
+        for path in paths:
+            self.upload_object(account, account, container, path)
+        return container
+
+    def test_list_delimiter_pages(self):
+        account = self.account
+        container = get_random_word(length=8)
+        self.b.put_container(account, account, container)
+        for path in PATHS:
+            self.upload_object(account, account, container, path)
+
+        expected = ['a', 'b/', 'c', 'd/', 'e', 'f/', 'g', 'h/', 'i']
+        self.assertEqual(self._list_names(container, delimiter='/'),
+                         expected)
+        self.assertEqual(
+            self._list_names(container, prefix='h/', delimiter='/'),
+            ['h/1/', 'h/2'])
+
+        # Pages end both inside and at the end of common prefixes. Every
+        # prefix must be listed once and no path after it may be skipped.
+        for page_size in (2, 3):
+            with patch('pithos.backends.lib.sqlalchemy.node.'
+                       'DELIMITER_LISTING_PAGE_SIZE', page_size):
+                self.assertEqual(
+                    self._list_names(container, delimiter='/'), expected)
+                self.assertEqual(
+                    self._list_names(container, delimiter='/', limit=4),
+                    expected[:4])
+                self.assertEqual(
+                    self._list_names(container, delimiter='/', marker='c'),
+                    expected[3:])
+                self.assertEqual(
+                    self._list_names(container, prefix='h/', delimiter='/'),
+                    ['h/1/', 'h/2'])
+
+    # Bulk operations list the objects in batches of listing_limit
+
+    def test_delete_container_batches(self):
+        container = self._put_objects(PATHS)
+        self.b.delete_container(self.account, self.account, container,
+                                delimiter='/', listing_limit=2)
+        self.assertEqual(self._list_names(container), [])
+
+    def test_delete_delimiter_batches(self):
+        container = self._put_objects(DIR_PATHS + ['dirx', 'e'])
+        self.b.delete_object(self.account, self.account, container, 'dir',
+                             delimiter='/', listing_limit=2)
+        self.assertEqual(self._list_names(container), ['dirx', 'e'])
+
+    def test_copy_move_delimiter_batches(self):
+        account = self.account
+        container = self._put_objects(DIR_PATHS + ['dirx', 'e'])
+        dest = get_random_word(length=8)
+        self.b.put_container(account, account, dest)
+        self.b.copy_object(account, account, container, 'dir', account,
+                           dest, 'copy', 'application/octet-stream',
+                           'pithos', delimiter='/', listing_limit=2)
+        copies = [path.replace('dir', 'copy', 1) for path in DIR_PATHS]
+        self.assertEqual(self._list_names(dest), copies)
+        self.assertEqual(self._list_names(container),
+                         DIR_PATHS + ['dirx', 'e'])
+
+        self.b.move_object(account, account, container, 'dir', account,
+                           dest, 'dir', 'application/octet-stream',
+                           'pithos', delimiter='/', listing_limit=2)
+        self.assertEqual(self._list_names(dest), copies + DIR_PATHS)
+        self.assertEqual(self._list_names(container), ['dirx', 'e'])
+
+    def test_copy_under_source_batches(self):
+        account = self.account
+        container = self._put_objects(DIR_PATHS)
+        self.b.copy_object(account, account, container, 'dir', account,
+                           container, 'dir/sub', 'application/octet-stream',
+                           'pithos', delimiter='/', listing_limit=2)
+        # The destination folder is created before the source folder is
+        # listed, so it is copied once as well.
+        copies = ['dir/sub/' + path[4:] for path in DIR_PATHS[1:]]
+        self.assertEqual(self._list_names(container),
+                         sorted(DIR_PATHS + copies + ['dir/sub',
+                                                      'dir/sub/sub']))
+        for path in copies:
+            self.assertEqual(len(self.b.list_versions(account, account,
+                                                      container, path)), 1)
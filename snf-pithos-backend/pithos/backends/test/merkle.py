@@ -0,0 +1,57 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pithos.backends.merkle import merkle_root
+
+import hashlib
+import os
+import unittest
+
+
+def plain_merkle(hashes, blockhash):
+    """The straightforward Merkle root computation."""
+    def _hash(v):
+        return hashlib.new(blockhash, v).digest()
+
+    if len(hashes) == 0:
+        return _hash('')
+    if len(hashes) == 1:
+        return hashes[0]
+    h = list(hashes)
+    s = 2
+    while s < len(h):
+        s = s * 2
+    h += [('\x00' * len(h[0]))] * (s - len(h))
+    while len(h) > 1:
+        h = [_hash(h[x] + h[x + 1]) for x in range(0, len(h), 2)]
+    return h[0]
+
+
+class TestMerkleRoot(unittest.TestCase):
+    blockhash = 'sha256'
+    hashlen = 32
+
+    def random_hashes(self, count):
+        return [os.urandom(self.hashlen) for _ in xrange(count)]
+
+    def test_root(self):
+        for count in range(0, 70):
+            hashes = self.random_hashes(count)
+            self.assertEqual(merkle_root(hashes, self.blockhash),
+                             plain_merkle(hashes, self.blockhash))
+
+    def test_invalid_hash_length(self):
+        hashes = self.random_hashes(3) + ['\x00' * (self.hashlen - 1)]
+        self.assertRaises(ValueError, merkle_root, hashes, self.blockhash)
@@ -0,0 +1,105 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pithos.backends.lib.sqlite import DBWrapper, Permissions, READ, WRITE
+
+import unittest
+
+
+class TestPermissionsCache(unittest.TestCase):
+    def setUp(self):
+        self.wrapper = DBWrapper(':memory:')
+        self.p = Permissions(wrapper=self.wrapper, props={})
+        self.queries = 0
+        execute = self.p.execute
+
+        def counting_execute(*args):
+            self.queries += 1
+            return execute(*args)
+        self.p.execute = counting_execute
+
+    def tearDown(self):
+        self.wrapper.close()
+
+    def test_access_check_cached(self):
+        self.p.access_set('user/c/dir/', {'read': ['other']})
+        self.p.access_cache_reset()
+        path = 'user/c/dir/a/b/obj'
+
+        self.queries = 0
+        self.assertEqual(self.p.access_inherit(path), ['user/c/dir/'])
+        self.assertTrue(self.p.access_check('user/c/dir/', READ, 'other'))
+        self.assertFalse(self.p.access_check('user/c/dir/', WRITE, 'other'))
+        self.assertFalse(self.p.access_check('user/c/dir/', READ, 'nobody'))
+        queries = self.queries
+
+        for i in range(10):
+            self.p.access_inherit(path)
+            self.p.access_check('user/c/dir/', READ, 'other')
+            self.p.access_check('user/c/dir/', READ, 'nobody')
+        self.assertEqual(self.queries, queries)
+
+    def test_access_set_invalidates(self):
+        self.p.access_set('user/c/obj', {'read': ['other']})
+        self.assertTrue(self.p.access_check('user/c/obj', READ, 'other'))
+        self.p.access_set('user/c/obj', {'write': ['other']})
+        self.assertFalse(self.p.access_check('user/c/obj', READ, 'other'))
+        self.assertTrue(self.p.access_check('user/c/obj', WRITE, 'other'))
+        self.p.access_clear('user/c/obj')
+        self.assertFalse(self.p.access_check('user/c/obj', WRITE, 'other'))
+        self.assertEqual(self.p.access_inherit('user/c/obj'), [])
+
+        self.p.access_grant('user/c/obj', READ, ['*'])
+        self.assertTrue(self.p.access_check('user/c/obj', READ, 'other'))
+        self.p.access_clear_bulk(['user/c/obj'])
+        self.assertFalse(self.p.access_check('user/c/obj', READ, 'other'))
+
+    def test_group_change_invalidates(self):
+        self.p.access_set('user/c/obj', {'read': ['user:friends']})
+        self.assertFalse(self.p.access_check('user/c/obj', READ, 'other'))
+        self.p.group_addmany('user', {'friends': ['other']})
+        self.assertTrue(self.p.access_check('user/c/obj', READ, 'other'))
+        self.p.group_destroy('user')
+        self.assertFalse(self.p.access_check('user/c/obj', READ, 'other'))
+
+    def test_access_list_paths(self):
+        self.p.access_set('user/c/a', {'read': ['other', 'user:friends'],
+                                       'write': ['other']})
+        self.p.access_set('user/c/b', {'read': ['*']})
+        self.p.access_grant('user/d/c', READ, ['friend'])
+        self.p.group_addmany('user', {'friends': ['friend']})
+        self.assertEqual(sorted(self.p.access_list_paths('other')),
+                         ['user/c/a', 'user/c/b'])
+        self.assertEqual(sorted(self.p.access_list_paths('friend')),
+                         ['user/c/a', 'user/c/b', 'user/d/c'])
+        self.assertEqual(self.p.access_list_paths('nobody', 'user/c'),
+                         ['user/c/b'])
+
+        self.p.access_set('user/c/a', {'read': ['friend']})
+        self.p.access_clear('user/c/b')
+        self.assertEqual(self.p.access_list_paths('other'), [])
+        self.assertEqual(sorted(self.p.access_list_paths('friend')),
+                         ['user/c/a', 'user/d/c'])
+
+    def test_members_backfill(self):
+        self.p.access_set('user/c/a', {'read': ['other'], 'write': ['other']})
+        self.p.access_set('user/c/b', {'read': ['*']})
+        # Databases created before the members table only have the values
+        self.p.execute("drop table xfeaturemembers")
+        p = Permissions(wrapper=self.wrapper, props={})
+        self.assertEqual(sorted(p.access_list_paths('other')),
+                         ['user/c/a', 'user/c/b'])
+        p.access_set('user/c/a', {'read': ['friend']})
+        self.assertEqual(p.access_list_paths('other'), ['user/c/b'])
@@ -18,6 +18,9 @@ from functools import wraps, partial
 
 import uuid as uuidlib
 
+from astakosclient.errors import QuotaLimit
+
+from pithos.backends.exceptions import ItemNotExists
 from pithos.backends.random_word import get_random_word
 
 
@@ -46,6 +49,19 @@ class TestQuotaMixin(object):
 
     Finally, it asserts that these calls have been actually made.
     """
+    def _coalesced_commission(self, holder, provisions, names):
+        """Return the commission call for the size changes of a transaction.
+
+        The changes of a transaction are issued as a single commission per
+        holder, named after the first object changed.
+        """
+        name = names[0]
+        if len(names) > 1:
+            name = '%s (and %d more)' % (name, len(names) - 1)
+        return call.issue_one_commission(holder=holder,
+                                         provisions=provisions,
+                                         name=name)
+
     def _upload_object(self, user, account, container, obj, data=None,
                        length=None, type_='application/octet-stream',
                        permissions=None):
@@ -225,17 +241,14 @@ class TestQuotaMixin(object):
                            domain='pithos',
                            delimiter='/')
 
+        names = ['/'.join([account, container,
+                          o.replace(folder, other_folder, 1)])
+                 for o in (obj1, obj2)]
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([account, container,
-                               obj1.replace(folder, other_folder, 1)])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, container,
-                               obj2.replace(folder, other_folder, 1)]))]
+            self._coalesced_commission(
+                account,
+                {(account, 'pithos.diskspace'): len(data1) + len(data2)},
+                names)]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_other_container(self):
@@ -261,15 +274,13 @@ class TestQuotaMixin(object):
                            domain='pithos',
                            delimiter='/')
 
+        names = ['/'.join([account, container2, o])
+                 for o in (obj1, obj2)]
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([account, container2, obj1])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, container2, obj2]))]
+            self._coalesced_commission(
+                account,
+                {(account, 'pithos.diskspace'): len(data1) + len(data2)},
+                names)]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_other_account(self):
@@ -296,15 +307,14 @@ class TestQuotaMixin(object):
                            domain='pithos',
                            delimiter='/')
 
+        names = ['/'.join([other_account, container, o])
+                 for o in (obj1, obj2)]
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([other_account, container, obj1])),
-            call.issue_one_commissions(
-                holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([other_account, container, obj2]))]
+            self._coalesced_commission(
+                other_account,
+                {(other_account, 'pithos.diskspace'):
+                 len(data1) + len(data2)},
+                names)]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_existing_path(self):
@@ -337,17 +347,15 @@ class TestQuotaMixin(object):
                            domain='pithos',
                            delimiter='/')
 
+        names = ['/'.join([account, container,
+                          o.replace(folder, other_folder, 1)])
+                 for o in (obj1, obj2)]
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'):
-                            len(data1) - len(data3)},
-                name='/'.join([account, container, obj3])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, container,
-                               obj2.replace(folder, other_folder, 1)]))]
+            self._coalesced_commission(
+                account,
+                {(account, 'pithos.diskspace'):
+                 len(data1) - len(data3) + len(data2)},
+                names)]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_other_project(self):
@@ -383,17 +391,15 @@ class TestQuotaMixin(object):
                            'application/directory',
                            domain='pithos',
                            delimiter='/')
+        names = ['/'.join([account, other_container,
+                          o.replace(folder, other_folder, 1)])
+                 for o in (obj1, obj2)]
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(project, 'pithos.diskspace'):
-                            len(data1) - len(data3)},
-                name='/'.join([account, other_container, obj3])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(project, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, other_container,
-                               obj2.replace(folder, other_folder, 1)]))]
+            self._coalesced_commission(
+                account,
+                {(project, 'pithos.diskspace'):
+                 len(data1) - len(data3) + len(data2)},
+                names)]
 
     @assert_issue_commission_calls
     def test_move_obj(self):
@@ -442,14 +448,12 @@ class TestQuotaMixin(object):
                            'application/octet-stream',
                            domain='pithos')
         self.expected_issue_commission_calls += [
-            call.issue_one_commission(
-                holder=account,
-                provisions={(project, 'pithos.diskspace'): len(data)},
-                name='/'.join([account, other_container, obj])),
-            call.issue_one_commission(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data)},
-                name='/'.join([account, container, obj]))]
+            self._coalesced_commission(
+                account,
+                {(project, 'pithos.diskspace'): len(data),
+                 (account, 'pithos.diskspace'): -len(data)},
+                ['/'.join([account, other_container, obj]),
+                 '/'.join([account, container, obj])])]
 
     @assert_issue_commission_calls
     def test_move_object_to_other_account(self):
@@ -652,25 +656,17 @@ class TestQuotaMixin(object):
                            'application/directory',
                            domain='pithos',
                            delimiter='/')
+        names = ['/'.join([account, other_container,
+                          o.replace(folder, other_folder, 1)])
+                 for o in (obj1, obj2)]
+        names += ['/'.join([account, container, o]) for o in (obj1, obj2)]
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(project, 'pithos.diskspace'):
-                            len(data1) - len(data3)},
-                name='/'.join([account, other_container, obj3])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data1)},
-                name='/'.join([account, container, obj1])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(project, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, other_container,
-                               obj2.replace(folder, other_folder, 1)])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data2)},
-                name='/'.join([account, container, obj2]))]
+            self._coalesced_commission(
+                account,
+                {(project, 'pithos.diskspace'):
+                 len(data1) - len(data3) + len(data2),
+                 (account, 'pithos.diskspace'): -len(data1) - len(data2)},
+                names)]
 
     @assert_issue_commission_calls
     def test_move_dir_to_other_account(self):
@@ -699,22 +695,16 @@ class TestQuotaMixin(object):
                            delimiter='/')
 
         self.expected_issue_commission_calls += [
-            call.issue_one_commissions(
-                holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([other_account, container, obj1])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data1)},
-                name='/'.join([account, container, obj1])),
-            call.issue_one_commissions(
-                holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([other_account, container, obj2])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data2)},
-                name='/'.join([account, container, obj2]))]
+            self._coalesced_commission(
+                other_account,
+                {(other_account, 'pithos.diskspace'):
+                 len(data1) + len(data2)},
+                ['/'.join([other_account, container, o])
+                 for o in (obj1, obj2)]),
+            self._coalesced_commission(
+                account,
+                {(account, 'pithos.diskspace'): -len(data1) - len(data2)},
+                ['/'.join([account, container, o]) for o in (obj1, obj2)])]
 
     @assert_issue_commission_calls
     def test_delete_container_contents(self):
@@ -785,3 +775,80 @@ class TestQuotaMixin(object):
                 holder=account,
                 provisions={(project, 'pithos.diskspace'): -len(data)},
                 name='/'.join([account, container, folder, '']))]
+
+    @assert_issue_commission_calls
+    def test_coalesced_commission(self):
+        account = self.account
+        container = get_random_name()
+        project = unicode(uuidlib.uuid4())
+        self.b.put_container(account, account, container,
+                             policy={'project': project})
+
+        objects = [get_random_name() for i in range(3)]
+        self.b.pre_exec()
+        data = ''.join(self.upload_object(account, account, container, obj)
+                       for obj in objects)
+        # Nothing is issued before the transaction is committed
+        self.assertEqual(
+            self.b.astakosclient.issue_one_commission.mock_calls, [])
+        self.b.post_exec(True)
+
+        self.expected_issue_commission_calls += [
+            self._coalesced_commission(
+                account,
+                {(project, 'pithos.diskspace'): len(data)},
+                ['/'.join([account, container, obj]) for obj in objects])]
+        self.b.astakosclient.resolve_commissions.assert_called_once_with(
+            accept_serials=[42], reject_serials=[])
+
+    @assert_issue_commission_calls
+    def test_commission_batch_size(self):
+        account = self.account
+        container = get_random_name()
+        project = unicode(uuidlib.uuid4())
+        self.b.put_container(account, account, container,
+                             policy={'project': project})
+
+        self.b.commission_batch_size = 2
+        objects = [get_random_name() for i in range(5)]
+        self.b.pre_exec()
+        data = [self.upload_object(account, account, container, obj)
+                for obj in objects]
+        self.b.post_exec(True)
+
+        for i in range(0, len(objects), 2):
+            self.expected_issue_commission_calls += [
+                self._coalesced_commission(
+                    account,
+                    {(project, 'pithos.diskspace'):
+                     sum(len(d) for d in data[i:i + 2])},
+                    ['/'.join([account, container, obj])
+                     for obj in objects[i:i + 2]])]
+        self.b.astakosclient.resolve_commissions.assert_called_once_with(
+            accept_serials=[42] * 3, reject_serials=[])
+
+    def test_commission_failure(self):
+        account = self.account
+        container = get_random_name()
+        self.b.put_container(account, account, container)
+
+        astakosclient = self.b.astakosclient
+        astakosclient.issue_one_commission.side_effect = [
+            42, QuotaLimit('Quota exceeded')]
+        astakosclient.resolve_commissions.return_value = {
+            'accepted': [], 'rejected': [42], 'failed': []}
+        self.b.commission_batch_size = 2
+        objects = [get_random_name() for i in range(3)]
+        self.b.pre_exec()
+        for obj in objects:
+            self.upload_object(account, account, container, obj)
+        self.assertRaises(QuotaLimit, self.b.post_exec, True)
+
+        self.assertEqual(len(astakosclient.issue_one_commission.mock_calls),
+                         2)
+        astakosclient.resolve_commissions.assert_called_once_with(
+            accept_serials=[], reject_serials=[42])
+        self.assertFalse(self.b.in_transaction)
+        for obj in objects:
+            self.assertRaises(ItemNotExists, self.b.get_object_meta,
+                              account, account, container, obj)
@@ -194,3 +194,15 @@ class TestSnapshotsMixin(object):
                           domain='test',
                           user='somebody_else',
                           check_permissions=False)
+
+        def get(**kwargs):
+            return self.b.get_domain_objects(domain='test',
+                                             user=self.account, **kwargs)
+
+        self.assertEqual(len(get(meta={'foo': 'bar'})), 1)
+        self.assertEqual(get(meta={'foo': 'baz'}), [])
+        self.assertEqual(len(get(size_range=(100, 101))), 1)
+        self.assertEqual(get(size_range=(101, None)), [])
+        self.assertEqual(len(get(account=self.account)), 1)
+        self.assertEqual(get(account='somebody_else'), [])
+        self.assertEqual(get(public=True), [])
@@ -0,0 +1,83 @@
+# Copyright (C) 2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pithos.backends.random_word import get_random_word
+
+CLUSTER = 3
+
+
+class TestStatisticsMixin(object):
+    """Challenge the deferred statistics.
+
+    The sqlite module always updates the statistics in place, so there
+    the same results are expected without any deltas to compact.
+    """
+    def _statistics_node(self):
+        container = get_random_word(length=8)
+        self.b.put_container(self.account, self.account, container)
+        return self.b._lookup_container(self.account, container)[1]
+
+    def _statistics_get(self, node):
+        r = self.b.node.statistics_get(node, CLUSTER)
+        return tuple(r) if r is not None else None
+
+    def _statistics_compact(self, expected):
+        if not hasattr(self.b.node, 'statistics_deltas'):
+            expected = 0
+        self.assertEqual(self.b.node.statistics_compact(), expected)
+        self.assertEqual(self.b.node.statistics_compact(), 0)
+
+    def test_statistics_deltas(self):
+        n = self.b.node
+        node = self._statistics_node()
+        n.statistics_update(node, 3, 300, 1, CLUSTER)
+        self.assertEqual(self._statistics_get(node), (3, 300, 1))
+
+        n.deferred_statistics = True
+        n.statistics_update(node, 2, 200, 2, CLUSTER)
+        n.statistics_update(node, -1, -100, 3, CLUSTER)
+        self.assertEqual(self._statistics_get(node), (4, 400, 3))
+
+        # Deltas of a node without statistics
+        other = self._statistics_node()
+        self.assertEqual(self._statistics_get(other), None)
+        n.statistics_update(other, 1, 10, 4, CLUSTER)
+        self.assertEqual(self._statistics_get(other), (1, 10, 4))
+
+        self._statistics_compact(3)
+        self.assertEqual(self._statistics_get(node), (4, 400, 3))
+        self.assertEqual(self._statistics_get(other), (1, 10, 4))
+
+    def test_statistics_population_clamp(self):
+        n = self.b.node
+        changes = [(-2, -20, 2), (1, 10, 3), (-1, -10, 4), (3, 30, 5)]
+
+        # Each update clamps the population at zero
+        node = self._statistics_node()
+        n.statistics_update(node, 1, 10, 1, CLUSTER)
+        for population, size, mtime in changes:
+            n.statistics_update(node, population, size, mtime, CLUSTER)
+        self.assertEqual(self._statistics_get(node), (3, 20, 5))
+
+        # and so does applying the deltas, not just their sum
+        n.deferred_statistics = True
+        deferred = self._statistics_node()
+        n.statistics_update(deferred, 1, 10, 1, CLUSTER)
+        for population, size, mtime in changes:
+            n.statistics_update(deferred, population, size, mtime, CLUSTER)
+        self.assertEqual(self._statistics_get(deferred), (3, 20, 5))
+
+        self._statistics_compact(5)
+        self.assertEqual(self._statistics_get(deferred), (3, 20, 5))